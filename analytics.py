@@ -0,0 +1,247 @@
+##########################################################################
+# Author: David Beltran
+# File: analytics.py
+# Date: August 19, 2022
+# This module holds the trend analytics of the application. Moving
+# averages, rolling volatility, drawdowns, daily and monthly returns and
+# correlations are computed with vectorized NumPy over the per-symbol
+# close series of stocks_trends. Results are stored in aggregate tables
+# and refreshed incrementally, so only rows newer than the last refresh
+# of a symbol are computed again.
+##########################################################################
+
+# Standard libary imports
+import numpy as np
+
+# Global variables with the moving average and volatility windows, in
+# trading days
+SHORT_WINDOW = 20
+LONG_WINDOW = 50
+VOLATILITY_WINDOW = 20
+
+# Trading days per year, used to annualize volatility
+PERIODS_PER_YEAR = 252
+
+# Number of most recent trading days used for correlations, and the
+# fewest shared returns needed before a correlation is stored
+CORRELATION_DAYS = 252
+MIN_OBSERVATIONS = 10
+
+# Prior rows read before the first new row of a symbol so every rolling
+# window can be filled
+LOOKBACK = max(SHORT_WINDOW, LONG_WINDOW, VOLATILITY_WINDOW + 1)
+
+# Returns the simple return of each close over the previous one. The
+# first return is NaN unless the close before the series is given.
+def daily_returns(closes, previous = None):
+    closes = np.asarray(closes, dtype = np.float64)
+    returns = np.full(len(closes), np.nan)
+    if len(closes) > 1:
+        returns[1:] = closes[1:] / closes[:-1] - 1
+    if len(closes) and previous:
+        returns[0] = closes[0] / previous - 1
+    return returns
+
+# Returns the rolling mean of values over window rows. Rows before the
+# window is full are NaN.
+def moving_average(values, window):
+    values = np.asarray(values, dtype = np.float64)
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        result[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return result
+
+# Returns the annualized rolling standard deviation of returns over
+# window rows. Windows holding a NaN return are NaN.
+def rolling_volatility(returns, window, periods = PERIODS_PER_YEAR):
+    returns = np.asarray(returns, dtype = np.float64)
+    result = np.full(len(returns), np.nan)
+    if len(returns) >= window > 1:
+        windows = np.lib.stride_tricks.sliding_window_view(returns, window)
+        result[window - 1:] = windows.std(axis = 1, ddof = 1)
+    return result * np.sqrt(periods)
+
+# Returns the drawdown of each close from the highest close so far and
+# the running peaks. A peak carried over from earlier rows can be given.
+def drawdowns(closes, peak = None):
+    closes = np.asarray(closes, dtype = np.float64)
+    peaks = np.maximum.accumulate(closes) if len(closes) else closes
+    if peak is not None:
+        peaks = np.maximum(peaks, peak)
+    return closes / peaks - 1, peaks
+
+# Returns the months, month end closes and monthly returns of a series
+# sorted by ISO date. The close of the month before the series can be
+# given for the return of the first month.
+def monthly_returns(dates, closes, previous = None):
+    months = np.array([value[:7] for value in dates])
+    closes = np.asarray(closes, dtype = np.float64)
+    if not len(months):
+        return months, closes, closes
+    ends = np.append(np.flatnonzero(months[1:] != months[:-1]),
+        len(months) - 1)
+    return months[ends], closes[ends], daily_returns(closes[ends], previous)
+
+# Returns the pairwise correlation matrix of the columns of matrix, a
+# dates by symbols array with NaN where a symbol has no return, and the
+# number of dates each pair shares
+def correlation_matrix(matrix):
+    present = ~np.isnan(matrix)
+    values = np.where(present, matrix, 0.0)
+    mask = present.astype(np.float64)
+    counts = mask.T @ mask
+    sums = values.T @ mask
+    squares = (values ** 2).T @ mask
+    products = values.T @ values
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        covariance = counts * products - sums * sums.T
+        variance = (counts * squares - sums ** 2) * (counts * squares
+            - sums ** 2).T
+        correlations = covariance / np.sqrt(variance)
+    return np.clip(correlations, -1.0, 1.0), counts.astype(np.int64)
+
+# Private helper that turns NaN into None for SQLite
+def _nullable(values):
+    return [None if value != value else value for value in values.tolist()]
+
+class TrendAnalytics:
+
+    # Class constructor. db is a Database already migrated to the
+    # latest schema version.
+    def __init__(self, db):
+        self.db = db
+
+    # Brings the aggregate tables up to date with stocks_trends. Only
+    # symbols with trend rows newer than their last refresh are computed,
+    # from their new rows onwards. full rebuilds every table. Returns
+    # the number of symbols refreshed.
+    def refresh(self, full = False):
+        if full:
+            with self.db.transaction() as c:
+                for table in ('trend_daily_stats', 'trend_monthly_returns',
+                        'trend_stats_marks', 'trend_correlations'):
+                    c.execute(f"DELETE FROM {table}")
+        stale = self.db.execute("""SELECT m.symbol, s.last_date,
+            s.peak_close FROM stocks_trends_marks m
+            LEFT JOIN trend_stats_marks s ON s.symbol = m.symbol
+            WHERE s.last_date IS NULL OR m.last_date > s.last_date
+            """).fetchall()
+        for symbol, last_date, peak in stale:
+            with self.db.transaction(immediate = True) as c:
+                self.__refresh_symbol(c, symbol, last_date, peak)
+        if stale:
+            self.refresh_correlations()
+        return len(stale)
+
+    # Private method that computes the daily and monthly aggregates of
+    # one symbol for the rows after last_date
+    def __refresh_symbol(self, c, symbol, last_date, peak):
+        last_date = last_date or ''
+        prior = c.execute("""SELECT price_date, close_price FROM (
+            SELECT price_date, close_price FROM stocks_trends
+            WHERE symbol = ? AND price_date <= ?
+            AND close_price IS NOT NULL
+            ORDER BY price_date DESC LIMIT ?) ORDER BY price_date
+            """, (symbol, last_date, LOOKBACK)).fetchall()
+        new = c.execute("""SELECT price_date, close_price FROM stocks_trends
+            WHERE symbol = ? AND price_date > ? AND close_price IS NOT NULL
+            ORDER BY price_date""", (symbol, last_date)).fetchall()
+        if not new:
+            return
+        dates = [row[0] for row in prior + new]
+        closes = np.array([row[1] for row in prior + new], dtype = np.float64)
+        returns = daily_returns(closes)
+        start = len(prior)
+        drawdown, peaks = drawdowns(closes[start:], peak)
+        columns = [returns, moving_average(closes, SHORT_WINDOW),
+            moving_average(closes, LONG_WINDOW),
+            rolling_volatility(returns, VOLATILITY_WINDOW)]
+        columns = [_nullable(column[start:]) for column in columns]
+        c.executemany("""INSERT OR REPLACE INTO trend_daily_stats
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            ((symbol,) + row for row in zip(dates[start:],
+                closes[start:].tolist(), *columns, _nullable(drawdown))))
+
+        # Months from the first new row are recomputed, as that month
+        # may already hold a partial result
+        first_month = new[0][0][:7]
+        previous = c.execute("""SELECT close_price FROM trend_monthly_returns
+            WHERE symbol = ? AND month < ? ORDER BY month DESC LIMIT 1
+            """, (symbol, first_month)).fetchone()
+        month_rows = c.execute("""SELECT price_date, close_price
+            FROM stocks_trends WHERE symbol = ? AND price_date >= ?
+            AND close_price IS NOT NULL ORDER BY price_date
+            """, (symbol, first_month)).fetchall()
+        months, month_closes, returns = monthly_returns(
+            [row[0] for row in month_rows], [row[1] for row in month_rows],
+            previous[0] if previous else None)
+        c.executemany("""INSERT OR REPLACE INTO trend_monthly_returns
+            VALUES (?, ?, ?, ?)""", ((symbol,) + row for row in zip(
+                months.tolist(), month_closes.tolist(), _nullable(returns))))
+        c.execute("""INSERT OR REPLACE INTO trend_stats_marks
+            VALUES (?, ?, ?)""", (symbol, dates[-1], float(peaks[-1])))
+
+    # Recomputes the correlation of daily returns between every pair of
+    # symbols over the last days trading days
+    def refresh_correlations(self, days = CORRELATION_DAYS):
+        cutoff = self.db.execute("""SELECT price_date FROM (
+            SELECT DISTINCT price_date FROM trend_daily_stats
+            ORDER BY price_date DESC LIMIT ?)
+            ORDER BY price_date LIMIT 1""", (days,)).fetchone()
+        rows = self.db.execute("""SELECT symbol, price_date, daily_return
+            FROM trend_daily_stats WHERE price_date >= ?
+            AND daily_return IS NOT NULL""",
+            (cutoff[0] if cutoff else '',)).fetchall()
+        pairs = []
+        if rows:
+            symbols, symbol_index = np.unique([row[0] for row in rows],
+                return_inverse = True)
+            dates, date_index = np.unique([row[1] for row in rows],
+                return_inverse = True)
+            matrix = np.full((len(dates), len(symbols)), np.nan)
+            matrix[date_index, symbol_index] = [row[2] for row in rows]
+            correlations, counts = correlation_matrix(matrix)
+            first, second = np.triu_indices(len(symbols), 1)
+            for i, j in zip(first.tolist(), second.tolist()):
+                value = correlations[i, j]
+                pairs.append((str(symbols[i]), str(symbols[j]),
+                    int(counts[i, j]), None if counts[i, j]
+                    < MIN_OBSERVATIONS or value != value else float(value)))
+        with self.db.transaction() as c:
+            c.execute("DELETE FROM trend_correlations")
+            c.executemany("INSERT INTO trend_correlations VALUES (?, ?, ?, ?)",
+                pairs)
+        return len(pairs)
+
+    # Returns the daily aggregates of a symbol between two ISO dates
+    def get_daily_stats(self, symbol, start = '', end = '9999'):
+        return self.db.execute("""SELECT * FROM trend_daily_stats
+            WHERE symbol = ? AND price_date BETWEEN ? AND ?
+            ORDER BY price_date""", (symbol, start, end)).fetchall()
+
+    # Returns the latest daily aggregates of every symbol
+    def get_latest_stats(self):
+        return self.db.execute("""SELECT d.* FROM trend_stats_marks m
+            JOIN trend_daily_stats d
+            ON d.symbol = m.symbol AND d.price_date = m.last_date
+            ORDER BY d.symbol""").fetchall()
+
+    # Returns the monthly returns of a symbol
+    def get_monthly_returns(self, symbol):
+        return self.db.execute("""SELECT month, close_price, monthly_return
+            FROM trend_monthly_returns WHERE symbol = ?
+            ORDER BY month""", (symbol,)).fetchall()
+
+    # Returns the correlations of one symbol, or of every pair, strongest
+    # first
+    def get_correlations(self, symbol = None):
+        if symbol is None:
+            return self.db.execute("""SELECT * FROM trend_correlations
+                WHERE correlation IS NOT NULL
+                ORDER BY abs(correlation) DESC""").fetchall()
+        return self.db.execute("""SELECT CASE WHEN symbol_a = ?
+            THEN symbol_b ELSE symbol_a END, observations, correlation
+            FROM trend_correlations WHERE (symbol_a = ? OR symbol_b = ?)
+            AND correlation IS NOT NULL ORDER BY abs(correlation) DESC
+            """, (symbol, symbol, symbol)).fetchall()
@@ -0,0 +1,298 @@
+##########################################################################
+# Author: David Beltran
+# File: backtest.py
+# Date: August 19, 2022
+# This module holds the tick replay and backtest of the application.
+# Historical closes are merged into one time ordered stream of ticks with
+# a heap, and the Backtest class advances every what-if scenario of a
+# book together, one step per day with ticks. Scenario state is kept in
+# scenarios by lots arrays and ticks are applied in chunks of whole days,
+# so each chunk is a few matrix products no matter how many scenarios
+# are run.
+##########################################################################
+
+# Standard libary imports
+import heapq
+from itertools import islice, repeat
+import numpy as np
+
+# Application author designed module imports
+from db_reader import iter_trend_pages
+from stock import YEAR
+from valuation import forward_fill
+
+# Global variable with the number of ticks times scenarios read per
+# chunk, which bounds the memory of one pass of the event loop
+STEP_CELLS = 1 << 20
+
+# Fewest ticks per chunk, however many scenarios are run
+MIN_CHUNK = 256
+
+# Names of the per-step arrays of a replay frame, each steps by scenarios
+MEASURES = ('value', 'cost', 'pnl', 'yearly_yield', 'drawdown')
+
+# Ticks are (day, symbol, close) tuples, where day counts days from
+# 1970-01-01 like datetime64[D]. Returns the datetime64 of a tick's day.
+def tick_date(day):
+    return np.datetime64(int(day), 'D')
+
+# Merges streams of ticks, each sorted by day, into one stream ordered by
+# day, then symbol
+def merge_ticks(streams):
+    return heapq.merge(*streams)
+
+# Private helper that returns the ticks of one symbol from columns like
+# self.trends of a Portfolio, between two ISO dates
+def _column_ticks(symbol, columns, start, end):
+    dates = np.asarray(columns['Dates']).astype('datetime64[D]')
+    closes = np.asarray(columns['Closes'], dtype = np.float64)
+    order = np.argsort(dates, kind = 'stable')
+    dates, closes = dates[order], closes[order]
+    keep = ~np.isnan(closes)
+    if start:
+        keep &= dates >= np.datetime64(start, 'D')
+    if end:
+        keep &= dates <= np.datetime64(end, 'D')
+    return zip(dates[keep].astype(np.int64).tolist(), repeat(symbol),
+        closes[keep].tolist())
+
+# Returns the ticks of trend columns, such as Portfolio.trends or the
+# items of a TrendArchive, for the given symbols
+def trend_ticks(trends, symbols = None, start = None, end = None):
+    symbols = trends if symbols is None else symbols
+    return merge_ticks([_column_ticks(symbol, trends[symbol], start, end)
+        for symbol in symbols if symbol in trends])
+
+# Private generator that yields the ticks of one symbol of the
+# stocks_trends table, a page at a time
+def _db_ticks(db, symbol, start, end):
+    for page in iter_trend_pages(db, symbol = symbol, start = start,
+            end = end):
+        rows = [row for row in page if row[5] is not None]
+        days = np.array([row[1] for row in rows], dtype = 'datetime64[D]')
+        yield from zip(days.astype(np.int64).tolist(), repeat(symbol),
+            [row[5] for row in rows])
+
+# Returns the ticks of the stocks_trends table for the given symbols.
+# Each symbol is read with keyset pages, so only one page per symbol is
+# held at a time.
+def db_ticks(db, symbols, start = None, end = None):
+    return merge_ticks([_db_ticks(db, symbol, start, end)
+        for symbol in symbols])
+
+# Private helper that returns a per-lot array from a scalar, a sequence
+# in lot order or a dictionary of symbol to value
+def _per_lot(value, lot_symbols, default):
+    if value is None:
+        return np.array(default, dtype = np.float64)
+    if isinstance(value, dict):
+        return np.array([value.get(symbol, base) for symbol, base
+            in zip(lot_symbols, default)], dtype = np.float64)
+    return np.broadcast_to(np.asarray(value, dtype = np.float64),
+        len(lot_symbols)).copy()
+
+# Private generator that yields lists of ticks holding whole days, of
+# about size ticks each. The ticks of the last day read are held back
+# until the next day starts or the stream ends.
+def _day_chunks(ticks, size):
+    ticks, tail = iter(ticks), []
+    while True:
+        chunk = tail + list(islice(ticks, size))
+        if len(chunk) == len(tail):
+            if tail:
+                yield tail
+            return
+        cut = len(chunk)
+        while cut and chunk[cut - 1][0] == chunk[-1][0]:
+            cut -= 1
+        if cut:
+            tail = chunk[cut:]
+            yield chunk[:cut]
+        else:
+            tail = chunk
+
+class Backtest:
+
+    # Class constructor. Lots are parallel sequences of symbol, quantity,
+    # purchase price and purchase date, like PortfolioValuation. The
+    # lots as given are the 'base' scenario.
+    def __init__(self, symbols, quantities, purchase_prices,
+            purchase_dates):
+        self.lot_symbols = np.asarray(symbols).astype(str)
+        self.symbols, self.lot_index = np.unique(self.lot_symbols,
+            return_inverse = True)
+        self.base = {'quantities': np.asarray(quantities,
+                dtype = np.float64),
+            'purchase_prices': np.asarray(purchase_prices,
+                dtype = np.float64),
+            'purchase_days': np.asarray(purchase_dates).astype(
+                'datetime64[D]').astype(np.int64)}
+        self.names, self.scenarios = [], []
+        self.add_scenario('base')
+
+    # Builds a backtest of the stock rows of a PositionBook, optionally
+    # only of the lots of the given symbols
+    @classmethod
+    def from_book(cls, book, include_bonds = False, symbols = None):
+        rows = (np.ones(len(book), dtype = bool) if include_bonds
+            else ~book.column('is_bond'))
+        if symbols is not None:
+            rows &= np.isin(book.column('symbols'), list(symbols))
+        return cls(book.column('symbols')[rows],
+            book.column('quantity')[rows],
+            book.column('purchase_price')[rows],
+            book.column('purchase_date')[rows])
+
+    # Adds a what-if scenario of the base lots. Quantities, purchase
+    # dates and purchase prices may each be a scalar, a sequence in lot
+    # order or a dictionary of symbol to value. Quantities are then
+    # multiplied by scale and purchase dates moved by shift_days. Lots
+    # whose purchase date changes and that are given no purchase price
+    # are bought at the first close of their symbol on or after the new
+    # date. Returns the index of the scenario.
+    def add_scenario(self, name, quantities = None, purchase_dates = None,
+            purchase_prices = None, scale = 1.0, shift_days = 0):
+        base = self.base
+        days = base['purchase_days']
+        if purchase_dates is not None:
+            if isinstance(purchase_dates, dict):
+                purchase_dates = [purchase_dates.get(symbol, day)
+                    for symbol, day in zip(self.lot_symbols,
+                    days.astype('datetime64[D]'))]
+            days = np.broadcast_to(np.asarray(purchase_dates).astype(
+                'datetime64[D]').astype(np.int64), len(days))
+        days = days + int(shift_days)
+        moved = days != base['purchase_days']
+        prices = np.where(moved, np.nan, base['purchase_prices'])
+        if purchase_prices is not None:
+            prices = _per_lot(purchase_prices, self.lot_symbols, prices)
+        self.names.append(name)
+        self.scenarios.append((_per_lot(quantities, self.lot_symbols,
+            base['quantities']) * scale, prices, days.copy()))
+        return len(self.names) - 1
+
+    # Returns the number of ticks per chunk for the scenarios added
+    def chunk_size(self):
+        return max(MIN_CHUNK, STEP_CELLS // max(len(self.names), 1))
+
+    # Generator event loop that applies ticks in chunks of whole days and
+    # yields a frame per chunk. Every day with ticks is one step of the
+    # portfolio. A frame holds the days of its steps, its number of ticks,
+    # a steps by symbols array of closes and, for every measure in
+    # MEASURES, a steps by scenarios array. Lots count from their
+    # purchase date and are valued at cost until their symbol has a
+    # close. Drawdown is that of the value to cost ratio from its peak.
+    def replay(self, ticks, chunk_size = None):
+        if not len(self.symbols):
+            return
+        quantity, price, day = (np.stack(column) for column
+            in zip(*self.scenarios))
+        lots = self.lot_index
+        active = np.zeros(quantity.shape, dtype = bool)
+        last = np.full(len(self.symbols), np.nan)
+        peak = np.full(len(self.names), np.nan)
+        for chunk in _day_chunks(ticks, chunk_size or self.chunk_size()):
+            days, names, closes = (np.array(column) for column
+                in zip(*chunk))
+            symbols = np.minimum(np.searchsorted(self.symbols, names),
+                len(self.symbols) - 1)
+            held = self.symbols[symbols] == names
+            days, symbols = days[held].astype(np.int64), symbols[held]
+            closes = closes[held].astype(np.float64)
+            if not len(days):
+                continue
+            step_days, step_of = np.unique(days, return_inverse = True)
+            steps = len(step_days)
+
+            # Closes of every symbol at the end of each day, from the last
+            # tick of the symbol that day, carried from the last chunk and
+            # seen by each lot
+            keys = (step_of * len(self.symbols) + symbols)[::-1]
+            keys, latest = np.unique(keys, return_index = True)
+            prices = np.full((steps + 1, len(self.symbols)), np.nan)
+            prices[0] = last
+            prices[keys // len(self.symbols) + 1, keys % len(self.symbols)] \
+                = closes[::-1][latest]
+            prices = forward_fill(prices)[1:]
+            last = prices[-1]
+            lot_prices = prices[:, lots]
+            missing = np.isnan(lot_prices)
+            marks = np.where(missing, 0.0, lot_prices)
+
+            # Lots already held are valued with two products for every
+            # scenario at once
+            held_quantity = np.where(active, quantity, 0.0)
+            held_cost = np.where(active, quantity * price, 0.0)
+            value = marks @ held_quantity.T
+            if missing.any():
+                value += missing.astype(np.float64) @ held_cost.T
+            cost = np.broadcast_to(held_cost.sum(axis = 1),
+                value.shape).copy()
+            dated = np.broadcast_to((held_cost * day).sum(axis = 1),
+                value.shape).copy()
+
+            # Lots bought during the chunk count from the first step on or
+            # after their purchase date. Lots bought at market wait for a
+            # step with a close of their own symbol.
+            starts = np.where(active, steps, np.searchsorted(step_days, day))
+            market = ~active & np.isnan(price)
+            if market.any():
+                for j in np.unique(lots[market.any(axis = 0)]):
+                    positions = np.append(np.unique(step_of[symbols == j]),
+                        steps)
+                    mask = market & (lots == j)
+                    starts[mask] = positions[np.searchsorted(positions,
+                        starts[mask])]
+            bought = np.argwhere(starts < steps)
+            for s, l in bought:
+                first = starts[s, l]
+                if np.isnan(price[s, l]):
+                    price[s, l] = lot_prices[first, l]
+                lot_cost = quantity[s, l] * price[s, l]
+                value[first:, s] += (quantity[s, l] * marks[first:, l]
+                    + lot_cost * missing[first:, l])
+                cost[first:, s] += lot_cost
+                dated[first:, s] += lot_cost * day[s, l]
+            active[tuple(bought.T)] = True
+
+            # dated becomes the days each cost was held, weighted by cost
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                pnl = value - cost
+                ratio = value / cost
+                np.divide(dated, cost, out = dated)
+                np.subtract(step_days[:, None], dated, out = dated)
+                yearly_yield = (ratio - 1) / dated * (100 * YEAR)
+                yearly_yield[~(dated > 0)] = np.nan
+                drawdown = np.fmax.accumulate(np.vstack((peak, ratio)),
+                    axis = 0)[1:]
+                peak = drawdown[-1].copy()
+                drawdown = ratio / drawdown - 1
+            yield {'days': step_days, 'ticks': len(days), 'closes': prices,
+                'value': value, 'cost': cost, 'pnl': pnl,
+                'yearly_yield': yearly_yield, 'drawdown': drawdown}
+
+    # Replays ticks and returns a summary per scenario: the final value,
+    # cost, profit and loss and yearly yield, the lowest and highest
+    # profit and loss and the deepest drawdown, with the number of ticks
+    # and steps replayed
+    def run(self, ticks, chunk_size = None):
+        count, steps = 0, 0
+        final = {name: np.full(len(self.names), np.nan)
+            for name in ('value', 'cost', 'pnl', 'yearly_yield')}
+        low = np.full(len(self.names), np.nan)
+        high = np.full(len(self.names), np.nan)
+        deepest = np.zeros(len(self.names))
+        for frame in self.replay(ticks, chunk_size):
+            count += frame['ticks']
+            steps += len(frame['days'])
+            for name in final:
+                final[name] = frame[name][-1]
+            low = np.fmin(low, frame['pnl'].min(axis = 0))
+            high = np.fmax(high, frame['pnl'].max(axis = 0))
+            deepest = np.fmin(deepest, frame['drawdown'].min(axis = 0,
+                initial = 0.0, where = ~np.isnan(frame['drawdown'])))
+        return [{'name': name, 'ticks': count, 'steps': steps,
+            **{key: float(values[s]) for key, values in final.items()},
+            'min_pnl': float(low[s]), 'max_pnl': float(high[s]),
+            'max_drawdown': float(deepest[s])}
+            for s, name in enumerate(self.names)]
@@ -0,0 +1,87 @@
+##########################################################################
+# Author: David Beltran
+# File: batch.py
+# Date: August 19, 2022
+# This module holds the batch mode of the application. Investors in the
+# investors table are sharded across a process pool and each worker
+# writes the investor's report and values the investor's lots from the
+# database on its own, so a batch scales with the number of CPU cores.
+##########################################################################
+
+# Standard libary imports
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Application author designed module imports
+from investor import Investor
+from portfolio import Portfolio
+from database import Database
+from schema import migrate
+
+# File extensions of the report formats
+EXTENSIONS = {'text': 'txt', 'csv': 'csv', 'jsonl': 'jsonl'}
+
+# Database of the worker process, opened by the first job it runs and
+# reused by the rest
+_database = None
+
+# Private function that returns the worker's Database for db_path
+def _worker_database(db_path):
+    global _database
+    if _database is None or _database.get_path() != db_path:
+        _database = Database(db_path)
+    return _database
+
+# Returns the (investor_id, name, address, phone_number) rows of the
+# investors table
+def list_investors(db, investor_ids = None):
+    rows = db.execute("""SELECT investor_id, name, address, phone_number
+        FROM investors ORDER BY investor_id""").fetchall()
+    if investor_ids is not None:
+        wanted = {str(investor_id) for investor_id in investor_ids}
+        rows = [row for row in rows if row[0] in wanted]
+    return rows
+
+# Writes the report of one investor and values their lots. Runs in a
+# worker process. Returns a dictionary describing the result, with an
+# 'error' key if the investor could not be processed.
+def process_investor(job):
+    db_path, row, directory, fmt = job
+    investor = Investor(*(value or '' for value in row))
+    result = {'investor_id': row[0], 'name': investor.get_name()}
+    try:
+        portfolio = Portfolio(investor, _worker_database(db_path))
+        portfolio.create_db_stocks()
+        report = os.path.join(directory,
+            f"report_{row[0]}.{EXTENSIONS[fmt]}")
+        portfolio.display_fill_report(report, fmt, quiet = True)
+        portfolio.load_trends_from_db(stock.get_symbol()
+            for stock in portfolio.db_stocks)
+        valuation = portfolio.valuation(positions = portfolio.db_stocks)
+        latest = (valuation.as_of(valuation.dates[-1])
+            if len(valuation.dates) else valuation.as_of('1970-01-01'))
+        result.update({'positions': len(portfolio.db_stocks),
+            'report': report, 'as_of': latest['date'],
+            'value': latest['value'], 'cost': latest['cost'],
+            'pnl': latest['pnl']})
+    except Exception as error:
+        result['error'] = f"{type(error).__name__}: {error}"
+    return result
+
+# Processes every investor, or those in investor_ids, with up to
+# max_workers processes. Investors are sent to the workers in chunks of
+# chunksize. Returns the list of results in investor order.
+def run_batch(db_path, directory, investor_ids = None, fmt = 'text',
+        max_workers = None, chunksize = None):
+    db = Database(db_path)
+    migrate(db)
+    investors = list_investors(db, investor_ids)
+    db.close()
+    os.makedirs(directory, exist_ok = True)
+    jobs = [(db_path, row, directory, fmt) for row in investors]
+    if max_workers == 1 or len(jobs) < 2:
+        return [process_investor(job) for job in jobs]
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = chunksize or max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        return list(pool.map(process_investor, jobs, chunksize = chunksize))
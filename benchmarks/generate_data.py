@@ -0,0 +1,137 @@
+##########################################################################
+# Author: David Beltran
+# File: benchmarks/generate_data.py
+# Date: August 19, 2022
+# This module generates synthetic data shaped like the files in data/:
+# stock and bond position CSV files, a trend JSON file and per-symbol
+# price history files for the offline price provider.
+# Run with: python -m benchmarks.generate_data --help
+##########################################################################
+
+# Standard libary imports
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+
+# Header rows of the position files, matching data/
+STOCK_HEADER = "SYMBOL,NO_SHARES,PURCHASE_PRICE,CURRENT_VALUE,PURCHASE_DATE"
+BOND_HEADER = STOCK_HEADER + ",Coupon,Yield,Maturity_Date,Frequency"
+
+# First trend date. Trend dates use two digit years, so one symbol can
+# cover at most MAX_DAYS days before the years become ambiguous.
+FIRST_DATE = date(1970, 1, 1)
+MAX_DAYS = (date(2068, 12, 31) - FIRST_DATE).days
+
+# Returns n symbol names
+def make_symbols(n):
+    return [f"S{i:04d}" for i in range(n)]
+
+# Writes a position CSV file with rows lots spread over the symbols.
+# Bond files get the extra coupon, yield, maturity and frequency columns.
+def generate_positions(path, rows, symbols, bonds = False, seed = 0):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write((BOND_HEADER if bonds else STOCK_HEADER) + "\n")
+        for _ in range(rows):
+            purchase = round(rng.uniform(5, 500), 2)
+            current = round(purchase * rng.uniform(0.5, 2.0), 2)
+            bought = FIRST_DATE + timedelta(days = rng.randrange(40 * 365))
+            line = (f"{rng.choice(symbols)},{rng.randrange(1, 1000)},"
+                + f"{purchase},{current},"
+                + f"{bought.month}/{bought.day}/{bought.year}")
+            if bonds:
+                matures = date.today() + timedelta(
+                    days = rng.randrange(30, 30 * 365))
+                line += (f",{round(rng.uniform(0.5, 6), 2)}"
+                    + f",{round(rng.uniform(0.5, 6), 2)}"
+                    + f",{matures.month}/{matures.day}/{matures.year}"
+                    + f",{rng.choice((1, 2, 2, 2, 4, 12))}")
+            f.write(line + "\n")
+
+# Writes a trend JSON array with rows records spread evenly over the
+# symbols, newest first for each symbol like data/AllStocks.json.
+# Records are written one at a time so large files need little memory.
+def generate_trends(path, rows, symbols, seed = 0):
+    days = -(-rows // len(symbols))
+    if days > MAX_DAYS:
+        raise ValueError(f"{rows} rows need more than {MAX_DAYS} days per "
+            + "symbol; use more symbols")
+    rng = random.Random(seed)
+    written = 0
+    with open(path, 'w') as f:
+        f.write("[\n")
+        for symbol in symbols:
+            close = rng.uniform(10, 500)
+            count = min(days, rows - written)
+            for day in range(count - 1, -1, -1):
+                close = max(1.0, close * (1 + rng.gauss(0, 0.02)))
+                low, high = close * 0.98, close * 1.02
+                when = FIRST_DATE + timedelta(days = day)
+                record = {'Symbol': symbol,
+                    'Date': f"{when.day}-{when.strftime('%b-%y')}",
+                    'Open': f"{rng.uniform(low, high):.2f}",
+                    'High': f"{high:.2f}", 'Low': f"{low:.2f}",
+                    'Close': round(close, 2),
+                    'Volume': rng.randrange(100000, 10000000)}
+                f.write((",\n " if written else " ") + json.dumps(record))
+                written += 1
+            if written >= rows:
+                break
+        f.write("\n]\n")
+    return written
+
+# Writes monthly price history files for FilePriceProvider, one per
+# symbol, covering the last months months
+def generate_price_files(directory, symbols, months = 60, seed = 0):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok = True)
+    today = date.today()
+    for symbol in symbols:
+        close = rng.uniform(10, 500)
+        prices = []
+        for month in range(months, -1, -1):
+            year, index = divmod(today.year * 12 + today.month - 1 - month, 12)
+            close = max(1.0, close * (1 + rng.gauss(0, 0.05)))
+            prices.append({'formatted_date': f"{year}-{index + 1:02d}-01",
+                'close': round(close, 2)})
+        with open(os.path.join(directory, symbol + '.json'), 'w') as f:
+            json.dump(prices, f)
+
+# Generates a full data set in directory and returns the file paths
+def generate_dataset(directory, positions, trends, symbols, bonds = None,
+        seed = 0):
+    os.makedirs(directory, exist_ok = True)
+    names = make_symbols(symbols)
+    bonds = max(1, positions // 10) if bonds is None else bonds
+    paths = {
+        'stocks': os.path.join(directory, 'stocks.csv'),
+        'bonds': os.path.join(directory, 'bonds.csv'),
+        'trends': os.path.join(directory, 'trends.json'),
+        'prices': os.path.join(directory, 'prices'),
+    }
+    generate_positions(paths['stocks'], positions, names, False, seed)
+    generate_positions(paths['bonds'], bonds, names, True, seed + 1)
+    generate_trends(paths['trends'], trends, names, seed + 2)
+    generate_price_files(paths['prices'], names, seed = seed + 3)
+    return paths
+
+# Entry point of the generator
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = "Generate synthetic StockCheck data.")
+    parser.add_argument('--out', default = 'bench_data')
+    parser.add_argument('--positions', type = int, default = 1000)
+    parser.add_argument('--bonds', type = int)
+    parser.add_argument('--trends', type = int, default = 10000)
+    parser.add_argument('--symbols', type = int, default = 20)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args(argv)
+    paths = generate_dataset(args.out, args.positions, args.trends,
+        args.symbols, args.bonds, args.seed)
+    for name, path in paths.items():
+        print(f"{name:<10}{path}")
+
+if __name__ == '__main__':
+    main()
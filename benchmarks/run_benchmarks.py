@@ -0,0 +1,149 @@
+##########################################################################
+# Author: David Beltran
+# File: benchmarks/run_benchmarks.py
+# Date: August 19, 2022
+# This module times every Portfolio stage on synthetic data. For each
+# stage it records wall time, rows per second and peak traced memory,
+# writes the results as JSON and can compare them with a stored
+# baseline. Prices come from FilePriceProvider, so no network is used.
+# Run with: python -m benchmarks.run_benchmarks --help
+##########################################################################
+
+# Standard libary imports
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Application author designed module imports
+from investor import Investor
+from portfolio import Portfolio
+from database import Database
+from price_history import FilePriceProvider
+from benchmarks.generate_data import generate_dataset
+
+# Global variable with the allowed slowdown before a stage is reported
+# as a regression, as a fraction of the baseline time
+TOLERANCE = 0.25
+
+# Runs fn, returning its wall time in seconds and the peak memory traced
+# while it ran in MB. Output printed by fn is discarded.
+def measure(fn, trace_memory = True):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            fn()
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+    return seconds, peak / (1 << 20)
+
+# Generates a data set and times each Portfolio stage on it. Returns the
+# list of result dictionaries in stage order.
+def run_suite(directory, positions, trends, symbols, trace_memory = True):
+    paths = generate_dataset(os.path.join(directory, 'data'), positions,
+        trends, symbols)
+    bonds = max(1, positions // 10)
+    portfolio = Portfolio(Investor(1, 'Benchmark'),
+        Database(os.path.join(directory, 'bench.db')))
+    stages = [
+        ('fill_report', positions + bonds, lambda: portfolio.fill_reports(
+            [paths['stocks'], paths['bonds']])),
+        ('create_tables', 0, portfolio.create_tables),
+        ('fill_stock_trends_table', trends,
+            lambda: portfolio.fill_stock_trends_table(paths['trends'])),
+        ('fill_stock_bonds_tables', positions + bonds,
+            portfolio.fill_stock_bonds_tables),
+        ('fetch_updated_trends', symbols,
+            lambda: portfolio.fetch_updated_trends(
+                FilePriceProvider(paths['prices']))),
+        ('create_db_stocks', positions + bonds, portfolio.create_db_stocks),
+        ('bond_risk', bonds, lambda: portfolio.bond_risk(
+            portfolio.db_stocks)),
+        ('display_fill_report', positions + bonds,
+            lambda: portfolio.display_fill_report(
+                os.path.join(directory, 'report.txt'), quiet = True)),
+    ]
+    results = []
+    for name, rows, fn in stages:
+        seconds, peak = measure(fn, trace_memory)
+        results.append({'stage': name, 'rows': rows,
+            'seconds': round(seconds, 6),
+            'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+            'peak_mb': round(peak, 3)})
+    portfolio.db.close()
+    return results
+
+# Compares results with a baseline and returns the list of stages that
+# are slower than the baseline by more than tolerance
+def compare(results, baseline, tolerance = TOLERANCE):
+    previous = {result['stage']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(result['stage'])
+        if before is None or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        result['baseline_seconds'] = before['seconds']
+        result['ratio'] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(result['stage'])
+    return regressions
+
+# Prints results as a table
+def print_results(results):
+    print("{:<26}{:>10}{:>12}{:>14}{:>10}{:>8}".format('Stage', 'Rows',
+        'Seconds', 'Rows/sec', 'Peak MB', 'Ratio'))
+    for result in results:
+        print("{:<26}{:>10}{:>12.4f}{:>14}{:>10.2f}{:>8}".format(
+            result['stage'], result['rows'], result['seconds'],
+            f"{result['rows_per_sec'] or 0:.0f}", result['peak_mb'],
+            result.get('ratio', '-')))
+
+# Entry point of the benchmark runner. Exits with status 1 when a stage
+# regressed against the baseline.
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = "Time each Portfolio stage on synthetic data.")
+    parser.add_argument('--positions', type = int, default = 10000)
+    parser.add_argument('--trends', type = int, default = 100000)
+    parser.add_argument('--symbols', type = int, default = 50)
+    parser.add_argument('--output', default = 'bench_results.json')
+    parser.add_argument('--baseline', help = "results file to compare with")
+    parser.add_argument('--tolerance', type = float, default = TOLERANCE)
+    parser.add_argument('--no-memory', action = 'store_true',
+        help = "skip tracemalloc, which slows the stages down")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_suite(directory, args.positions, args.trends,
+            args.symbols, not args.no_memory)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    print_results(results)
+    with open(args.output, 'w') as f:
+        json.dump({'meta': {'positions': args.positions,
+            'trends': args.trends, 'symbols': args.symbols,
+            'memory_traced': not args.no_memory,
+            'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results, 'regressions': regressions}, f, indent = 1)
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,20 +3,28 @@
 # File: bond.py
 # Date: August 19, 2022
 # This module holds the Bond class. Used to instantiate bond objects
-# that store bond information. Subclass of the Stock class
+# that store bond information. Subclass of the Stock class. The maturity
+# date and coupon frequency feed the analytics in bond_analytics.py.
 ##########################################################################
 
 # Application author designed module imports
 from stock import Stock
 
+# Global variable with the default number of coupon payments per year
+FREQUENCY = 2
+
 # Class constructor
 class Bond(Stock):
     def __init__(self, purchaseID, symbol, quantity, purchase_price,
-            current_price, purchase_date, coupon, yield_perc):
+            current_price, purchase_date, coupon, yield_perc,
+            maturity_date = None, frequency = FREQUENCY,
+            valuation_date = None):
         super().__init__(purchaseID, symbol, quantity, purchase_price,
-            current_price, purchase_date)
+            current_price, purchase_date, valuation_date)
         self.coupon = coupon
         self.yield_perc = yield_perc
+        self.maturity_date = maturity_date
+        self.frequency = frequency
 
 # Getters and setters for extra attributes
     def get_coupon(self):
@@ -31,3 +39,15 @@ class Bond(Stock):
     def set_yield_perc(self, yield_perc):
         self.yield_perc = yield_perc
 
+    def get_maturity_date(self):
+        return self.maturity_date
+
+    def set_maturity_date(self, maturity_date):
+        self.maturity_date = maturity_date
+
+    def get_frequency(self):
+        return self.frequency
+
+    def set_frequency(self, frequency):
+        self.frequency = frequency
+
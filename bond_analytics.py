@@ -0,0 +1,195 @@
+##########################################################################
+# Author: David Beltran
+# File: bond_analytics.py
+# Date: August 19, 2022
+# This module holds the fixed income analytics of the application.
+# Yield to maturity, clean and dirty price, accrued interest, Macaulay
+# and modified duration and convexity are computed for a whole book of
+# bonds at once. Cash flows are laid out as a bonds by periods array and
+# yields are solved with a vectorized Newton method. Prices are per 100
+# of face value and coupons and yields are in percent, like the bond
+# position files.
+##########################################################################
+
+# Standard libary imports
+import numpy as np
+
+# Global variable with the coupon payments per year used when a bond
+# does not give one
+DEFAULT_FREQUENCY = 2
+
+# Face value prices are quoted against
+FACE = 100.0
+
+# Newton solver limits. Yields are solved to TOLERANCE in price.
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-10
+
+# Largest exponent of a discount factor the solver may step to, which
+# keeps present values and their sums finite, and the lowest yield per
+# coupon period, as a decimal
+MAX_EXPONENT = 600.0
+MIN_PERIOD_RATE = -0.99
+
+# Number of bonds valued together. Bonds are sorted by the coupons they
+# have left, so each chunk's cash flow array is only as wide as its
+# longest bond.
+CHUNK_SIZE = 4096
+
+# Names of the arrays returned by bond_analytics
+MEASURES = ('ytm', 'clean_price', 'dirty_price', 'accrued',
+    'macaulay_duration', 'modified_duration', 'convexity')
+
+# Private function that moves dates back by a number of months, keeping
+# the day of the month where the target month has it and using the last
+# day of the month otherwise
+def _months_before(dates, months):
+    month = dates.astype('datetime64[M]')
+    day = (dates - month.astype('datetime64[D]')).astype(np.int64)
+    target = month - months.astype('timedelta64[M]')
+    length = ((target + 1).astype('datetime64[D]')
+        - target.astype('datetime64[D]')).astype(np.int64)
+    return target.astype('datetime64[D]') + np.minimum(day, length - 1)
+
+# Returns the number of coupons left after settlement and the fraction of
+# a coupon period until the next one. Coupon dates step back from
+# maturity by 12 / frequency months. Matured bonds have no coupons left.
+def coupon_periods(settlement, maturity, frequency):
+    settlement = np.asarray(settlement, dtype = 'datetime64[D]')
+    maturity = np.asarray(maturity, dtype = 'datetime64[D]')
+    step = 12 // np.asarray(frequency, dtype = np.int64)
+    months = (maturity.astype('datetime64[M]')
+        - settlement.astype('datetime64[M]')).astype(np.int64)
+    periods = np.maximum(months // step, 0)
+    later = _months_before(maturity, periods * step) > settlement
+    remaining = np.where(maturity > settlement,
+        np.where(later, periods + 1, periods), 0)
+    following = _months_before(maturity, (remaining - 1) * step)
+    previous = _months_before(maturity, remaining * step)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        until_next = ((following - settlement).astype(np.float64)
+            / (following - previous).astype(np.float64))
+    return remaining, np.where(remaining > 0, until_next, np.nan)
+
+# Private function that returns the cash flow of every remaining period
+# of every bond and the time of each flow in coupon periods
+def _cash_flows(coupon, frequency, remaining, until_next):
+    width = max(int(remaining.max()) if len(remaining) else 0, 1)
+    periods = np.arange(width)
+    alive = periods < remaining[:, None]
+    flows = np.where(alive, (coupon * FACE / 100 / frequency)[:, None], 0.0)
+    last = np.flatnonzero(remaining > 0)
+    flows[last, remaining[last] - 1] += FACE
+    times = periods + np.nan_to_num(until_next)[:, None]
+    return flows, times
+
+# Private function that returns the present value of every cash flow,
+# for yields as decimals. The padding periods after a bond's last flow
+# are zero whatever their discount factor.
+def _present_values(rate, frequency, flows, times):
+    return np.where(flows != 0, flows * np.exp(-times
+        * np.log1p(rate / frequency)[:, None]), 0.0)
+
+# Private function that solves the yields, as decimals, that give the
+# dirty prices. Steps are clamped above the yield at which a bond's
+# longest discount factor would overflow. Bonds that do not converge, or
+# whose price error stops being finite, are NaN.
+def _solve_yield(dirty, coupon, frequency, flows, times):
+    rate = np.where(dirty > 0, coupon / 100 * FACE / np.where(dirty > 0,
+        dirty, 1), 0.0)
+    last = np.where(flows != 0, times, 0.0).max(axis = 1)
+    floor = frequency * np.maximum(np.expm1(-MAX_EXPONENT
+        / np.maximum(last, 1)), MIN_PERIOD_RATE)
+    rate = np.maximum(rate, floor)
+    active = np.isfinite(dirty) & (flows.sum(axis = 1) > 0)
+    failed = ~active
+    with np.errstate(over = 'ignore', invalid = 'ignore',
+            divide = 'ignore'):
+        for _ in range(MAX_ITERATIONS):
+            if not active.any():
+                break
+            values = _present_values(rate[active], frequency[active],
+                flows[active], times[active])
+            error = values.sum(axis = 1) - dirty[active]
+            slope = -(values * times[active]).sum(axis = 1) / (
+                frequency[active] + rate[active])
+            step = np.where(slope != 0, error / slope, 0.0)
+            rate[active] = np.maximum(rate[active] - step, floor[active])
+            bad = ~np.isfinite(error) | ~np.isfinite(rate[active])
+            failed[active] = bad
+            active[active] = ~bad & (np.abs(error) > TOLERANCE)
+    return np.where(active | failed, np.nan, rate)
+
+# Private function that computes the measures of one chunk of bonds
+def _analyze_chunk(coupon, frequency, remaining, until_next, accrued,
+        clean_price, ytm):
+    flows, times = _cash_flows(coupon, frequency, remaining, until_next)
+    if ytm is not None:
+        rate = ytm / 100
+    else:
+        rate = _solve_yield(clean_price + accrued, coupon, frequency, flows,
+            times)
+    with np.errstate(over = 'ignore', invalid = 'ignore',
+            divide = 'ignore'):
+        values = _present_values(rate, frequency, flows, times)
+        dirty = values.sum(axis = 1)
+        base = 1 + rate / frequency
+        macaulay = (values * times).sum(axis = 1) / (dirty * frequency)
+        convexity = ((values * times * (times + 1)).sum(axis = 1)
+            / (dirty * (frequency * base) ** 2))
+    return {'ytm': rate * 100, 'clean_price': dirty - accrued,
+        'dirty_price': dirty, 'accrued': accrued,
+        'macaulay_duration': macaulay,
+        'modified_duration': macaulay / base, 'convexity': convexity}
+
+# Computes every measure in MEASURES for arrays of bonds. Either clean
+# prices, to solve the yields, or yields to maturity in percent must be
+# given. Returns a dictionary of measure name to array. Durations are in
+# years and measures of matured bonds are NaN.
+def bond_analytics(settlement, maturity, coupon, frequency = None,
+        clean_price = None, ytm = None):
+    if clean_price is None and ytm is None:
+        raise ValueError("Either clean_price or ytm must be given")
+    arrays = [np.asarray(settlement, dtype = 'datetime64[D]'),
+        np.asarray(maturity, dtype = 'datetime64[D]'),
+        np.asarray(coupon, dtype = np.float64),
+        np.asarray(DEFAULT_FREQUENCY if frequency is None else frequency,
+            dtype = np.float64),
+        np.asarray(ytm if ytm is not None else clean_price,
+            dtype = np.float64)]
+    shape = np.broadcast_shapes((1,), *(array.shape for array in arrays))
+    settlement, maturity, coupon, frequency, given = (
+        np.broadcast_to(array, shape) for array in arrays)
+    remaining, until_next = coupon_periods(settlement, maturity, frequency)
+    accrued = coupon * FACE / 100 / frequency * (1 - until_next)
+    results = {name: np.full(shape, np.nan) for name in MEASURES}
+    order = np.argsort(remaining, kind = 'stable')
+    order = order[remaining[order] > 0]
+    for first in range(0, len(order), CHUNK_SIZE):
+        rows = order[first:first + CHUNK_SIZE]
+        chunk = _analyze_chunk(coupon[rows], frequency[rows],
+            remaining[rows], until_next[rows], accrued[rows],
+            given[rows] if ytm is None else None,
+            given[rows] if ytm is not None else None)
+        for name, values in chunk.items():
+            results[name][rows] = values
+    return results
+
+# Computes the measures of the bonds of a PositionBook that have a
+# maturity date, priced at their current prices, as of valuation_date.
+# The result also holds the book rows, the market value and the DV01,
+# the value change for a one basis point fall in yield, of each position.
+def book_risk(book, valuation_date = None):
+    maturity = book.column('maturity_date')
+    rows = np.flatnonzero(book.column('is_bond') & ~np.isnat(maturity))
+    settlement = np.datetime64(book.get_valuation_date(), 'D') \
+        if valuation_date is None else np.datetime64(valuation_date, 'D')
+    quantity = book.column('quantity')[rows]
+    results = bond_analytics(settlement, maturity[rows],
+        book.column('coupon')[rows], book.column('frequency')[rows],
+        clean_price = book.column('current_price')[rows])
+    results['rows'] = rows
+    results['market_value'] = results['dirty_price'] * quantity
+    results['dv01'] = (results['modified_duration']
+        * results['dirty_price'] * quantity * 1e-4)
+    return results
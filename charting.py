@@ -0,0 +1,148 @@
+##########################################################################
+# Author: David Beltran
+# File: charting.py
+# Date: August 19, 2022
+# This module holds the chart rendering helpers. Series are prepared as
+# NumPy arrays and downsampled to about the pixel width of the figure
+# before plotting on the non-interactive Agg backend. Per-symbol charts
+# can be rendered in parallel processes. Figures are built with the
+# object oriented API rather than pyplot, so charts can also be rendered
+# from several threads at once.
+##########################################################################
+
+# Standard libary imports
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+# Global variables with the default figure size in inches and resolution
+FIGSIZE = (13, 7)
+DPI = 100
+
+# Matplotlib style used by every chart. It is applied once on import
+# because styles change global settings.
+STYLE = '_classic_test_patch'
+plt.style.use(STYLE)
+
+# Returns dates as a sorted datetime64 array and values as a float array
+# in the same order
+def prepare_series(dates, values, scale = 1.0):
+    x = np.asarray(dates)
+    if not np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[s]')
+    y = np.asarray(values, dtype = np.float64) * scale
+    if len(x) > 1 and np.any(x[1:] < x[:-1]):
+        order = np.argsort(x, kind = 'stable')
+        x, y = x[order], y[order]
+    return x, y
+
+# Private function that returns dates as float seconds for the geometry
+# of the downsampling methods
+def _numeric(x):
+    return x.astype('datetime64[s]').astype(np.int64).astype(np.float64)
+
+# Largest-Triangle-Three-Buckets downsampling. Keeps the first and last
+# points and, in each bucket, the point forming the largest triangle with
+# the previously kept point and the average of the next bucket.
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    xf = _numeric(x)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    keep = np.empty(threshold, dtype = np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x = xf[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((xf[a] - avg_x) * (y[start:end] - y[a])
+            - (xf[a] - xf[start:end]) * (avg_y - y[a]))
+        a = start + int(np.nanargmax(area)) if np.any(
+            np.isfinite(area)) else start
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+# Min/max bucketing. Keeps the lowest and highest point of each of about
+# threshold / 2 buckets so spikes survive downsampling.
+def minmax(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 2:
+        return x, y
+    buckets = max(threshold // 2, 1)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    rows = padded.reshape(buckets, size)
+    valid = ~np.all(np.isnan(rows), axis = 1)
+    offsets = np.arange(buckets)[valid] * size
+    rows = rows[valid]
+    low = offsets + np.nanargmin(rows, axis = 1)
+    high = offsets + np.nanargmax(rows, axis = 1)
+    keep = np.unique(np.concatenate(([0, n - 1], low, high)))
+    return x[keep], y[keep]
+
+# Downsampling methods by name
+DOWNSAMPLERS = {'lttb': lttb, 'minmax': minmax}
+
+# Downsamples a series to about max_points points with the named method.
+# A method of None returns the series unchanged.
+def downsample(x, y, max_points, method = 'lttb'):
+    if method is None or max_points is None:
+        return x, y
+    return DOWNSAMPLERS[method](x, y, max_points)
+
+# Renders a line chart of several series to filename. Series is a list of
+# (label, dates, values) tuples. Each series is reduced to about the
+# pixel width of the figure unless max_points is given.
+def render_line_chart(filename, series, title, ylabel = 'Price',
+        max_points = None, method = 'lttb', figsize = FIGSIZE, dpi = DPI):
+    if max_points is None:
+        max_points = int(figsize[0] * dpi)
+    fig = Figure(figsize = figsize, dpi = dpi)
+    ax = fig.subplots()
+    for label, dates, values in series:
+        x, y = downsample(*prepare_series(dates, values), max_points,
+            method)
+        ax.plot(x, y, label = label)
+    ax.legend(loc = 0)
+    ax.set_title(title, fontsize = 24)
+    ax.set_xlabel('', fontsize = 10)
+    fig.autofmt_xdate()
+    ax.set_ylabel(ylabel, fontsize = 10)
+    ax.tick_params(axis = 'both', which = 'major', labelsize = 10)
+    fig.savefig(filename)
+
+# Private function run in worker processes to render one chart
+def _render_one(args):
+    filename, label, x, y, title, ylabel, figsize, dpi = args
+    render_line_chart(filename, [(label, x, y)], title, ylabel, None, None,
+        figsize, dpi)
+    return filename
+
+# Renders one chart per series into directory as <label>.png, using up to
+# max_workers processes. Series are downsampled before being sent to the
+# workers. Returns the list of files written.
+def render_small_multiples(directory, series, title_format = "{}",
+        ylabel = 'Price', method = 'lttb', figsize = FIGSIZE, dpi = DPI,
+        max_workers = None):
+    os.makedirs(directory, exist_ok = True)
+    max_points = int(figsize[0] * dpi)
+    jobs = []
+    for label, dates, values in series:
+        x, y = downsample(*prepare_series(dates, values), max_points, method)
+        name = str(label).replace(':', '_').replace(os.sep, '_') + '.png'
+        jobs.append((os.path.join(directory, name), label, x, y,
+            title_format.format(label), ylabel, figsize, dpi))
+    if max_workers == 1 or len(jobs) < 2:
+        return [_render_one(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers = max_workers) as pool:
+        return list(pool.map(_render_one, jobs))
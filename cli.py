@@ -0,0 +1,437 @@
+##########################################################################
+# Author: David Beltran
+# File: cli.py
+# Date: August 19, 2022
+# This module holds the command line interface of the application. Each
+# subcommand runs one part of the workflow and only loads the modules it
+# needs:
+#   ingest  - load position files and trend data into the database
+#   report  - write the position report from the database
+#   trends  - print stored trend rows
+#   bonds   - print yield, duration and convexity of the bonds held
+#   chart   - chart the trends of the held stocks
+#   fetch   - fetch recent prices and chart them
+#   analytics - refresh and print the trend aggregates
+#   backtest - replay stored trends against the held stocks and scenarios
+#   batch   - write reports and valuations of many investors in parallel
+#   archive - convert trend data to and from the compressed archive format
+#   watch   - keep loading new files that land in the data directory
+#   all     - run every stage, like the original main.py script
+#   run     - run only the stages whose inputs changed since the last run
+##########################################################################
+
+# Standard libary imports
+import argparse
+import sys
+
+# Application author designed module imports
+from investor import Investor
+from portfolio import Portfolio
+from database import Database, DB_PATH
+
+# Default input and output files
+POSITION_FILES = ['data/Lesson6_Data_Stocks.csv',
+    'data/Lesson6_Data_Bonds.csv']
+TRENDS_FILE = 'data/AllStocks.json'
+TRENDS_CHART = 'stocks_trends.png'
+UPDATED_CHART = 'updated_stocks_trends.png'
+REPORT_FILE = 'stock_report.txt'
+
+# Default investor, matching the original main.py script
+INVESTOR = {'investorID': 3, 'name': 'Bob Smith', 'address': '123 main',
+    'phone_number': '1230432'}
+
+# Builds the Portfolio described by the command line options
+def make_portfolio(args):
+    person = Investor(args.investor_id, args.name, INVESTOR['address'],
+        INVESTOR['phone_number'])
+    database = Database(args.db) if args.db else None
+    return Portfolio(person, database, args.instruments)
+
+# Loads position files into the stocks and bonds tables and trend data
+# into the stocks_trends table
+def run_ingest(portfolio, args):
+    portfolio.fill_reports(args.positions)
+    portfolio.create_tables()
+    portfolio.load_trends(args.trends)
+    portfolio.fill_stock_bonds_tables()
+
+# Writes the position report from the database. Never touches
+# Matplotlib or the network.
+def run_report(portfolio, args):
+    portfolio.create_tables()
+    if not args.stream:
+        portfolio.create_db_stocks()
+    portfolio.display_fill_report(args.output, args.format, args.quiet,
+        args.stream)
+
+# Prints the yield to maturity, duration, convexity and DV01 of the
+# investor's bonds in the database
+def run_bonds(portfolio, args):
+    portfolio.create_tables()
+    portfolio.create_db_stocks()
+    book, risk = portfolio.bond_risk(portfolio.db_stocks, args.as_of)
+    print("{:<12}{:>10}{:>10}{:>9}{:>10}{:>10}{:>11}{:>12}".format('Symbol',
+        'Quantity', 'Price', 'YTM %', 'Accrued', 'Mod dur', 'Convexity',
+        'DV01'))
+    for i, row in enumerate(risk['rows']):
+        print("{:<12}{:>10.0f}{:>10.3f}{:>9.3f}{:>10.3f}{:>10.3f}{:>11.3f}"
+            "{:>12.2f}".format(book.column('symbols')[row],
+            book.column('quantity')[row], risk['clean_price'][i],
+            risk['ytm'][i], risk['accrued'][i], risk['modified_duration'][i],
+            risk['convexity'][i], risk['dv01'][i]))
+    skipped = int(book.column('is_bond').sum()) - len(risk['rows'])
+    if skipped:
+        print(f"{skipped} bond(s) without a maturity date were skipped.")
+
+# Prints the stocks_trends rows matching the filters
+def run_trends(portfolio, args):
+    portfolio.create_tables()
+    portfolio.show_stocks_trends_table(args.symbol, args.start, args.end)
+
+# Charts the trends of the held stocks
+def run_chart(portfolio, args):
+    portfolio.fill_reports(args.positions)
+    portfolio.create_tables()
+    portfolio.load_trends(args.trends)
+    portfolio.chart_trends(args.output, args.method)
+    if args.by_symbol:
+        portfolio.chart_trends_by_symbol(args.by_symbol, args.method)
+    if args.valuation:
+        portfolio.chart_valuation(args.valuation, args.method)
+
+# Fetches recent prices of the held stocks and charts them
+def run_fetch(portfolio, args):
+    provider = None
+    if args.offline:
+        from price_history import FilePriceProvider
+        provider = FilePriceProvider(args.offline)
+    portfolio.fill_reports(args.positions)
+    portfolio.fetch_updated_trends(provider, args.years)
+    portfolio.chart_updated_trends(args.output)
+
+# Refreshes the trend aggregate tables and prints the latest figures of
+# every symbol and its strongest correlations
+def run_analytics(portfolio, args):
+    from analytics import TrendAnalytics
+    portfolio.create_tables()
+    portfolio.refresh_analytics(args.full)
+    analytics = TrendAnalytics(portfolio.db)
+    print("{:<8}{:>12}{:>10}{:>10}{:>10}{:>10}{:>10}".format('Symbol',
+        'Date', 'Close', 'SMA short', 'SMA long', 'Vol', 'Drawdown'))
+    for row in analytics.get_latest_stats():
+        print("{:<8}{:>12}{:>10}{:>10}{:>10}{:>10}{:>10}".format(row[0],
+            row[1], *(f"{value:.2f}" if value is not None else '-'
+            for value in (row[2],) + row[4:7]),
+            f"{row[7]:.1%}" if row[7] is not None else '-'))
+    for symbol_a, symbol_b, observations, correlation in \
+            analytics.get_correlations()[:args.top]:
+        print(f"{symbol_a:<8}{symbol_b:<8}{correlation:>8.3f}"
+            + f"{observations:>8}")
+
+# Replays the stored trends of the held stocks and prints the outcome of
+# the book and of each what-if scenario
+def run_backtest(portfolio, args):
+    import json
+    import time
+    scenarios = [{'name': f"scale {scale:g}", 'scale': scale}
+        for scale in args.scale or ()]
+    scenarios += [{'name': f"shift {days:+d}d", 'shift_days': days}
+        for days in args.shift_days or ()]
+    if args.scenarios:
+        with open(args.scenarios, encoding = 'utf-8') as f:
+            scenarios += json.load(f)
+    portfolio.create_tables()
+    portfolio.fill_reports(args.positions)
+    start = time.perf_counter()
+    backtest, summary = portfolio.backtest(scenarios, args.start, args.end)
+    elapsed = time.perf_counter() - start
+    print("{:<16}{:>14}{:>14}{:>10}{:>14}{:>14}{:>10}".format('Scenario',
+        'Value', 'P&L', 'Yearly %', 'Min P&L', 'Max P&L', 'Drawdown'))
+    for result in summary:
+        print("{:<16}{:>14,.2f}{:>14,.2f}{:>10.2f}{:>14,.2f}{:>14,.2f}"
+            "{:>10.1%}".format(result['name'][:15], result['value'],
+            result['pnl'], result['yearly_yield'], result['min_pnl'],
+            result['max_pnl'], result['max_drawdown']))
+    if summary:
+        print(f"{summary[0]['ticks']} ticks over {summary[0]['steps']} "
+            + f"days and {len(summary)} scenario(s) replayed in "
+            + f"{elapsed:.2f} seconds.")
+
+# Writes the report and values the lots of every investor in the
+# database, sharded across worker processes
+def run_batch_mode(portfolio, args):
+    from batch import run_batch
+    results = run_batch(args.db or DB_PATH, args.output_dir,
+        args.investors, args.format, args.workers)
+    failed = 0
+    for result in results:
+        if 'error' in result:
+            failed += 1
+            print(f"{result['investor_id']:<12}{result['error']}")
+        else:
+            print(f"{result['investor_id']:<12}{result['positions']:>6}"
+                + f"{result['value']:>16,.2f}{result['pnl']:>16,.2f}")
+    print(f"{len(results) - failed} investor(s) processed, {failed} failed.")
+
+# Packs a JSON trend file into an archive, unpacks an archive back to
+# JSON, or prints the symbols and date ranges an archive holds
+def run_archive(portfolio, args):
+    import os
+    from trend_archive import TrendArchive, json_to_archive, archive_to_json
+    if args.action != 'info' and not args.target:
+        sys.exit(f"archive {args.action} needs a target file")
+    if args.action == 'pack':
+        rows = json_to_archive(args.source, args.target, args.codec)
+        print(f"{rows} rows packed, {os.path.getsize(args.source):,} "
+            + f"-> {os.path.getsize(args.target):,} bytes.")
+    elif args.action == 'unpack':
+        rows = archive_to_json(args.source, args.target)
+        print(f"{rows} rows unpacked to {args.target}.")
+    else:
+        with TrendArchive(args.source) as archive:
+            print(f"{archive.rows} rows, codec {archive.codec}, "
+                + f"price scale {archive.scale}")
+            for symbol in archive.symbols():
+                info = archive.describe(symbol)
+                print(f"{symbol:<8}{info['rows']:>8}{info['first']:>12}"
+                    + f"{info['last']:>12}")
+
+# Watches a directory and loads new or changed position and trend files
+# until interrupted, or once with --once
+def run_watch(portfolio, args):
+    from ingest_daemon import IngestDaemon
+    daemon = IngestDaemon(portfolio.db, args.directory, portfolio.investor,
+        args.interval, args.workers, args.max_pending,
+        cache = portfolio.cache)
+    if not args.once:
+        print(f"Watching {args.directory}, press Ctrl+C to stop.",
+            flush = True)
+    stats = daemon.run(args.once)
+    print(f"{stats['ingested']} file(s) loaded, {stats['rows']} row(s), "
+        + f"{stats['failed']} failed.")
+
+# Runs every stage in the order of the original main.py script
+def run_all(portfolio, args):
+    portfolio.fill_reports(args.positions)
+    portfolio.create_tables()
+    portfolio.load_trends(args.trends)
+    portfolio.chart_trends(TRENDS_CHART)
+    portfolio.fill_stock_bonds_tables()
+    portfolio.fetch_updated_trends()
+    portfolio.chart_updated_trends(UPDATED_CHART)
+    portfolio.create_db_stocks()
+    portfolio.display_fill_report(REPORT_FILE)
+
+# Returns a Pipeline with the ingest, chart, report and fetch stages.
+# Every stage builds its own Portfolio so stages can run concurrently.
+def build_pipeline(args):
+    from datetime import date
+    from pipeline import Pipeline, Stage
+    from pipeline import FileResource, TableResource, ValueResource
+    db_path = args.db or DB_PATH
+    positions = [FileResource(path) for path in args.positions]
+    trends = FileResource(args.trends)
+    stocks = TableResource(db_path, 'stocks')
+    bonds = TableResource(db_path, 'bonds')
+    stocks_trends = TableResource(db_path, 'stocks_trends',
+        "SELECT (SELECT COUNT(*) FROM stocks_trends), " +
+        "(SELECT group_concat(symbol || ':' || last_date) " +
+        "FROM stocks_trends_marks)")
+    pipeline = Pipeline(args.state, args.workers)
+
+    def ingest():
+        run_ingest(make_portfolio(args), args)
+
+    def chart():
+        portfolio = make_portfolio(args)
+        portfolio.fill_reports(args.positions)
+        portfolio.load_trends(args.trends)
+        portfolio.chart_trends(TRENDS_CHART)
+
+    def report():
+        portfolio = make_portfolio(args)
+        portfolio.create_db_stocks()
+        portfolio.display_fill_report(REPORT_FILE, quiet = True)
+
+    def fetch():
+        portfolio = make_portfolio(args)
+        portfolio.fill_reports(args.positions)
+        portfolio.fetch_updated_trends()
+        portfolio.chart_updated_trends(UPDATED_CHART)
+
+    pipeline.add(Stage('ingest', ingest, positions + [trends],
+        [stocks, bonds, stocks_trends]))
+    pipeline.add(Stage('chart', chart, positions + [trends, stocks_trends],
+        [FileResource(TRENDS_CHART)]))
+    pipeline.add(Stage('report', report, [stocks, bonds],
+        [FileResource(REPORT_FILE)]))
+    pipeline.add(Stage('fetch', fetch,
+        positions + [ValueResource('date', date.today())],
+        [FileResource(UPDATED_CHART)]))
+    return pipeline
+
+# Runs the stages of build_pipeline that are out of date
+def run_pipeline(portfolio, args):
+    results = build_pipeline(args).run(args.force)
+    for name, result in results.items():
+        print(f"{name:<10}{result}")
+
+# Returns the argument parser with every subcommand
+def build_parser():
+    parser = argparse.ArgumentParser(prog = 'stockcheck',
+        description = "Load, report and chart an investor's stocks.")
+    parser.add_argument('--db', help = "database file (default stocks.db)")
+    parser.add_argument('--investor-id', default = INVESTOR['investorID'])
+    parser.add_argument('--name', default = INVESTOR['name'])
+    parser.add_argument('--instrument', nargs = '?', const = '',
+        metavar = 'JSON', help = "print stage and SQL timings to stderr "
+        + "and optionally write them to JSON")
+    parser.add_argument('--profile', action = 'store_true',
+        help = "with --instrument, capture a cProfile of every stage")
+    parser.add_argument('--trace-memory', action = 'store_true',
+        help = "with --instrument, record the peak memory of every stage")
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    ingest = commands.add_parser('ingest',
+        help = "load positions and trend data into the database")
+    ingest.add_argument('--positions', nargs = '+', default = POSITION_FILES)
+    ingest.add_argument('--trends', default = TRENDS_FILE)
+    ingest.set_defaults(run = run_ingest)
+
+    report = commands.add_parser('report',
+        help = "write the position report from the database")
+    report.add_argument('--output', default = REPORT_FILE)
+    report.add_argument('--format', default = 'text',
+        choices = ['text', 'csv', 'jsonl'])
+    report.add_argument('--quiet', action = 'store_true')
+    report.add_argument('--stream', action = 'store_true',
+        help = "read positions in batches while writing")
+    report.set_defaults(run = run_report)
+
+    bonds = commands.add_parser('bonds',
+        help = "print yield, duration and convexity of the bonds held")
+    bonds.add_argument('--as-of', metavar = 'YYYY-MM-DD',
+        help = "settlement date (default today)")
+    bonds.set_defaults(run = run_bonds)
+
+    trends = commands.add_parser('trends', help = "print stored trend rows")
+    trends.add_argument('--symbol')
+    trends.add_argument('--start', metavar = 'YYYY-MM-DD')
+    trends.add_argument('--end', metavar = 'YYYY-MM-DD')
+    trends.set_defaults(run = run_trends)
+
+    chart = commands.add_parser('chart',
+        help = "chart the trends of the held stocks")
+    chart.add_argument('--positions', nargs = '+', default = POSITION_FILES)
+    chart.add_argument('--trends', default = TRENDS_FILE)
+    chart.add_argument('--output', default = TRENDS_CHART)
+    chart.add_argument('--method', default = 'lttb',
+        choices = ['lttb', 'minmax'])
+    chart.add_argument('--by-symbol', metavar = 'DIRECTORY')
+    chart.add_argument('--valuation', metavar = 'FILE',
+        help = "also chart the value of the book from purchase dates")
+    chart.set_defaults(run = run_chart)
+
+    fetch = commands.add_parser('fetch',
+        help = "fetch recent prices and chart them")
+    fetch.add_argument('--positions', nargs = '+', default = POSITION_FILES)
+    fetch.add_argument('--output', default = UPDATED_CHART)
+    fetch.add_argument('--years', type = int, default = 5)
+    fetch.add_argument('--offline', metavar = 'DIRECTORY',
+        help = "read prices from <DIRECTORY>/<SYMBOL>.json files")
+    fetch.set_defaults(run = run_fetch)
+
+    analytics = commands.add_parser('analytics',
+        help = "refresh and print the trend aggregates")
+    analytics.add_argument('--full', action = 'store_true',
+        help = "rebuild the aggregates instead of adding new rows")
+    analytics.add_argument('--top', type = int, default = 10,
+        help = "number of correlations to print")
+    analytics.set_defaults(run = run_analytics)
+
+    backtest = commands.add_parser('backtest',
+        help = "replay stored trends against the held stocks")
+    backtest.add_argument('--positions', nargs = '+',
+        default = POSITION_FILES)
+    backtest.add_argument('--start', metavar = 'YYYY-MM-DD')
+    backtest.add_argument('--end', metavar = 'YYYY-MM-DD')
+    backtest.add_argument('--scale', nargs = '+', type = float,
+        help = "add scenarios with every quantity multiplied")
+    backtest.add_argument('--shift-days', nargs = '+', type = int,
+        help = "add scenarios with purchases moved by days, bought at "
+        + "market")
+    backtest.add_argument('--scenarios', metavar = 'JSON',
+        help = "file with a list of scenarios, each a name and the "
+        + "quantities, purchase_dates or purchase_prices to change")
+    backtest.set_defaults(run = run_backtest)
+
+    batch = commands.add_parser('batch',
+        help = "write reports and valuations of many investors")
+    batch.add_argument('--output-dir', default = 'reports')
+    batch.add_argument('--investors', nargs = '+', metavar = 'ID',
+        help = "investor IDs to process (default every investor)")
+    batch.add_argument('--format', default = 'text',
+        choices = ['text', 'csv', 'jsonl'])
+    batch.add_argument('--workers', type = int)
+    batch.set_defaults(run = run_batch_mode)
+
+    archive = commands.add_parser('archive',
+        help = "convert trend data to and from the archive format")
+    archive.add_argument('action', choices = ['pack', 'unpack', 'info'])
+    archive.add_argument('source', help = "JSON file to pack or archive")
+    archive.add_argument('target', nargs = '?',
+        help = "archive or JSON file to write")
+    archive.add_argument('--codec', default = 'zlib',
+        choices = ['zlib', 'bz2', 'lzma'])
+    archive.set_defaults(run = run_archive)
+
+    watch = commands.add_parser('watch',
+        help = "keep loading new files that land in a directory")
+    watch.add_argument('--directory', default = 'data')
+    watch.add_argument('--interval', type = float, default = 2.0,
+        help = "seconds between polls of the directory")
+    watch.add_argument('--workers', type = int)
+    watch.add_argument('--max-pending', type = int, default = 8,
+        help = "most files parsed or waiting to be written at once")
+    watch.add_argument('--once', action = 'store_true',
+        help = "load the files already there and exit")
+    watch.set_defaults(run = run_watch)
+
+    everything = commands.add_parser('all',
+        help = "run every stage like the original script")
+    everything.add_argument('--positions', nargs = '+',
+        default = POSITION_FILES)
+    everything.add_argument('--trends', default = TRENDS_FILE)
+    everything.set_defaults(run = run_all)
+
+    run = commands.add_parser('run',
+        help = "run only the stages whose inputs changed")
+    run.add_argument('--positions', nargs = '+', default = POSITION_FILES)
+    run.add_argument('--trends', default = TRENDS_FILE)
+    run.add_argument('--state', default = '.pipeline_state.json',
+        help = "file holding the fingerprints of the last run")
+    run.add_argument('--workers', type = int, default = 4)
+    run.add_argument('--force', action = 'store_true',
+        help = "run every stage even if it is up to date")
+    run.set_defaults(run = run_pipeline)
+    return parser
+
+# Entry point of the command line interface
+def main(argv = None):
+    args = build_parser().parse_args(argv)
+    args.instruments = None
+    if args.instrument is not None:
+        from instrumentation import Instrumentation
+        args.instruments = Instrumentation(args.profile, args.trace_memory)
+    try:
+        args.run(make_portfolio(args), args)
+    finally:
+        if args.instruments:
+            print(args.instruments.summary(), file = sys.stderr)
+            if args.instrument:
+                args.instruments.write_json(args.instrument)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
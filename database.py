@@ -0,0 +1,113 @@
+##########################################################################
+# Author: David Beltran
+# File: database.py
+# Date: August 19, 2022
+# This module holds the Database class. Used to share one tuned SQLite
+# connection per thread between the Portfolio methods and to group
+# writes into single transactions.
+##########################################################################
+
+# Standard libary imports
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Application author designed module imports
+from instrumentation import NULL_INSTRUMENTATION
+
+# Global variable with the database file used when no path is given.
+# Can be overridden with the STOCKCHECK_DB environment variable.
+DB_PATH = os.environ.get('STOCKCHECK_DB', 'stocks.db')
+
+# Global variable with pragmas applied to every new connection
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,
+}
+
+class Database:
+
+    # Class constructor. commits counts the transactions committed
+    # through this object, which SQLite's data_version pragma does not
+    # report to the connection that made them.
+    def __init__(self, path = DB_PATH, pragmas = None):
+        self.path = str(path)
+        self.pragmas = dict(PRAGMAS)
+        self.pragmas.update(pragmas or {})
+        self.instruments = NULL_INSTRUMENTATION
+        self.commits = 0
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__connections = []
+
+    def get_path(self):
+        return self.path
+
+    # Sets the Instrumentation object that times SQL statements
+    def set_instruments(self, instruments):
+        self.instruments = instruments
+
+    # Returns the connection of the calling thread, opening and tuning it
+    # on first use. Connections are reused for the life of the object.
+    def connect(self):
+        conn = getattr(self.__local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread = False)
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            self.__local.conn = conn
+            self.__local.depth = 0
+            with self.__lock:
+                self.__connections.append(conn)
+        return conn
+
+    # Context manager that yields a cursor inside one transaction. The
+    # transaction is begun explicitly so schema changes are covered too,
+    # committed when the block ends and rolled back if it raises. Nested
+    # blocks join the outer transaction. An immediate transaction takes
+    # the write lock when it begins, for read-then-write blocks that
+    # other processes may run at the same time.
+    @contextmanager
+    def transaction(self, immediate = False):
+        conn = self.connect()
+        cursor = self.instruments.wrap_cursor(conn.cursor())
+        if self.__local.depth:
+            self.__local.depth += 1
+            try:
+                yield cursor
+            finally:
+                self.__local.depth -= 1
+            return
+        self.__local.depth = 1
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield cursor
+            conn.commit()
+            with self.__lock:
+                self.commits += 1
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.__local.depth = 0
+
+    # Runs a read query on the calling thread's connection
+    def execute(self, sql, params = ()):
+        if self.instruments.enabled:
+            return self.instruments.wrap_cursor(
+                self.connect().cursor()).execute(sql, params)
+        return self.connect().execute(sql, params)
+
+    # Closes every connection opened by this object
+    def close(self):
+        with self.__lock:
+            for conn in self.__connections:
+                conn.close()
+            self.__connections = []
+        self.__local = threading.local()
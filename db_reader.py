@@ -0,0 +1,128 @@
+##########################################################################
+# Author: David Beltran
+# File: db_reader.py
+# Date: August 19, 2022
+# This module holds the streaming readers of the stocks database. Rows
+# are fetched in fetchmany batches and Stock and Bond objects are built
+# only as they are consumed, so large tables are read in constant memory.
+# Pages are read with keyset pagination, which seeks straight to the key
+# after the last row of the previous page instead of counting an OFFSET.
+##########################################################################
+
+# Standard libary imports
+from datetime import datetime
+
+# Application author designed module imports
+from bond import Bond, FREQUENCY
+from stock import Stock
+
+# Global variable with the number of rows fetched per batch
+FETCH_SIZE = 1000
+
+# Global variable with the default number of rows per page
+PAGE_SIZE = 500
+
+# Position tables and the class built from their rows
+POSITION_TABLES = {'stocks': Stock, 'bonds': Bond}
+
+# Yields the rows of an executed cursor, fetched size rows at a time
+def iter_rows(cursor, size = FETCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+# Private helper that returns the WHERE clause and parameters of the
+# optional filters, joined with AND
+def _where(filters):
+    clauses = [clause for clause, value in filters if value is not None]
+    params = [value for clause, value in filters if value is not None]
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+# Private helper that returns the filters of a trend query
+def _trend_filters(symbol, start, end):
+    return [("symbol = ?", symbol.upper() if symbol else None),
+        ("price_date >= ?", str(start) if start else None),
+        ("price_date <= ?", str(end) if end else None)]
+
+# Yields the stocks_trends rows matching the filters in (symbol,
+# price_date) order. Dates are ISO dates and both ends are inclusive.
+def iter_trend_rows(db, symbol = None, start = None, end = None,
+        size = FETCH_SIZE):
+    where, params = _where(_trend_filters(symbol, start, end))
+    yield from iter_rows(db.execute("SELECT * FROM stocks_trends" + where
+        + " ORDER BY symbol, price_date", params), size)
+
+# Returns one page of stocks_trends rows after the (symbol, price_date)
+# key after, and the key to pass for the next page or None after the
+# last page
+def read_trend_page(db, after = None, limit = PAGE_SIZE, symbol = None,
+        start = None, end = None):
+    where, params = _where(_trend_filters(symbol, start, end))
+    if after is not None:
+        where += (" AND " if where else " WHERE ") + \
+            "(symbol, price_date) > (?, ?)"
+        params += list(after)
+    rows = db.execute("SELECT * FROM stocks_trends" + where
+        + " ORDER BY symbol, price_date LIMIT ?", params + [limit]).fetchall()
+    return rows, (tuple(rows[-1][:2]) if len(rows) == limit else None)
+
+# Yields the pages of stocks_trends rows matching the filters
+def iter_trend_pages(db, limit = PAGE_SIZE, symbol = None, start = None,
+        end = None):
+    after = None
+    while True:
+        rows, after = read_trend_page(db, after, limit, symbol, start, end)
+        if rows:
+            yield rows
+        if after is None:
+            return
+
+# Builds a Stock or Bond object from a row of the stocks or bonds table
+def position_from_row(table, row):
+    purchase_date = datetime.strptime(row[6], '%Y-%m-%d').date()
+    if table == 'bonds':
+        maturity_date = (datetime.strptime(row[9], '%Y-%m-%d').date()
+            if row[9] else None)
+        return Bond(row[0], row[2], row[3], row[4], row[5], purchase_date,
+            row[7], row[8], maturity_date, row[10] or FREQUENCY)
+    return Stock(row[0], row[2], row[3], row[4], row[5], purchase_date)
+
+# Private helper that returns the filters of a position query
+def _position_filters(investor_id, symbol):
+    return [("investor_id = ?",
+            str(investor_id) if investor_id is not None else None),
+        ("symbol = ?", symbol.upper() if symbol else None)]
+
+# Yields the (table, row) pairs of an investor's positions, stocks first,
+# optionally only for one symbol
+def iter_position_rows(db, investor_id = None, symbol = None,
+        tables = POSITION_TABLES, size = FETCH_SIZE):
+    where, params = _where(_position_filters(investor_id, symbol))
+    for table in tables:
+        for row in iter_rows(db.execute(f"SELECT * FROM {table}" + where
+                + " ORDER BY rowid", params), size):
+            yield table, row
+
+# Yields Stock and Bond objects of an investor's positions, each built
+# when it is reached
+def iter_positions(db, investor_id = None, symbol = None,
+        tables = POSITION_TABLES, size = FETCH_SIZE):
+    for table, row in iter_position_rows(db, investor_id, symbol, tables,
+            size):
+        yield position_from_row(table, row)
+
+# Returns one page of rows of the stocks or bonds table after the rowid
+# after, as (rowid, row) pairs, and the rowid to pass for the next page
+# or None after the last page
+def read_position_page(db, table, after = 0, limit = PAGE_SIZE,
+        investor_id = None, symbol = None):
+    if table not in POSITION_TABLES:
+        raise ValueError(f"Unknown position table, {table}")
+    filters = _position_filters(investor_id, symbol) + [("rowid > ?", after)]
+    where, params = _where(filters)
+    rows = db.execute(f"SELECT rowid, * FROM {table}" + where
+        + " ORDER BY rowid LIMIT ?", params + [limit]).fetchall()
+    page = [(row[0], row[1:]) for row in rows]
+    return page, (page[-1][0] if len(page) == limit else None)
@@ -0,0 +1,461 @@
+##########################################################################
+# Author: David Beltran
+# File: ingest_daemon.py
+# Date: August 19, 2022
+# This module holds the IngestDaemon class. Used to keep loading position
+# CSV files and trend JSON files or archives as they land in a directory.
+# A watcher thread polls the directory, a process pool parses new files
+# and a single writer thread loads them in batched transactions. Workers
+# pickle the rows in batches of BATCH_ROWS to a spool file that the
+# writer reads back one batch at a time, so rows never cross the process
+# boundary as a whole file. At most max_pending files are parsed or
+# waiting to be written, so the watcher waits while the writer is behind.
+# Every file content is loaded once: its hash is recorded in the
+# ingested_files table in the same transaction as its rows.
+##########################################################################
+
+# Standard libary imports
+import csv
+import itertools
+import os
+import pickle
+import queue
+import shutil
+import signal
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# Application author designed module imports
+from json_stream import iter_json_array
+from position_loader import detect_schema, iter_position_rows
+from schema import migrate, reserve_purchase_ids, iso_trend_date, trend_price
+from schema import bump_table_versions, upsert_trend_rows
+from schema import advance_trend_marks, record_ingested_file
+from trend_cache import file_digest
+
+# File suffixes the daemon loads
+SUFFIXES = ('.csv', '.json', '.stka')
+
+# Seconds between polls of the directory
+POLL_INTERVAL = 2.0
+
+# Most files parsed or waiting to be written at once
+MAX_PENDING = 8
+
+# Most files written in one transaction and rows per spooled batch
+BATCH_FILES = 16
+BATCH_ROWS = 5000
+
+# Record with a parsed file. Kind is 'stock', 'bond' or 'trend', or None
+# for a file without rows. Spool is the file holding the row batches, or
+# None. Errors are messages about rows or the file.
+ParsedFile = namedtuple('ParsedFile',
+    ['path', 'content_hash', 'kind', 'spool', 'row_count', 'errors'])
+
+# Private generator that yields the stocks_trends rows of a trend JSON
+# file or archive
+def _iter_trend_rows(path):
+    from trend_archive import TrendArchive, is_archive
+    if not is_archive(path):
+        with open(path, encoding = 'utf-8') as f:
+            for trend in iter_json_array(f):
+                yield (trend['Symbol'], iso_trend_date(trend['Date']),
+                    trend_price(trend['Open']), trend_price(trend['High']),
+                    trend_price(trend['Low']), trend['Close'],
+                    trend['Volume'])
+        return
+    import numpy as np
+    with TrendArchive(path) as archive:
+        for symbol, columns in archive.items():
+            prices = [np.where(np.isnan(columns[name]), None,
+                columns[name]).tolist()
+                for name in ('Opens', 'Highs', 'Lows', 'Closes')]
+            yield from zip([symbol] * len(columns['Dates']),
+                columns['Dates'].astype(str).tolist(), *prices,
+                columns['Volumes'].astype(np.int64).tolist())
+
+# Private function that pickles rows to the spool file f in batches of
+# BATCH_ROWS and returns the number of rows
+def _spool_rows(rows, f):
+    rows, count = iter(rows), 0
+    for batch in iter(lambda: list(itertools.islice(rows, BATCH_ROWS)), []):
+        pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+        count += len(batch)
+    return count
+
+# Private function that spools the rows of a position CSV file to f and
+# returns its kind and number of rows. Rows that cannot be parsed are
+# appended to errors.
+def _spool_positions(path, f, errors):
+    with open(path, newline = '') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        if header is None:
+            return None, 0
+        kind, columns = detect_schema(header)
+        return kind, _spool_rows(iter_position_rows(reader, kind, columns,
+            path, errors), f)
+
+# Generator that yields the row batches of a spool file
+def read_spool(spool):
+    with open(spool, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+# Parses the file of a (path, content_hash, spool_dir) job in a worker
+# process into a spool file in spool_dir and returns a ParsedFile. A file
+# that cannot be read, or that changed since it was hashed, is returned
+# without a spool, to be picked up again once it changes.
+def parse_file(job):
+    path, content_hash, spool_dir = job
+    errors = []
+    fd, spool = tempfile.mkstemp(suffix = '.spool', dir = spool_dir)
+    try:
+        with open(fd, 'wb') as f:
+            if path.lower().endswith('.csv'):
+                kind, count = _spool_positions(path, f, errors)
+            else:
+                kind, count = 'trend', _spool_rows(_iter_trend_rows(path), f)
+        if file_digest(path) != content_hash:
+            kind, errors = None, ["file changed while it was read"]
+    except (OSError, ValueError) as error:
+        kind, errors = None, [str(error)]
+    except BaseException:
+        os.remove(spool)
+        raise
+    if kind is None:
+        os.remove(spool)
+        return ParsedFile(path, content_hash, None, None, 0, errors)
+    return ParsedFile(path, content_hash, kind, spool, count,
+        [f"line {error.line}: {error.message}" for error in errors])
+
+# Private initializer of the worker processes. Ctrl+C is left to the
+# daemon, which stops the pool once the queued files are written.
+def _ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class IngestDaemon:
+
+    # Class constructor. Position files are loaded for investor. A
+    # QueryCache can be given to drop its results as soon as the daemon
+    # writes; other caches see the bumped table versions.
+    def __init__(self, db, directory, investor, interval = POLL_INTERVAL,
+            max_workers = None, max_pending = MAX_PENDING,
+            batch_files = BATCH_FILES, cache = None):
+        self.db = db
+        self.directory = directory
+        self.investor = investor
+        self.interval = interval
+        self.max_workers = max_workers
+        self.batch_files = batch_files
+        self.cache = cache
+        self.stats = {'queued': 0, 'ingested': 0, 'duplicates': 0,
+            'rows': 0, 'failed': 0}
+        self.pool = None
+        self.__spool_dir = None
+        self.__slots = threading.BoundedSemaphore(max_pending)
+        self.__ready = queue.Queue()
+        self.__stopping = threading.Event()
+        self.__lock = threading.Lock()
+        self.__signatures, self.__handled = {}, {}
+        self.__known, self.__pending = set(), set()
+        self.__threads = []
+
+    # Migrates the database, reads the hashes already loaded and starts
+    # the worker pool, the writer thread and, if watch is set, the
+    # watcher thread
+    def start(self, watch = True):
+        migrate(self.db)
+        self.__known = {row[0] for row in self.db.execute(
+            "SELECT content_hash FROM ingested_files")}
+        self.__spool_dir = tempfile.mkdtemp(prefix = 'ingest-')
+        self.pool = ProcessPoolExecutor(max_workers = self.max_workers,
+            initializer = _ignore_interrupts)
+        targets = [self.__write_loop] + ([self.__watch_loop] if watch else [])
+        for target in targets:
+            thread = threading.Thread(target = target, daemon = True)
+            thread.start()
+            self.__threads.append(thread)
+
+    # Stops polling, lets the writer finish the files already queued,
+    # shuts the worker pool down and removes the spool directory
+    def stop(self):
+        self.__stopping.set()
+        self.__ready.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.__spool_dir is not None:
+            shutil.rmtree(self.__spool_dir, ignore_errors = True)
+            self.__spool_dir = None
+
+    # Runs until interrupted, or with once set, loads the files already in
+    # the directory and returns. Returns the stats.
+    def run(self, once = False):
+        self.start(watch = not once)
+        try:
+            if once:
+                self.poll(settle = False)
+                self.wait_idle()
+            else:
+                while not self.__stopping.wait(3600):
+                    pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        return self.stats
+
+    # Blocks until every queued file has been written or given up on
+    def wait_idle(self, step = 0.05):
+        while True:
+            with self.__lock:
+                if not self.__pending:
+                    return
+            self.__stopping.wait(step)
+
+    # Private method of the watcher thread
+    def __watch_loop(self):
+        while not self.__stopping.is_set():
+            self.poll()
+            self.__stopping.wait(self.interval)
+
+    # Scans the directory once and queues every new or changed file whose
+    # content was not loaded before. With settle set, a file is only
+    # queued once its size and modification time are unchanged since the
+    # last poll, so files still being written are left alone. Returns the
+    # number of files queued.
+    def poll(self, settle = True):
+        queued = 0
+        try:
+            entries = sorted(os.scandir(self.directory),
+                key = lambda entry: entry.name)
+        except OSError as error:
+            print(f"Cannot read {self.directory}: {error}")
+            return 0
+        for entry in entries:
+            if not entry.name.lower().endswith(SUFFIXES) or \
+                    not entry.is_file():
+                continue
+            path = os.path.abspath(entry.path)
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self.__signatures.get(path)
+            self.__signatures[path] = signature
+            if self.__handled.get(path) == signature or \
+                    (settle and previous != signature):
+                continue
+            self.__handled[path] = signature
+            try:
+                content_hash = file_digest(path)
+            except OSError:
+                continue
+            with self.__lock:
+                if content_hash in self.__known or \
+                        content_hash in self.__pending:
+                    continue
+                self.__pending.add(content_hash)
+            if not self.__acquire():
+                with self.__lock:
+                    self.__pending.discard(content_hash)
+                break
+            self.__ready.put((path, content_hash,
+                self.pool.submit(parse_file,
+                (path, content_hash, self.__spool_dir))))
+            self.stats['queued'] += 1
+            queued += 1
+        return queued
+
+    # Private method that waits for a free slot in the pipeline. Returns
+    # False if the daemon is stopping.
+    def __acquire(self):
+        while not self.__stopping.is_set():
+            if self.__slots.acquire(timeout = 0.5):
+                return True
+        return False
+
+    # Private method of the writer thread. Files are written in the order
+    # they were queued, up to batch_files per transaction.
+    def __write_loop(self):
+        done = False
+        while not done:
+            batch = [self.__ready.get()]
+            while len(batch) < self.batch_files:
+                try:
+                    batch.append(self.__ready.get_nowait())
+                except queue.Empty:
+                    break
+            done = None in batch
+            parsed = []
+            for job in batch:
+                if job is None:
+                    continue
+                path, content_hash, future = job
+                try:
+                    parsed.append(future.result())
+                except Exception as error:
+                    parsed.append(ParsedFile(path, content_hash, None, None,
+                        0, [f"parse failed, {error}"]))
+            if parsed:
+                self.__write_batch(parsed)
+
+    # Private method that writes parsed files in one transaction. If the
+    # transaction fails, each file is tried again on its own so one bad
+    # file does not hold back the others. Errors never stop the writer.
+    def __write_batch(self, batch):
+        results, modified = [], set()
+        try:
+            with self.db.transaction(immediate = True) as c:
+                for parsed in batch:
+                    results.append(self.__write_file(c, parsed, modified))
+                if modified:
+                    self.__modified(c, modified)
+        except Exception as error:
+            if len(batch) > 1:
+                for parsed in batch:
+                    self.__write_batch([parsed])
+            else:
+                self.__finish(batch[0], f"write failed, {error}")
+            return
+        for parsed, (status, count, replaced) in zip(batch, results):
+            with self.__lock:
+                self.__known.difference_update(replaced)
+                if status == 'ingested':
+                    self.__known.add(parsed.content_hash)
+            self.__finish(parsed, status, count)
+        if 'stocks_trends' in modified:
+            self.__refresh_analytics()
+
+    # Private method that refreshes the trend analytics once trend rows
+    # were written. An error is reported and the writer keeps going.
+    def __refresh_analytics(self):
+        try:
+            from analytics import TrendAnalytics
+            TrendAnalytics(self.db).refresh()
+        except Exception as error:
+            print(f"Could not refresh trend analytics: {error}", flush = True)
+
+    # Private method that writes one parsed file with cursor c and adds
+    # the tables it changed to modified. Returns the status, the number
+    # of rows written and the hashes of the contents it replaced.
+    def __write_file(self, c, parsed, modified):
+        if parsed.kind is None and parsed.errors:
+            return 'failed', 0, []
+        if c.execute("SELECT 1 FROM ingested_files WHERE content_hash = ?",
+                (parsed.content_hash,)).fetchone():
+            return 'duplicate', 0, []
+        investor_id, first, last, replaced = None, None, None, []
+        count = 0
+        if parsed.kind in ('stock', 'bond'):
+            investor_id = str(self.investor.get_ID())
+            replaced = self.__remove_replaced(c, parsed.path, investor_id,
+                modified)
+            first, last = self.__write_positions(c, parsed, investor_id)
+            if first is not None:
+                count = last - first + 1
+                modified.add('bonds' if parsed.kind == 'bond' else 'stocks')
+        elif parsed.kind == 'trend':
+            count = self.__write_trends(c, parsed.spool)
+            if count:
+                modified.add('stocks_trends')
+        record_ingested_file(c, parsed.content_hash, parsed.path,
+            parsed.kind or 'empty', investor_id, first, last, count)
+        return 'ingested', count, replaced
+
+    # Private method that removes the positions loaded from an earlier
+    # content of the file at path, which the new content replaces.
+    # Returns the hashes of the replaced contents.
+    def __remove_replaced(self, c, path, investor_id, modified):
+        replaced = c.execute("""SELECT content_hash, kind, first_id, last_id
+            FROM ingested_files WHERE path = ? AND investor_id = ?
+            AND first_id IS NOT NULL""", (path, investor_id)).fetchall()
+        for content_hash, kind, first, last in replaced:
+            table = 'bonds' if kind == 'bond' else 'stocks'
+            c.executemany(f"""DELETE FROM {table}
+                WHERE investor_id = ? AND stock_id = ?""",
+                [(investor_id, f"{investor_id}-{number}")
+                for number in range(first, last + 1)])
+            c.execute("DELETE FROM ingested_files WHERE content_hash = ?",
+                (content_hash,))
+            modified.add(table)
+        return [row[0] for row in replaced]
+
+    # Private method that inserts the spooled positions of a parsed file
+    # for the investor, one batch at a time. The write transaction keeps
+    # the IDs reserved for the batches consecutive. Returns the first and
+    # last purchase ID numbers given, or None for a file without rows.
+    def __write_positions(self, c, parsed, investor_id):
+        c.execute("""INSERT INTO investors VALUES (?, ?, ?, ?)
+            ON CONFLICT (investor_id) DO NOTHING""", (investor_id,
+            self.investor.get_name(), self.investor.get_address(),
+            self.investor.get_phone_number()))
+        first, last = None, None
+        for batch in read_spool(parsed.spool):
+            start = reserve_purchase_ids(self.db, investor_id, len(batch))
+            rows = [(f"{investor_id}-{number}", investor_id) + tuple(row)
+                for number, row in enumerate(batch, start)]
+            if parsed.kind == 'bond':
+                c.executemany("INSERT INTO bonds VALUES " +
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            else:
+                c.executemany(
+                    "INSERT INTO stocks VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            first = start if first is None else first
+            last = start + len(rows) - 1
+        return first, last
+
+    # Private method that upserts the spooled trend rows dated after each
+    # symbol's high-water mark, like Portfolio.fill_stock_trends_table,
+    # one batch at a time. Returns the number of rows written.
+    def __write_trends(self, c, spool):
+        marks = dict(c.execute(
+            "SELECT symbol, last_date FROM stocks_trends_marks"))
+        new_marks, count = {}, 0
+        for batch in read_spool(spool):
+            rows = [row for row in batch if row[1] > marks.get(row[0], '')]
+            for row in rows:
+                if row[1] > new_marks.get(row[0], ''):
+                    new_marks[row[0]] = row[1]
+            count += upsert_trend_rows(c, rows)
+        advance_trend_marks(c, new_marks)
+        return count
+
+    # Private method that bumps the versions of the changed tables inside
+    # the write transaction of cursor c
+    def __modified(self, c, tables):
+        if self.cache is not None:
+            self.cache.invalidate(c, sorted(tables))
+        else:
+            bump_table_versions(c, sorted(tables))
+
+    # Private method that reports a file as done, removes its spool and
+    # frees its slot
+    def __finish(self, parsed, status, count = 0):
+        if parsed.spool is not None:
+            try:
+                os.remove(parsed.spool)
+            except OSError:
+                pass
+        errors = parsed.errors
+        if status == 'ingested':
+            print(f"Loaded {parsed.path}: {count} {parsed.kind or ''} "
+                + "row(s)" + (f", {len(errors)} row(s) skipped"
+                if errors else "") + ".", flush = True)
+        elif status != 'duplicate':
+            print(f"Could not load {parsed.path}: "
+                + "; ".join(errors[:3] or [status]), flush = True)
+        with self.__lock:
+            self.__pending.discard(parsed.content_hash)
+        key = {'ingested': 'ingested', 'duplicate': 'duplicates'}.get(
+            status, 'failed')
+        self.stats[key] += 1
+        self.stats['rows'] += count
+        self.__slots.release()
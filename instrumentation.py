@@ -0,0 +1,211 @@
+##########################################################################
+# Author: David Beltran
+# File: instrumentation.py
+# Date: August 19, 2022
+# This module holds the opt-in instrumentation of the application. An
+# Instrumentation object records wall and CPU time per stage, row
+# counters and SQL statement timings, and can capture a cProfile and a
+# tracemalloc peak per stage. The shared NULL_INSTRUMENTATION object is
+# used when instrumentation is off and does no work.
+##########################################################################
+
+# Standard libary imports
+import functools
+import io
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Global variable with the number of functions kept from each profile
+PROFILE_LINES = 25
+
+# Private helper that shortens SQL text to one line for use as a key
+def _statement_key(sql):
+    return " ".join(sql.split())[:120]
+
+# Cursor wrapper that times execute and executemany calls. Every other
+# attribute is passed through to the wrapped cursor.
+class TimedCursor:
+
+    # Class constructor
+    def __init__(self, cursor, instruments):
+        self.cursor = cursor
+        self.instruments = instruments
+
+    def execute(self, sql, params = ()):
+        start = time.perf_counter()
+        self.cursor.execute(sql, params)
+        self.instruments.record_sql(sql, time.perf_counter() - start, 1)
+        return self
+
+    def executemany(self, sql, rows):
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        start = time.perf_counter()
+        self.cursor.executemany(sql, rows)
+        self.instruments.record_sql(sql, time.perf_counter() - start,
+            len(rows))
+        return self
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class Instrumentation:
+
+    # Class constructor. profile captures a cProfile of every outermost
+    # stage and trace_memory records their tracemalloc peaks.
+    def __init__(self, profile = False, trace_memory = False):
+        self.enabled = True
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.stages, self.counters, self.sql, self.profiles = {}, {}, {}, {}
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    # Context manager that times a stage. Nested stages are recorded
+    # separately; profiles and memory peaks cover outermost stages only.
+    @contextmanager
+    def stage(self, name):
+        depth = getattr(self.__local, 'depth', 0)
+        outer = depth == 0
+        profiler = None
+        if self.profile and outer:
+            import cProfile
+            profiler = cProfile.Profile()
+        tracing = (self.trace_memory and outer and
+            not tracemalloc.is_tracing())
+        if tracing:
+            tracemalloc.start()
+        self.__local.depth = depth + 1
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self.__local.depth = depth
+            peak = None
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+                tracemalloc.stop()
+            with self.__lock:
+                record = self.stages.setdefault(name, {'calls': 0,
+                    'wall': 0.0, 'cpu': 0.0, 'peak_mb': None})
+                record['calls'] += 1
+                record['wall'] += wall
+                record['cpu'] += cpu
+                if peak is not None:
+                    record['peak_mb'] = max(record['peak_mb'] or 0, peak)
+                if profiler:
+                    self.profiles[name] = self.__profile_text(profiler)
+
+    # Private method that returns the top functions of a profile by
+    # cumulative time
+    def __profile_text(self, profiler):
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(profiler, stream = out).sort_stats(
+            'cumulative').print_stats(PROFILE_LINES)
+        return out.getvalue()
+
+    # Adds n to a named counter, such as the rows handled by a stage
+    def count(self, name, n = 1):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # Records the time of one SQL call and the rows it was given
+    def record_sql(self, sql, seconds, rows):
+        key = _statement_key(sql)
+        with self.__lock:
+            record = self.sql.setdefault(key, {'calls': 0, 'seconds': 0.0,
+                'rows': 0})
+            record['calls'] += 1
+            record['seconds'] += seconds
+            record['rows'] += rows
+
+    # Returns a cursor that times its statements
+    def wrap_cursor(self, cursor):
+        return TimedCursor(cursor, self)
+
+    # Returns every measurement as a dictionary
+    def report(self):
+        with self.__lock:
+            return {'stages': {name: dict(record)
+                    for name, record in self.stages.items()},
+                'counters': dict(self.counters),
+                'sql': {key: dict(record)
+                    for key, record in self.sql.items()},
+                'profiles': dict(self.profiles)}
+
+    # Writes the report to a JSON file
+    def write_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent = 1)
+
+    # Returns the report as a text summary, slowest stages and
+    # statements first
+    def summary(self):
+        report = self.report()
+        lines = ["{:<32}{:>7}{:>11}{:>11}{:>10}".format('Stage', 'Calls',
+            'Wall (s)', 'CPU (s)', 'Peak MB')]
+        for name, record in sorted(report['stages'].items(),
+                key = lambda item: -item[1]['wall']):
+            peak = record['peak_mb']
+            lines.append("{:<32}{:>7}{:>11.4f}{:>11.4f}{:>10}".format(name,
+                record['calls'], record['wall'], record['cpu'],
+                '-' if peak is None else f"{peak:.2f}"))
+        if report['counters']:
+            lines.append("")
+            for name, value in sorted(report['counters'].items()):
+                lines.append(f"{name:<50}{value:>12}")
+        if report['sql']:
+            lines.append("")
+            lines.append("{:<70}{:>7}{:>11}{:>10}".format('SQL', 'Calls',
+                'Seconds', 'Rows'))
+            for key, record in sorted(report['sql'].items(),
+                    key = lambda item: -item[1]['seconds']):
+                lines.append("{:<70}{:>7}{:>11.4f}{:>10}".format(key[:68],
+                    record['calls'], record['seconds'], record['rows']))
+        return "\n".join(lines)
+
+# Instrumentation that records nothing. Used when instrumentation is off.
+class NullInstrumentation:
+
+    enabled = False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def count(self, name, n = 1):
+        pass
+
+    def record_sql(self, sql, seconds, rows):
+        pass
+
+    def wrap_cursor(self, cursor):
+        return cursor
+
+# Shared instance used by default
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+# Method decorator that runs the method inside a stage of the object's
+# instruments attribute. When instrumentation is off the method is
+# called directly.
+def timed_stage(name):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.instruments.enabled:
+                return method(self, *args, **kwargs)
+            with self.instruments.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,65 @@
+##########################################################################
+# Author: David Beltran
+# File: json_stream.py
+# Date: August 19, 2022
+# This module holds helpers that read a JSON array one record at a time
+# so large trend files can be loaded without holding the whole file
+# in memory.
+##########################################################################
+
+# Standard libary imports
+import json
+
+# Global variable with number of characters read from the file at a time
+CHUNK_SIZE = 1 << 16
+
+# Longest token a chunk boundary can cut before the decoder reports an
+# error at its start, like -Infinity or a \uXXXX escape
+TOKEN_SLACK = 10
+
+# Private helper that tells whether a decode error comes from a record
+# cut off at the end of the buffer rather than from malformed data
+def _is_truncated(error, size):
+    return error.msg.startswith('Unterminated string') or \
+        size - error.pos < TOKEN_SLACK
+
+# Generator that yields each record of a top level JSON array. Only the
+# current chunk and the record being decoded are kept in memory. A
+# malformed record raises ValueError without reading further.
+def iter_json_array(f, chunk_size = CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    buffer, pos, started, eof = '', 0, False, False
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or
+                (started and buffer[pos] == ',')):
+            pos += 1
+        if pos == len(buffer):
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError("JSON array was not closed")
+            buffer, pos = chunk, 0
+            continue
+        if not started:
+            if buffer[pos] != '[':
+                raise ValueError("JSON data is not an array")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as error:
+            if eof or not _is_truncated(error, len(buffer)):
+                raise
+        else:
+            # A number ending the buffer may go on in the next chunk
+            if end < len(buffer) or eof:
+                yield record
+                pos = end
+                continue
+        # Record is split across chunks, so more data is read. Reads grow
+        # with the record so long records are not copied quadratically.
+        chunk = f.read(max(chunk_size, len(buffer) - pos))
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
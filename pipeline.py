@@ -0,0 +1,194 @@
+##########################################################################
+# Author: David Beltran
+# File: pipeline.py
+# Date: August 19, 2022
+# This module holds a small pipeline engine. Each Stage declares the
+# resources it reads and writes. The Pipeline fingerprints them, skips
+# stages whose fingerprints match the last successful run and runs
+# independent stages concurrently.
+##########################################################################
+
+# Standard libary imports
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Global variable with the default file holding stage fingerprints
+STATE_FILE = '.pipeline_state.json'
+
+# Resource backed by a file. The fingerprint is its modification time and
+# size, or None if the file does not exist.
+class FileResource:
+
+    # Class constructor
+    def __init__(self, path):
+        self.path = path
+        self.key = 'file:' + os.path.abspath(path)
+
+    def fingerprint(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+# Resource backed by a database table. The fingerprint is the hashed
+# result of query, which should be cheap and change whenever the table
+# does. By default the row count and largest rowid are used.
+class TableResource:
+
+    # Class constructor
+    def __init__(self, db_path, table, query = None):
+        self.db_path = db_path
+        self.table = table
+        self.query = query or f"SELECT COUNT(*), MAX(rowid) FROM {table}"
+        self.key = f"table:{os.path.abspath(db_path)}:{table}"
+
+    def fingerprint(self):
+        if not os.path.exists(self.db_path):
+            return None
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(self.query).fetchall()
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+        return hashlib.sha1(repr(rows).encode()).hexdigest()
+
+# Resource holding a plain value, such as today's date for stages that
+# should run at most once a day
+class ValueResource:
+
+    # Class constructor
+    def __init__(self, name, value):
+        self.key = 'value:' + name
+        self.value = value
+
+    def fingerprint(self):
+        return str(self.value)
+
+# A unit of work with the resources it reads and writes. Stages listed in
+# after, and stages writing one of its inputs, finish before it starts.
+class Stage:
+
+    # Class constructor
+    def __init__(self, name, action, inputs = (), outputs = (), after = ()):
+        self.name = name
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+
+    # Returns the fingerprint of every input and output by resource key
+    def fingerprints(self):
+        return {resource.key: resource.fingerprint()
+            for resource in self.inputs + self.outputs}
+
+class Pipeline:
+
+    # Class constructor
+    def __init__(self, state_file = STATE_FILE, max_workers = 4):
+        self.state_file = state_file
+        self.max_workers = max_workers
+        self.stages = {}
+        self.__lock = threading.Lock()
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Stage {stage.name} was added twice")
+        self.stages[stage.name] = stage
+        return stage
+
+    # Private method that reads the fingerprints of the last run
+    def __read_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    # Private method that writes the fingerprints through a temporary file
+    def __write_state(self, state):
+        with open(self.state_file + '.tmp', 'w') as f:
+            json.dump(state, f, indent = 1, sort_keys = True)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    # Returns a dictionary of stage name to the names of the stages that
+    # must finish first
+    def dependencies(self):
+        writers = {}
+        for stage in self.stages.values():
+            for resource in stage.outputs:
+                writers.setdefault(resource.key, set()).add(stage.name)
+        deps = {}
+        for stage in self.stages.values():
+            needed = set(stage.after)
+            for resource in stage.inputs:
+                needed |= writers.get(resource.key, set())
+            needed.discard(stage.name)
+            unknown = needed - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage {stage.name} depends on unknown "
+                    + f"stage(s): {', '.join(sorted(unknown))}")
+            deps[stage.name] = needed
+        return deps
+
+    # Returns True if a stage has to run. A stage is stale when an output
+    # is missing or any fingerprint differs from its last successful run.
+    def is_stale(self, stage, state):
+        if any(resource.fingerprint() is None for resource in stage.outputs):
+            return True
+        return state.get(stage.name) != stage.fingerprints()
+
+    # Runs stale stages, each once its dependencies have finished, with up
+    # to max_workers stages at a time. Returns a dictionary of stage name
+    # to 'ran', 'skipped', 'failed' or 'blocked' (a dependency failed).
+    def run(self, force = False):
+        deps = self.dependencies()
+        state = self.__read_state()
+        results = {}
+        pending = dict(deps)
+        running = {}
+
+        def execute(stage):
+            if not force and not self.is_stale(stage, state):
+                return 'skipped'
+            stage.action()
+            with self.__lock:
+                state[stage.name] = stage.fingerprints()
+                self.__write_state(state)
+            return 'ran'
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+            while pending or running:
+                ready = [name for name, needed in pending.items()
+                    if needed <= set(results)]
+                while ready:
+                    for name in ready:
+                        del pending[name]
+                        if any(results[dep] in ('failed', 'blocked')
+                                for dep in deps[name]):
+                            results[name] = 'blocked'
+                        else:
+                            running[pool.submit(execute,
+                                self.stages[name])] = name
+                    ready = [name for name, needed in pending.items()
+                        if needed <= set(results)]
+                if not running:
+                    if pending:
+                        raise ValueError("Pipeline stages form a cycle: "
+                            + ", ".join(sorted(pending)))
+                    break
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as error:
+                        print(f"Stage {name} failed: {error}")
+                        results[name] = 'failed'
+        return results
@@ -8,381 +8,703 @@
 ##########################################################################
 
 # Standard libary imports
+import os
 from datetime import datetime
 from datetime import date
-import sqlite3
-import json 
-import matplotlib.pyplot as plt
-import numpy as np
-from yahoofinancials import YahooFinancials
-from dateutil.relativedelta import relativedelta
+import time
 
 # Application author designed module imports
 from bond import Bond
 from stock import Stock
+from json_stream import iter_json_array
+from database import Database
+from schema import migrate, reserve_purchase_ids, trend_price
+from schema import bump_table_versions, upsert_trend_rows
+from schema import advance_trend_marks, record_ingested_file
+from position_loader import read_positions, load_files
+from report_writer import write_report
+from instrumentation import NULL_INSTRUMENTATION, timed_stage
 
-# Global variable used to generate purhase IDs
-id_hold = 0
+# NumPy, Matplotlib, dateutil and the price history providers are
+# imported inside the methods that use them, so commands that only read
+# the database or write reports start without loading them.
+
+# Global variable with number of trend rows inserted per executemany batch
+TREND_BATCH_SIZE = 5000
 
 class Portfolio:
 
-    # Class constructor
-    def __init__(self, investor):
+    # Class constructor. A Database object can be given to share
+    # connections or to use a database file other than the default one.
+    # An Instrumentation object turns on stage and SQL timings. A
+    # QueryCache can be given to share cached reads between portfolios;
+    # otherwise one is made on the first cached read.
+    def __init__(self, investor, database = None, instruments = None,
+            cache = None):
         self.investor = investor
+        self.cache = cache
+        self.db = database if database is not None else Database()
+        self.instruments = instruments or NULL_INSTRUMENTATION
+        if self.instruments.enabled:
+            self.db.set_instruments(self.instruments)
         self.stocks, self.db_stocks = [], []
+        self.book, self.tracker = None, None
+        self.load_errors, self.sources = [], []
         self.dates, self.updated_stock_info = [], []
         self.symbols, self.updated_symbols = set(), set() 
         self.trends, self.updated_trends = {}, {} 
 
-    # Method reads a text file and instantiates Stock and Bond objects.
-    # Objects are then entered to self.stocks list. 
+    # Method reads a position file and instantiates Stock and Bond
+    # objects. Objects are then entered to self.stocks list. Rows that
+    # could not be stored are kept in self.load_errors.
+    @timed_stage('fill_report')
     def fill_report(self, filename):
-        try:
-            with open(filename) as f:
-                content = f.read().splitlines()
-        except FileNotFoundError:
-            print(f"File, {filename}, was not found.")
-        content = content[1:]
-
-        # For loop includes handling incorrect value type exceptions
-        for item in content:
-            stock_info = item.split(',')
-            try:
-                if len(stock_info) == 7:
-                    self.stocks.append(Bond(self.__generate_ID(),
-                    stock_info[0], float(stock_info[1]),
-                    float(stock_info[2]), float(stock_info[3]),
-                    datetime.strptime(stock_info[4], '%m/%d/%Y').date(),
-                    float(stock_info[5]), float(stock_info[6])))
-                elif len(stock_info) == 5:
-                    self.stocks.append(Stock(self.__generate_ID(),
-                    stock_info[0], float(stock_info[1]),
-                    float(stock_info[2]), float(stock_info[3]),
-                    datetime.strptime(stock_info[4], '%m/%d/%Y').date()))
-            except ValueError:
-                print(f"{stock_info[0]} was given an incorrect value type."
-                        + "Stock was not stored.")
-                pass 
-
-    # Private method that creates a stocks_trends table in the database
-    def __create_stock_trends_table(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("""CREATE TABLE stocks_trends (
-            symbol text,
-            price_date text,
-            open_price text,
-            high_price text,
-            low_price text,
-            close_price real,
-            volume real
-        )
-        """)
-        conn.commit()
-        conn.close()
-
-    # Private method that creates a stocks table in the database
-    def __create_stock_table(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("""CREATE TABLE stocks (
-            stock_id text,
-            investor_id text,
-            symbol text,
-            quantity real,
-            purchase_price real,
-            current_price real,
-            purchase_date text
-        )
-        """)
-        conn.commit()
-        conn.close()
-
-    # Private method that creates a bonds table in the database
-    def __create_bond_table(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("""CREATE TABLE bonds (
-            stock_id text,
-            investor_id text,
-            symbol text,
-            quantity real,
-            purchase_price real,
-            current_price real,
-            purchase_date text,
-            coupon real,
-            yield_perc real
-        )
-        """)
-        conn.commit()
-        conn.close()
-
-    # Method handles exception if tables already exist
-    # Method designed to create future tables
+        return self.__add_positions(read_positions(filename))
+
+    # Method loads several position files in parallel processes and adds
+    # their positions in the order the files were given
+    @timed_stage('fill_reports')
+    def fill_reports(self, filenames, max_workers = None):
+        errors = []
+        for result in load_files(filenames, max_workers):
+            errors += self.__add_positions(result)
+        return errors
+
+    # Private method that instantiates Stock and Bond objects from the
+    # rows of a LoadResult and returns its errors. Positions get
+    # provisional IDs in load order, which never match a stored ID, until
+    # fill_stock_bonds_tables gives them the purchase IDs of their
+    # database rows, so reading files writes nothing. The file and the
+    # slice of self.stocks it filled are kept in self.sources.
+    def __add_positions(self, result):
+        start = len(self.stocks)
+        if result.rows:
+            self.sources.append((result.filename, result.kind, start,
+                len(result.rows)))
+        position = Bond if result.kind == 'bond' else Stock
+        for number, row in enumerate(result.rows, start + 1):
+            self.stocks.append(position(f"tmp-{number}", *row))
+        self.instruments.count('positions.loaded', len(result.rows))
+        self.instruments.count('positions.rejected', len(result.errors))
+        # New positions are added to the columnar book used for metrics
+        if self.book is None:
+            from position_book import PositionBook
+            self.book = PositionBook()
+        self.book.extend(self.stocks[start:])
+        self.load_errors += result.errors
+        if result.errors:
+            print(f"{len(result.errors)} row(s) of {result.filename} " +
+                    "were not stored. See load_errors for details.")
+        return result.errors
+
+    # Method brings the database up to the latest schema version.
+    # Tables and indexes are created or migrated as needed.
+    @timed_stage('create_tables')
     def create_tables(self):
-        try:
-            self.__create_stock_table()
-            self.__create_bond_table()
-            self.__create_stock_trends_table()
-        except sqlite3.OperationalError:
-            pass
-
-    # Public method that fills stocks_trends database table with attributes
-    # from JSON data. Method also prepares JSON data to be used 
-    # for visualization. 
-    def fill_stock_trends_table(self, filename):
-        with open(filename, encoding = 'utf-8') as f:
-            all_trends_data =  json.load(f)
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
+        migrate(self.db)
+
+    # Public method that loads new rows into the stocks_trends table from
+    # JSON data. Records are streamed from the file and only rows dated
+    # after the symbol's high-water mark in stocks_trends_marks are
+    # upserted, in batches of batch_size rows inside one transaction.
+    # Re-running a file that was already loaded inserts nothing. Method
+    # also prepares JSON data to be used for visualization. Trend archives
+    # written by trend_archive.py are loaded too.
+    @timed_stage('fill_stock_trends_table')
+    def fill_stock_trends_table(self, filename, batch_size = TREND_BATCH_SIZE):
+        return self.__fill_trends(filename, batch_size)[0]
+
+    # Private method that loads a trend file like fill_stock_trends_table
+    # and merges its series into self.trends by date. The file is recorded
+    # in the ingested_files ledger in the same transaction, so the ingest
+    # daemon does not load its content a second time. Returns the rows
+    # inserted and the series of the file.
+    def __fill_trends(self, filename, batch_size):
+        from trend_archive import is_archive
+        from trend_cache import file_digest
         print("Loading data to database...")
-        trendings = []
-        for trend in all_trends_data:
-            trendings.append((trend['Symbol'], trend['Date'], trend['Open'],
-                trend['High'], trend['Low'], trend['Close'],
-                trend['Volume']))
-            if trend['Symbol'] not in self.symbols:
-                self.symbols.add(trend['Symbol'])
-                self.trends[trend['Symbol']] = {'Dates': [], 'Closes': []}
-            self.trends[trend['Symbol']]['Dates'].append(
-                datetime.strptime(trend['Date'], '%d-%b-%y'))
-            self.trends[trend['Symbol']]['Closes'].append(trend['Close'])
-        rows = c.execute("""SELECT * FROM stocks_trends""").fetchall()
-        if not rows:
-            c.executemany(
-                "INSERT INTO stocks_trends VALUES (?, ?, ?, ?, ?, ?, ?)",
-                trendings)
-            conn.commit()
-        else:
-            pass
-        conn.close()
+        start = time.perf_counter()
+        content_hash = file_digest(filename)
+        with self.db.transaction(immediate = True) as c:
+            if is_archive(filename):
+                inserted, trends = self.__fill_from_archive(filename,
+                    batch_size)
+            else:
+                inserted, trends = self.__fill_from_json(filename,
+                    batch_size)
+            record_ingested_file(c, content_hash, os.path.abspath(filename),
+                'trend', row_count = inserted)
+        self.__merge_trends(trends)
+        elapsed = time.perf_counter() - start
+        self.instruments.count('trends.inserted', inserted)
         print("Database table, \'stocks_trends\', " +
                 "has been filled with trend data.")
+        print(f"{inserted} rows loaded in {elapsed:.2f} seconds " +
+                f"({inserted / elapsed if elapsed else 0:.0f} rows/sec).")
+        if inserted:
+            self.refresh_analytics()
+        return inserted, trends
+
+    # Private method that merges trend columns by symbol into self.trends
+    # by date
+    def __merge_trends(self, trends):
+        from trend_archive import merge_trend_columns
+        for symbol, columns in trends.items():
+            if symbol in self.trends:
+                columns = merge_trend_columns(self.trends[symbol], columns)
+            self.trends[symbol] = columns
+            self.symbols.add(symbol)
+
+    # Private method that streams the records of a JSON trend file into
+    # the stocks_trends table. Returns the rows inserted and the trend
+    # columns of the file by symbol.
+    def __fill_from_json(self, filename, batch_size):
+        from trend_archive import trend_columns
+        inserted, loaded = 0, {}
+        with self.db.transaction(immediate = True) as c, \
+                open(filename, encoding = 'utf-8') as f:
+            marks = dict(c.execute(
+                "SELECT symbol, last_date FROM stocks_trends_marks"))
+            new_marks = {}
+            trendings = []
+            for trend in iter_json_array(f):
+                symbol = trend['Symbol']
+                price_date = datetime.strptime(trend['Date'], '%d-%b-%y')
+                iso_date = price_date.date().isoformat()
+                prices = (trend_price(trend['Open']),
+                    trend_price(trend['High']), trend_price(trend['Low']))
+                if symbol not in marks or iso_date > marks[symbol]:
+                    trendings.append((symbol, iso_date) + prices +
+                        (trend['Close'], trend['Volume']))
+                    if iso_date > new_marks.get(symbol, ''):
+                        new_marks[symbol] = iso_date
+                    if len(trendings) >= batch_size:
+                        inserted += upsert_trend_rows(c, trendings)
+                        trendings = []
+                if symbol not in loaded:
+                    loaded[symbol] = {'Dates': [], 'Opens': [],
+                        'Highs': [], 'Lows': [], 'Closes': [],
+                        'Volumes': []}
+                series = loaded[symbol]
+                series['Dates'].append(price_date)
+                series['Opens'].append(prices[0])
+                series['Highs'].append(prices[1])
+                series['Lows'].append(prices[2])
+                series['Closes'].append(trend['Close'])
+                series['Volumes'].append(trend['Volume'])
+            if trendings:
+                inserted += upsert_trend_rows(c, trendings)
+            advance_trend_marks(c, new_marks)
+            if inserted:
+                self.__modified(c, ['stocks_trends'])
+        return inserted, {symbol: trend_columns(series)
+            for symbol, series in loaded.items()}
+
+    # Private method that loads a trend archive into the stocks_trends
+    # table. Each symbol is read as whole columns and only rows after its
+    # high-water mark are upserted. Returns the rows inserted and the
+    # trend columns of the archive by symbol.
+    def __fill_from_archive(self, filename, batch_size):
+        import numpy as np
+        from trend_archive import TrendArchive
+        inserted, trends = 0, {}
+        with self.db.transaction(immediate = True) as c, \
+                TrendArchive(filename) as archive:
+            marks = dict(c.execute(
+                "SELECT symbol, last_date FROM stocks_trends_marks"))
+            new_marks = {}
+            for symbol, columns in archive.items():
+                dates = columns['Dates']
+                first = (np.searchsorted(dates, np.datetime64(marks[symbol]),
+                    side = 'right') if symbol in marks else 0)
+                if first < len(dates):
+                    iso_dates = dates[first:].astype(str).tolist()
+                    prices = [np.where(np.isnan(columns[name][first:]), None,
+                        columns[name][first:]).tolist()
+                        for name in ('Opens', 'Highs', 'Lows', 'Closes')]
+                    volumes = columns['Volumes'][first:].astype(np.int64)
+                    rows = list(zip([symbol] * len(iso_dates), iso_dates,
+                        *prices, volumes.tolist()))
+                    for i in range(0, len(rows), batch_size):
+                        inserted += upsert_trend_rows(c,
+                            rows[i:i + batch_size])
+                    new_marks[symbol] = iso_dates[-1]
+                trends[symbol] = columns
+            advance_trend_marks(c, new_marks)
+            if inserted:
+                self.__modified(c, ['stocks_trends'])
+        return inserted, trends
+
+    # Public method that brings the trend aggregate tables up to date.
+    # Only symbols with new trend rows are computed unless full is True.
+    # Returns the number of symbols refreshed.
+    @timed_stage('refresh_analytics')
+    def refresh_analytics(self, full = False):
+        from analytics import TrendAnalytics
+        refreshed = TrendAnalytics(self.db).refresh(full)
+        self.instruments.count('analytics.symbols', refreshed)
+        return refreshed
+
+    # Public method that prepares trend data for visualization from the
+    # columnar cache of a JSON file. When the cache is missing, stale or
+    # ahead of what stocks_trends holds, the file is loaded with
+    # fill_stock_trends_table and the cache is rewritten with the series
+    # of the file. Series are merged into self.trends by date.
+    @timed_stage('load_trends')
+    def load_trends(self, filename, cache = None):
+        from trend_cache import TrendCache
+        from trend_archive import is_archive
+        if is_archive(filename):
+            # Archives are read as columns already, so they are not cached
+            self.fill_stock_trends_table(filename)
+            return
+        cache = cache if cache is not None else TrendCache()
+        trends = cache.load(filename)
+        if trends is not None:
+            marks = dict(self.db.execute(
+                "SELECT symbol, last_date FROM stocks_trends_marks"))
+            for symbol, series in trends.items():
+                if (len(series['Dates']) and marks.get(symbol, '')
+                        < str(series['Dates'][-1])):
+                    trends = None
+                    break
+        if trends is None:
+            trends = self.__fill_trends(filename, TREND_BATCH_SIZE)[1]
+            cache.write(filename, trends)
+            return
+        print("Trend data loaded from cache.")
+        with self.db.transaction() as c:
+            record_ingested_file(c, cache.validate(filename)['sha256'],
+                os.path.abspath(filename), 'trend')
+        self.__merge_trends(trends)
+
+    # Public method that reads the dates and closes of symbols from the
+    # stocks_trends table into self.trends, for runs that do not parse
+    # the trend file
+    @timed_stage('load_trends_from_db')
+    def load_trends_from_db(self, symbols):
+        symbols = sorted(set(symbols))
+        for symbol in symbols:
+            dates, closes = self.trend_series(symbol)
+            if len(dates):
+                self.symbols.add(symbol)
+                self.trends[symbol] = {'Dates': dates, 'Closes': closes}
+        return self.trends
+
+    # Public method that returns the dates and closes of a symbol in the
+    # stocks_trends table between two ISO dates, as read-only arrays.
+    # Results are cached until stocks_trends changes.
+    def trend_series(self, symbol, start = None, end = None):
+        from db_reader import iter_trend_rows
+
+        def read():
+            import numpy as np
+            rows = [row for row in iter_trend_rows(self.db, symbol, start,
+                end) if row[5] is not None]
+            dates = np.array([row[1] for row in rows],
+                dtype = 'datetime64[D]')
+            closes = np.array([row[5] for row in rows], dtype = np.float64)
+            dates.setflags(write = False)
+            closes.setflags(write = False)
+            return dates, closes
+        return self.__cached('trend_series', (symbol.upper(), start, end),
+            ['stocks_trends'], read)
 
     # Public method that fills stocks and bonds database tables
-    # with attributes from objects created from text data
-    # Loop iteration utilized to prepare updated stock data
-    # for visualization.
+    # with attributes from objects created from text data. Positions of a
+    # table that already holds the investor's rows take their stored IDs,
+    # in row order. Only the positions past the stored rows, such as rows
+    # added to a file since it was last written, are written, and purchase
+    # IDs are only reserved for them. The source files are recorded in
+    # the ingested_files ledger, so the ingest daemon does not load their
+    # content a second time.
+    @timed_stage('fill_stock_bonds_tables')
     def fill_stock_bonds_tables(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        s_rows = c.execute("""
-            SELECT * FROM stocks
-            """).fetchall()
-        conn.commit()
-        b_rows = c.execute("""
-            SELECT * from bonds
-            """).fetchall()
-        conn.commit()
-        for stock in self.stocks:
-            if (isinstance(stock, Bond)) and (not b_rows):
-                c.execute("INSERT INTO bonds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (stock.get_purchaseID(), self.investor.get_ID(),
-                        stock.get_symbol(), stock.get_quantity(), 
-                        stock.get_purchase_price(), stock.get_current_price(),
-                        stock.get_purchase_date(), stock.get_coupon(),
-                        stock.get_yield_perc()))
-                conn.commit()
-            elif (not s_rows):
-                c.execute("INSERT INTO stocks VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (stock.get_purchaseID(), self.investor.get_ID(),
-                        stock.get_symbol(), stock.get_quantity(), 
-                        stock.get_purchase_price(), stock.get_current_price(),
-                        stock.get_purchase_date()))
-                conn.commit()
-            else:
-                pass
-            # Conditional statement utilizes for loop to prepare current
-            # stock data for visualization using yahoofinancials library
-            if not isinstance(stock, Bond):
-                financials = YahooFinancials(stock.get_symbol())
-                today = str(date.today())
-                before = str(date.today() - relativedelta(years = 5))
-                self.updated_stock_info.append(
-                    financials.get_historical_price_data(
-                        before, today, 'monthly'))
-        conn.close()
+        migrate(self.db)
+        investor_id = str(self.investor.get_ID())
+        tables = {'bonds': [], 'stocks': []}
+        for i, stock in enumerate(self.stocks):
+            tables['bonds' if isinstance(stock, Bond) else 'stocks'].append(i)
+        # Both tables are written in one transaction with one commit
+        with self.db.transaction(immediate = True) as c:
+            c.execute("""INSERT INTO investors VALUES (?, ?, ?, ?)
+                ON CONFLICT (investor_id) DO UPDATE SET name = excluded.name,
+                address = excluded.address,
+                phone_number = excluded.phone_number
+                """, (investor_id, self.investor.get_name(),
+                self.investor.get_address(),
+                self.investor.get_phone_number()))
+            modified, new, recorded = [], [], []
+            for table, rows in tables.items():
+                if not rows:
+                    continue
+                stored = [row[0] for row in c.execute(f"""SELECT stock_id
+                    FROM {table} WHERE investor_id = ? ORDER BY rowid""",
+                    (investor_id,))]
+                self.__set_IDs(rows, stored)
+                if len(stored) < len(rows):
+                    modified.append(table)
+                    new += rows[len(stored):]
+                if len(stored) <= len(rows):
+                    recorded.append(table)
+            if new:
+                new.sort()
+                first = reserve_purchase_ids(self.db, investor_id, len(new))
+                self.__set_IDs(new, [self.__purchase_ID(number)
+                    for number in range(first, first + len(new))])
+            bonds = set(tables['bonds'])
+            if 'bonds' in modified:
+                c.executemany(
+                    "INSERT INTO bonds VALUES " +
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [self.__position_row(investor_id, self.stocks[i])
+                    for i in new if i in bonds])
+            if 'stocks' in modified:
+                c.executemany(
+                    "INSERT INTO stocks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [self.__position_row(investor_id, self.stocks[i])
+                    for i in new if i not in bonds])
+            for filename, kind, start, count in self.sources:
+                if ('bonds' if kind == 'bond' else 'stocks') in recorded:
+                    self.__record_source(c, investor_id, filename, kind,
+                        self.stocks[start:start + count])
+            if modified:
+                self.__modified(c, modified)
+        self.instruments.count('positions.written', len(new))
+
+    # Private method that records a position file whose positions are
+    # stored in the ingested_files ledger with cursor c. The purchase ID
+    # numbers are kept when they are consecutive, so the daemon can
+    # replace the rows when the file changes. A file that can no longer
+    # be read is left out.
+    def __record_source(self, c, investor_id, filename, kind, positions):
+        from trend_cache import file_digest
+        try:
+            content_hash = file_digest(filename)
+        except OSError:
+            return
+        try:
+            numbers = [int(str(stock.get_purchaseID()).rsplit('-', 1)[-1])
+                for stock in positions]
+        except ValueError:
+            numbers = []
+        first, last = None, None
+        if numbers and numbers == list(range(numbers[0], numbers[-1] + 1)):
+            first, last = numbers[0], numbers[-1]
+        record_ingested_file(c, content_hash, os.path.abspath(filename),
+            kind, investor_id, first, last, len(positions))
+
+    # Private method that returns the stocks or bonds table row of a
+    # position
+    def __position_row(self, investor_id, stock):
+        row = (stock.get_purchaseID(), investor_id, stock.get_symbol(),
+            stock.get_quantity(), stock.get_purchase_price(),
+            stock.get_current_price(), stock.get_purchase_date())
+        if isinstance(stock, Bond):
+            row += (stock.get_coupon(), stock.get_yield_perc(),
+                stock.get_maturity_date(), stock.get_frequency())
+        return row
+
+    # Private method that gives the positions at indexes of self.stocks
+    # the purchase IDs ids, in the objects and in the book
+    def __set_IDs(self, indexes, ids):
+        for i, purchase_id in zip(indexes, ids):
+            self.stocks[i].set_purchaseID(purchase_id)
+            self.book.set_value(i, 'purchase_ids', purchase_id)
+
+    # Public method that prepares current stock data for visualization.
+    # Histories of every stock symbol are fetched concurrently through a
+    # price history provider, cached Yahoo Finance data by default. A
+    # FilePriceProvider can be given for offline runs.
+    @timed_stage('fetch_updated_trends')
+    def fetch_updated_trends(self, provider = None, years = 5,
+            interval = 'monthly', max_workers = None):
+        from price_history import CachedPriceProvider, YahooPriceProvider
+        from price_history import fetch_histories, MAX_WORKERS
+        from dateutil.relativedelta import relativedelta
+        if provider is None:
+            provider = CachedPriceProvider(YahooPriceProvider())
+        symbols = [stock.get_symbol() for stock in self.stocks
+            if not isinstance(stock, Bond)]
+        before = date.today() - relativedelta(years = years)
+        histories, errors = fetch_histories(provider, symbols, before,
+            date.today(), interval, max_workers or MAX_WORKERS)
+        for symbol, prices in histories.items():
+            self.updated_stock_info.append({symbol: {'prices': prices}})
+        for symbol, error in errors.items():
+            print(f"Price history for {symbol} could not be fetched: {error}")
+        return errors
 
     # Plots current stock data into a line graph. Data is from
     # yahoofinancials live updates
-    def chart_updated_trends(self, filename):
+    @timed_stage('chart_updated_trends')
+    def chart_updated_trends(self, filename, method = 'lttb'):
+        import numpy as np
+        from charting import render_line_chart
         for info in self.updated_stock_info:
             symbol = list(info.keys())[0]
-            if symbol not in self.updated_symbols:
-                self.updated_symbols.add(symbol)
-                self.updated_trends[symbol] = {'Dates': [], 'Closes': []}
-            count = 0
-            for month in info[symbol]['prices']:
-                self.updated_trends[symbol]['Dates'].append(
-                    datetime.strptime(
-                        info[symbol]['prices'][count]['formatted_date'],
-                        '%Y-%m-%d'))
-                self.updated_trends[symbol]['Closes'].append(
-                    info[symbol]['prices'][count]['close'])
-                count += 1
-        plt.style.use('_classic_test_patch')
-        fig, ax = plt.subplots(figsize = (13, 7))
-        for symbol in self.updated_symbols:
-            ax.plot(self.updated_trends[symbol]['Dates'],
-            self.updated_trends[symbol]['Closes'], label = symbol)
-        ax.legend(loc = 0)
-        ax.set_title("Updated trends of " + self.investor.get_name() +
-                "'s Stocks", fontsize = 24)
-        ax.set_xlabel('', fontsize = 10)
-        fig.autofmt_xdate()
-        ax.set_ylabel("Price", fontsize = 10)
-        ax.tick_params(axis = 'both', which = 'major', labelsize = 10)
-        plt.savefig(filename)
+            prices = info[symbol]['prices']
+            self.updated_symbols.add(symbol)
+            self.updated_trends[symbol] = {
+                'Dates': np.array([price['formatted_date']
+                    for price in prices], dtype = 'datetime64[D]'),
+                'Closes': np.array([price['close'] for price in prices],
+                    dtype = np.float64)}
+        render_line_chart(filename, [(symbol,
+            self.updated_trends[symbol]['Dates'],
+            self.updated_trends[symbol]['Closes'])
+            for symbol in self.updated_symbols],
+            "Updated trends of " + self.investor.get_name() + "'s Stocks",
+            method = method)
         print("\nGraph for recent trends created and saved on " +
                 filename + " file.\n")
-        
+
+    # Private method that returns the (label, dates, values) series of
+    # the held stocks, with closing prices multiplied by quantity
+    def __holding_series(self):
+        import numpy as np
+        return [(stock.get_symbol(), self.trends[stock.get_symbol()]['Dates'],
+            np.asarray(self.trends[stock.get_symbol()]['Closes'],
+                dtype = np.float64) * stock.get_quantity())
+            for stock in self.stocks if stock.get_symbol() in self.symbols]
 
     # Public method that plots stock price trends on a line graph.
-    # Data is from a JSON file with stock data 
-    def chart_trends(self, filename):
-        plt.style.use('_classic_test_patch')
-        fig, ax = plt.subplots(figsize = (13, 7))
-        # NumPy array utilized to multiply closing prices with
-        # Stock object's quantity. 
-        for stock in self.stocks:
-            if stock.get_symbol() in self.symbols:
-                ax.plot(self.trends[stock.get_symbol()]['Dates'],
-                list(np.array(self.trends[stock.get_symbol()]['Closes'])
-                * stock.get_quantity()), label = stock.get_symbol())
-        ax.legend(loc = 0)
-        ax.set_title("Trends of " + self.investor.get_name() +
-                "'s Portfolio Stocks", fontsize = 24)
-        ax.set_xlabel('', fontsize = 10)
-        fig.autofmt_xdate()
-        ax.set_ylabel("Price", fontsize = 10)
-        ax.tick_params(axis = 'both', which = 'major', labelsize = 10)
-        plt.savefig(filename)
+    # Data is from a JSON file with stock data. Each series is downsampled
+    # to the width of the chart with method, 'lttb' or 'minmax'.
+    @timed_stage('chart_trends')
+    def chart_trends(self, filename, method = 'lttb'):
+        from charting import render_line_chart
+        render_line_chart(filename, self.__holding_series(),
+            "Trends of " + self.investor.get_name() + "'s Portfolio Stocks",
+            method = method)
         print("\nGraph for trends from JSON file created and saved on " +
                 filename + " file.\n")
 
-    # Method that takes data from database and instantiates
-    # Stock and Bond objects and are added to their own separate list
+    # Public method that saves one trend chart per held stock in
+    # directory, rendered in up to max_workers parallel processes
+    @timed_stage('chart_trends_by_symbol')
+    def chart_trends_by_symbol(self, directory, method = 'lttb',
+            max_workers = None):
+        from charting import render_small_multiples
+        files = render_small_multiples(directory, self.__holding_series(),
+            "Trend of " + self.investor.get_name() + "'s {} Stock",
+            method = method, max_workers = max_workers)
+        print(f"\n{len(files)} trend graphs saved in {directory}.\n")
+        return files
+
+    # Public method that starts tracking the loaded positions against
+    # valuation_date. Returns the PositionTracker, which keeps totals and
+    # the best and worst yields current as price ticks are applied.
+    def track_positions(self, valuation_date = None):
+        from position_tracker import PositionTracker
+        self.tracker = PositionTracker(self.stocks, valuation_date)
+        return self.tracker
+
+    # Public method that applies (symbol, price) ticks to the tracked
+    # positions and returns the number of positions updated. The book gets
+    # the last price of each symbol, so valuations and bond risk see the
+    # ticks too.
+    @timed_stage('apply_price_ticks')
+    def apply_price_ticks(self, ticks):
+        if self.tracker is None:
+            self.track_positions()
+        ticks = list(ticks)
+        updated = self.tracker.apply_ticks(ticks)
+        if self.book is not None:
+            last = {symbol.upper(): price for symbol, price in ticks}
+            for symbol, price in last.items():
+                self.book.set_symbol_price(symbol, price)
+        self.instruments.count('ticks.positions', updated)
+        return updated
+
+    # Public method that values the held lots over the loaded trend
+    # data. Each lot counts from its purchase date. Returns a
+    # PortfolioValuation with the value, cost and profit and loss series
+    # and as-of lookups. Positions, such as self.db_stocks, can be valued
+    # instead of the loaded book.
+    @timed_stage('valuation')
+    def valuation(self, include_bonds = False, positions = None):
+        from position_book import PositionBook
+        from valuation import PortfolioValuation
+        if positions is not None:
+            book = PositionBook.from_positions(positions)
+        else:
+            book = self.book if self.book is not None else PositionBook()
+        return PortfolioValuation.from_book(book, self.trends, include_bonds)
+
+    # Public method that replays the stocks_trends rows of the held
+    # stocks as a stream of price ticks and backtests the loaded book
+    # along with what-if scenarios, each a dictionary of
+    # Backtest.add_scenario arguments with a 'name'. Lots of symbols
+    # without trend rows are left out. Returns the Backtest and its
+    # summary per scenario.
+    @timed_stage('backtest')
+    def backtest(self, scenarios = (), start = None, end = None):
+        from position_book import PositionBook
+        from backtest import Backtest, db_ticks
+        book = self.book if self.book is not None else PositionBook()
+        traded = [row[0] for row in self.db.execute(
+            "SELECT symbol FROM stocks_trends_marks")]
+        backtest = Backtest.from_book(book, symbols = traded)
+        for scenario in scenarios:
+            backtest.add_scenario(**scenario)
+        summary = backtest.run(db_ticks(self.db, backtest.symbols, start,
+            end))
+        self.instruments.count('backtest.ticks',
+            summary[0]['ticks'] if summary else 0)
+        return backtest, summary
+
+    # Public method that computes the yield to maturity, prices, duration,
+    # convexity and DV01 of every bond with a maturity date, in one
+    # vectorized pass over the loaded book or the given positions.
+    # Returns the PositionBook used and the dictionary of result arrays.
+    @timed_stage('bond_risk')
+    def bond_risk(self, positions = None, valuation_date = None):
+        from position_book import PositionBook
+        from bond_analytics import book_risk
+        if positions is not None:
+            book = PositionBook.from_positions(positions, valuation_date)
+        else:
+            book = self.book if self.book is not None else PositionBook()
+        risk = book_risk(book, valuation_date)
+        self.instruments.count('bonds.valued', len(risk['rows']))
+        return book, risk
+
+    # Public method that plots the value and cost of the book over the
+    # history of the trend data
+    @timed_stage('chart_valuation')
+    def chart_valuation(self, filename, method = 'lttb'):
+        from charting import render_line_chart
+        valuation = self.valuation()
+        render_line_chart(filename, [
+            ('Value', valuation.dates, valuation.value),
+            ('Cost', valuation.dates, valuation.cost)],
+            "Value of " + self.investor.get_name() + "'s Portfolio Stocks",
+            'Value', method = method)
+        print("\nGraph for portfolio value created and saved on " +
+                filename + " file.\n")
+        return valuation
+
+    # Method that takes the investor's rows from the database and
+    # instantiates Stock and Bond objects and are added to their own
+    # separate list. The rows are cached until the stocks or bonds table
+    # changes.
+    @timed_stage('create_db_stocks')
     def create_db_stocks(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM stocks")
-        items = c.fetchall()
-        for item in items:
-            self.db_stocks.append(Stock(item[0], item[2], item[3],
-            item[4], item[5], datetime.strptime(item[6], '%Y-%m-%d').date()))
-        conn.commit()
-        c.execute("SELECT * FROM bonds")
-        items = c.fetchall()
-        for item in items:
-            self.db_stocks.append(Bond(item[0], item[2], item[3],
-            item[4], item[5], datetime.strptime(item[6], '%Y-%m-%d').date(),
-            item[7], item[8]))
-        conn.commit()
-        conn.close()
+        from db_reader import position_from_row
+        self.db_stocks.extend(position_from_row(table, row)
+            for table, row in self.__position_rows())
+        self.instruments.count('positions.read', len(self.db_stocks))
 
-    # Displays Stock and Bond objects instantiated from the database and
-    # sends report to a .txt file
-    def display_fill_report(self, filename):
-
-        # Output stored in variable, report.
-        report = (f"Stock ownership for {self.investor.get_name()}\n"
-                + ("=" * 110) + "\n"
-                + "{:<15}{:<15}{:<20}{:<30}{:<20}{:<20}".format(
-                    'Stock', 'Share #', 'Earnings/Losses',
-                    'Yearly Earnings/Losses', 'Coupon', 'Yield') + "\n"
-                + ("=" * 110) + "\n")
-        print(report)
-
-        max_yield = self.__get_max_yield()
-        for stock in self.db_stocks:
-            if stock.get_earn_loss() < 0:
-                 earn_loss = str("-${:.2f}".format(round(abs(
-                    stock.get_earn_loss()), 2)))
-            else:
-                earn_loss = str("${:.2f}".format(round(
-                    stock.get_earn_loss())))
-
-            if isinstance(stock, Bond):
-                row = ("{:<15}{:<15}{:<20}{:<30}{:<20}{:<20}".format(
-                    stock.get_symbol(), stock.get_quantity(),
-                    earn_loss, str(f"{round(stock.get_yearly_value(), 2)}%"),
-                    str(stock.get_coupon()),
-                    str(f"{stock.get_yield_perc()}%")) + "\n" + ("-" * 110)
-                    + "\n")
-                print(row)
-                report += row
-            else:
-                row = ("{:<15}{:<15}{:<20}{:<30}{:<20}{:<20}".format(
-                    stock.get_symbol(), stock.get_quantity(),
-                    earn_loss, str(f"{round(stock.get_yearly_value(), 2)}%"),
-                    '-', '-') + "\n" + ("-" * 110) + "\n")
-                print(row)
-                report += row
-
-            if stock.get_yearly_value() == max_yield:
-                high_symbol = stock.get_symbol()
-
-        print("=" * 110)
-        if max_yield >= 0:
-            line = ("The stock with the highest average yearly yield "
-                + f"is: {high_symbol}\n")
-            print(line)
-            report += line
-        elif max_yield < 0:
-            line = ("The stock with the lowest average yearly loss "
-                + f"is: {high_symbol}")
-            print(line)
-            report += line
+    # Private method that returns the investor's (table, row) pairs of
+    # the stocks and bonds tables, optionally for one symbol, through the
+    # query cache
+    def __position_rows(self, symbol = None):
+        from db_reader import iter_position_rows, POSITION_TABLES
+        investor_id = str(self.investor.get_ID())
+        return self.__cached('positions', (investor_id,
+            symbol.upper() if symbol else None), list(POSITION_TABLES),
+            lambda: tuple(iter_position_rows(self.db, investor_id, symbol)))
+
+    # Public method that returns the number of the investor's positions
+    # in the database and the symbols and values of the best and worst
+    # yearly yields as of today, as a dictionary. Results are cached
+    # until the stocks or bonds table changes or the day ends.
+    def position_summary(self):
+        from db_reader import position_from_row, POSITION_TABLES
+        from report_writer import ReportSummary
+
+        def summarize():
+            summary = ReportSummary()
+            for table, row in self.__position_rows():
+                summary.add(position_from_row(table, row))
+            return summary.to_dict()
+        return self.__cached('position_summary', (str(
+            self.investor.get_ID()), date.today().isoformat()),
+            list(POSITION_TABLES), summarize)
+
+    # Private method that answers a read through the query cache, which
+    # is made and the schema migrated on first use
+    def __cached(self, name, params, tables, compute):
+        if self.cache is None:
+            from query_cache import QueryCache
+            migrate(self.db)
+            self.cache = QueryCache(self.db)
+        return self.cache.get(name, params, tables, compute)
 
+    # Private method that records that tables changed in the write
+    # transaction of cursor c, so cached reads of them are dropped here
+    # and in every other process
+    def __modified(self, c, tables):
+        if self.cache is not None:
+            self.cache.invalidate(c, tables)
+        else:
+            bump_table_versions(c, tables)
+
+    # Generator that yields the investor's Stock and Bond objects from
+    # the database, optionally for one symbol. Rows are fetched in
+    # batches and each object is built when it is reached.
+    def iter_db_stocks(self, symbol = None):
+        from db_reader import iter_positions
+        return iter_positions(self.db, self.investor.get_ID(), symbol)
+
+    # Displays Stock and Bond objects instantiated from the database and
+    # streams the report to a file. fmt is 'text', 'csv' or 'jsonl' and
+    # quiet skips the console output. With stream set, positions are read
+    # straight from the database instead of self.db_stocks, so the report
+    # runs in constant memory. Returns the ReportSummary with the best and
+    # worst yearly yields.
+    @timed_stage('display_fill_report')
+    def display_fill_report(self, filename, fmt = 'text', quiet = False,
+            stream = False):
+        positions = self.iter_db_stocks() if stream else self.db_stocks
         try:
-           with open(filename, 'w') as f:
-             f.write(report)
-        except Exception:
+            summary = write_report(filename, self.investor.get_name(),
+                positions, fmt, quiet)
+            self.instruments.count('report.rows', summary.count)
+            return summary
+        except OSError:
             print(f"Writing to the file, {filename}, failed")
 
-    # Private method to find the highest average yearly yield
-    def __get_max_yield(self):
-        yearly_yields = []
-        for stock in self.stocks:
-            yearly_yields.append(stock.get_yearly_value())
-        return max(yearly_yields)
-
-    # Private method that generates a purchase ID 
-    def __generate_ID(self):
-        global id_hold
-        id_hold += 1
-        return id_hold
+    # Private method that returns the purchase ID of a number. Numbers
+    # are reserved per investor with schema.reserve_purchase_ids, so IDs
+    # are unique even when several processes load positions at once.
+    def __purchase_ID(self, number):
+        return f"{self.investor.get_ID()}-{number}"
 
-    # Empties the stocks table
+    # Removes the investor's rows from the stocks table
+    @timed_stage('delete_stocks')
     def delete_stocks(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("DELETE from stocks")
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as c:
+            if c.execute("DELETE from stocks WHERE investor_id = ?",
+                    (str(self.investor.get_ID()),)).rowcount:
+                self.__modified(c, ['stocks'])
 
-    # Empties the bonds table
+    # Removes the investor's rows from the bonds table
+    @timed_stage('delete_bonds')
     def delete_bonds(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("DELETE from bonds")
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as c:
+            if c.execute("DELETE from bonds WHERE investor_id = ?",
+                    (str(self.investor.get_ID()),)).rowcount:
+                self.__modified(c, ['bonds'])
 
     # Empties the stocks_trends table
+    @timed_stage('delete_stocks_trends')
     def delete_stocks_trends(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("DELETE from stocks_trends")
-        conn.commit()
-        conn.close()
-
-    # Displays contents in stocks_trends table
-    def show_stocks_trends_table(self):
-        conn = sqlite3.connect('stocks.db')
-        c = conn.cursor()
-        c.execute("SELECT * from stocks_trends")
-        rows = c.fetchall()
+        with self.db.transaction() as c:
+            if c.execute("DELETE from stocks_trends").rowcount:
+                self.__modified(c, ['stocks_trends'])
+            c.execute("DELETE from stocks_trends_marks")
+            for table in ('trend_daily_stats', 'trend_monthly_returns',
+                    'trend_stats_marks', 'trend_correlations'):
+                c.execute(f"DELETE from {table}")
+
+    # Displays contents in stocks_trends table, optionally for one symbol
+    # between two ISO dates. Rows are fetched in batches.
+    @timed_stage('show_stocks_trends_table')
+    def show_stocks_trends_table(self, symbol = None, start = None,
+            end = None):
+        from db_reader import iter_trend_rows
         print("\nList of rows in stock's trends table.\n")
-        for row in rows:
+        for row in iter_trend_rows(self.db, symbol, start, end):
             print(row)
@@ -0,0 +1,277 @@
+##########################################################################
+# Author: David Beltran
+# File: position_book.py
+# Date: August 19, 2022
+# This module holds the PositionBook class. Used to store Stock and Bond
+# positions as NumPy columns so metrics and rankings for large books are
+# computed in batched array operations. StockView and BondView objects
+# act like Stock and Bond objects over one row of a book.
+##########################################################################
+
+# Standard libary imports
+from datetime import date
+import numpy as np
+
+# Application author designed module imports
+from bond import Bond
+from stock import Stock, YEAR
+
+# Global variable with the starting number of rows allocated
+INITIAL_CAPACITY = 64
+
+# Numeric columns of the book and their NumPy types
+COLUMNS = {
+    'quantity': np.float64,
+    'purchase_price': np.float64,
+    'current_price': np.float64,
+    'purchase_date': 'datetime64[D]',
+    'coupon': np.float64,
+    'yield_perc': np.float64,
+    'maturity_date': 'datetime64[D]',
+    'frequency': np.float64,
+    'is_bond': np.bool_,
+}
+
+class PositionBook:
+
+    # Class constructor. Metrics are computed against valuation_date,
+    # which defaults to today.
+    def __init__(self, valuation_date = None, capacity = INITIAL_CAPACITY):
+        self.valuation_date = valuation_date
+        self.size = 0
+        self.purchase_ids = np.empty(capacity, dtype = object)
+        self.symbols = np.empty(capacity, dtype = object)
+        self.columns = {name: np.zeros(capacity, dtype = dtype)
+            for name, dtype in COLUMNS.items()}
+        self.__metrics = None
+
+    # Builds a book from an iterable of Stock and Bond objects
+    @classmethod
+    def from_positions(cls, positions, valuation_date = None):
+        book = cls(valuation_date)
+        book.extend(positions)
+        return book
+
+    def __len__(self):
+        return self.size
+
+    # Iterating a book yields a StockView or BondView of every row
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.view(i)
+
+    def get_valuation_date(self):
+        return self.valuation_date or date.today()
+
+    def set_valuation_date(self, valuation_date):
+        self.valuation_date = valuation_date
+        self.__metrics = None
+
+    # Private method that doubles the capacity until n more rows fit
+    def __reserve(self, n):
+        capacity = len(self.symbols)
+        if self.size + n <= capacity:
+            return
+        while capacity < self.size + n:
+            capacity *= 2
+        for name in ('purchase_ids', 'symbols'):
+            grown = np.empty(capacity, dtype = object)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+        for name, values in self.columns.items():
+            grown = np.zeros(capacity, dtype = values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns[name] = grown
+
+    # Adds a Stock or Bond object and returns its row number
+    def append(self, stock):
+        self.__reserve(1)
+        i = self.size
+        self.purchase_ids[i] = stock.get_purchaseID()
+        self.symbols[i] = stock.get_symbol()
+        self.columns['quantity'][i] = stock.get_quantity()
+        self.columns['purchase_price'][i] = stock.get_purchase_price()
+        self.columns['current_price'][i] = stock.get_current_price()
+        self.columns['purchase_date'][i] = stock.get_purchase_date()
+        if isinstance(stock, Bond):
+            self.columns['coupon'][i] = stock.get_coupon()
+            self.columns['yield_perc'][i] = stock.get_yield_perc()
+            self.columns['maturity_date'][i] = (stock.get_maturity_date()
+                or np.datetime64('NaT'))
+            self.columns['frequency'][i] = stock.get_frequency()
+            self.columns['is_bond'][i] = True
+        else:
+            self.columns['coupon'][i] = np.nan
+            self.columns['yield_perc'][i] = np.nan
+            self.columns['maturity_date'][i] = np.datetime64('NaT')
+            self.columns['frequency'][i] = np.nan
+            self.columns['is_bond'][i] = False
+        self.size += 1
+        self.__metrics = None
+        return i
+
+    def extend(self, positions):
+        for stock in positions:
+            self.append(stock)
+
+    # Returns the filled part of a column
+    def column(self, name):
+        if name == 'purchase_ids':
+            return self.purchase_ids[:self.size]
+        if name == 'symbols':
+            return self.symbols[:self.size]
+        return self.columns[name][:self.size]
+
+    # Sets a column of one row, or of every row when row is an array of
+    # row numbers or a mask, and marks the metrics as stale
+    def set_value(self, row, name, value):
+        self.column(name)[row] = value
+        self.__metrics = None
+
+    # Sets the current price of one row, or of several rows
+    def set_current_price(self, row, current_price):
+        self.set_value(row, 'current_price', current_price)
+
+    # Sets the current price of every row holding a symbol
+    def set_symbol_price(self, symbol, current_price):
+        self.set_current_price(self.column('symbols') == symbol.upper(),
+            current_price)
+
+    # Private method that computes earn_loss, price_change and
+    # yearly_value for every row in one pass
+    def __compute(self):
+        quantity = self.column('quantity')
+        purchase = self.column('purchase_price')
+        current = self.column('current_price')
+        today = np.datetime64(self.get_valuation_date(), 'D')
+        days = (today - self.column('purchase_date')).astype(np.float64)
+        change = (current - purchase) / purchase
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            yearly = change / (days / YEAR) * 100
+        self.__metrics = {
+            'earn_loss': (current - purchase) * quantity,
+            'price_change': change * 100,
+            'yearly_value': yearly,
+        }
+
+    # Returns a derived metric column: earn_loss, price_change or
+    # yearly_value. Results are reused until the book changes.
+    def metric(self, name):
+        if self.__metrics is None:
+            self.__compute()
+        return self.__metrics[name]
+
+    # Private method that returns metric or column values by name
+    def __values(self, name):
+        if name in ('earn_loss', 'price_change', 'yearly_value'):
+            return self.metric(name)
+        return self.column(name)
+
+    # Returns the row number with the highest value of a column
+    def argmax(self, name = 'yearly_value'):
+        return int(np.nanargmax(self.__values(name)))
+
+    # Returns the row number with the lowest value of a column
+    def argmin(self, name = 'yearly_value'):
+        return int(np.nanargmin(self.__values(name)))
+
+    # Returns the row numbers of the n highest values of a column, highest
+    # first. Set largest to False for the n lowest values. Rows with a NaN
+    # value are left out, so fewer than n rows may be returned.
+    def top_n(self, n, name = 'yearly_value', largest = True):
+        values = self.__values(name)
+        rows = np.flatnonzero(~np.isnan(values))
+        values = -values[rows] if largest else values[rows]
+        n = min(n, len(rows))
+        if n <= 0:
+            return np.array([], dtype = np.intp)
+        best = np.argpartition(values, n - 1)[:n]
+        return rows[best[np.argsort(values[best], kind = 'stable')]]
+
+    # Returns the highest average yearly yield in the book
+    def max_yearly_value(self):
+        return float(np.nanmax(self.metric('yearly_value')))
+
+    # Returns the sum of a column, optionally only for stocks or bonds
+    def total(self, name = 'earn_loss', bonds = None):
+        values = self.__values(name)
+        if bonds is not None:
+            values = values[self.column('is_bond') == bonds]
+        return float(np.nansum(values))
+
+    # Returns a dictionary of symbol to the sum of a column over its rows
+    def totals_by_symbol(self, name = 'earn_loss'):
+        symbols, groups = np.unique(self.column('symbols').astype(str),
+            return_inverse = True)
+        sums = np.bincount(groups, weights = self.__values(name),
+            minlength = len(symbols))
+        return dict(zip(symbols.tolist(), sums.tolist()))
+
+    # Returns a StockView or BondView of a row. Setters on the view change
+    # the book and its getters read the book's metrics.
+    def view(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError("PositionBook row out of range")
+        return (BondView if self.columns['is_bond'][i] else StockView)(
+            self, i)
+
+# Private helper that converts a datetime64 value to a date, or None
+def _to_date(value):
+    return None if np.isnat(value) else value.astype(object)
+
+# Private helper that returns a value unchanged
+def _same(value):
+    return value
+
+# Private helper that returns a property reading and writing one column
+# of the row a view stands for
+def _row_property(name, convert = float):
+    def get(self):
+        return convert(self.book.column(name)[self.row])
+
+    def set(self, value):
+        if name in ('purchase_date', 'maturity_date') and value is None:
+            value = np.datetime64('NaT')
+        self.book.set_value(self.row, name, value)
+    return property(get, set)
+
+# Private helper that returns a read-only property with a metric of the
+# row a view stands for
+def _metric_property(name):
+    return property(lambda self: float(self.book.metric(name)[self.row]))
+
+class StockView(Stock):
+
+    # Class constructor. Nothing is copied; every attribute is read from
+    # and written to row of book. The valuation date is the book's.
+    def __init__(self, book, row):
+        self.book = book
+        self.row = row
+
+    purchaseID = _row_property('purchase_ids', _same)
+    symbol = _row_property('symbols', str)
+    quantity = _row_property('quantity')
+    purchase_price = _row_property('purchase_price')
+    current_price = _row_property('current_price')
+    purchase_date = _row_property('purchase_date', _to_date)
+    valuation_date = property(lambda self: self.book.valuation_date,
+        lambda self, value: self.book.set_valuation_date(value))
+    earn_loss = _metric_property('earn_loss')
+    price_change = _metric_property('price_change')
+    yearly_value = _metric_property('yearly_value')
+
+    def get_earn_loss(self):
+        return self.earn_loss
+
+    def get_price_change(self):
+        return self.price_change
+
+    def get_yearly_value(self):
+        return self.yearly_value
+
+class BondView(StockView, Bond):
+
+    coupon = _row_property('coupon')
+    yield_perc = _row_property('yield_perc')
+    maturity_date = _row_property('maturity_date', _to_date)
+    frequency = _row_property('frequency', int)
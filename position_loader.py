@@ -0,0 +1,130 @@
+##########################################################################
+# Author: David Beltran
+# File: position_loader.py
+# Date: August 19, 2022
+# This module holds the bulk loader for stock and bond position files.
+# Rows are streamed with the csv module, the file layout is detected once
+# from its header and bad rows are collected as RowError records.
+##########################################################################
+
+# Standard libary imports
+import csv
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+# Date format used in the position files
+POSITION_DATE_FORMAT = '%m/%d/%Y'
+
+# Header names of the stock columns, in the order rows are returned
+STOCK_FIELDS = ('SYMBOL', 'NO_SHARES', 'PURCHASE_PRICE', 'CURRENT_VALUE',
+    'PURCHASE_DATE')
+
+# Extra header names of bond files
+BOND_FIELDS = STOCK_FIELDS + ('COUPON', 'YIELD')
+
+# Optional header names of bond files. Bonds without them have no
+# maturity date and pay coupons twice a year.
+OPTIONAL_BOND_FIELDS = ('MATURITY_DATE', 'FREQUENCY')
+DEFAULT_FREQUENCY = 2
+FREQUENCIES = (1, 2, 4, 12)
+
+# Record describing a row that could not be loaded. Line is the line
+# number in the file, or 0 for errors about the whole file.
+RowError = namedtuple('RowError', ['filename', 'line', 'symbol', 'message'])
+
+# Record with the result of loading one file. Kind is 'stock' or 'bond',
+# rows is a list of tuples ordered like STOCK_FIELDS or BOND_FIELDS
+# followed by OPTIONAL_BOND_FIELDS.
+LoadResult = namedtuple('LoadResult', ['filename', 'kind', 'rows', 'errors'])
+
+# Parses a purchase date. Results are memoized because position files
+# repeat the same few dates over many rows.
+@lru_cache(maxsize = 4096)
+def parse_date(text):
+    return datetime.strptime(text, POSITION_DATE_FORMAT).date()
+
+# Returns 'stock' or 'bond' and the column index of every field, based on
+# the header row. Header names are matched without regard to case. The
+# index of an optional bond field that is missing is None.
+def detect_schema(header):
+    names = [name.strip().upper() for name in header]
+    kind = 'bond' if all(field in names for field in BOND_FIELDS) else 'stock'
+    fields = BOND_FIELDS if kind == 'bond' else STOCK_FIELDS
+    missing = [field for field in fields if field not in names]
+    if missing:
+        raise ValueError("missing columns: " + ", ".join(missing))
+    columns = [names.index(field) for field in fields]
+    if kind == 'bond':
+        columns += [names.index(field) if field in names else None
+            for field in OPTIONAL_BOND_FIELDS]
+    return kind, columns
+
+# Private helper that returns the stripped text of an optional column, or
+# an empty string if the column is missing
+def _optional(record, column):
+    if column is None or column >= len(record):
+        return ''
+    return record[column].strip()
+
+# Generator that yields the parsed rows of a csv reader positioned after
+# the header. Rows that cannot be parsed are appended to errors instead.
+def iter_position_rows(reader, kind, columns, filename, errors):
+    width = max(columns[:7]) + 1
+    for record in reader:
+        if not any(field.strip() for field in record):
+            continue
+        symbol = (record[columns[0]].strip() if len(record) > columns[0]
+            else '')
+        if len(record) < width:
+            errors.append(RowError(filename, reader.line_num, symbol,
+                f"expected {width} columns, found {len(record)}"))
+            continue
+        try:
+            row = (symbol, float(record[columns[1]]),
+                float(record[columns[2]]), float(record[columns[3]]),
+                parse_date(record[columns[4]].strip()))
+            if kind == 'bond':
+                maturity = _optional(record, columns[7])
+                frequency = _optional(record, columns[8])
+                if frequency and int(frequency) not in FREQUENCIES:
+                    raise ValueError(f"unsupported frequency {frequency}")
+                row += (float(record[columns[5]]), float(record[columns[6]]),
+                    parse_date(maturity) if maturity else None,
+                    int(frequency) if frequency else DEFAULT_FREQUENCY)
+        except ValueError as error:
+            errors.append(RowError(filename, reader.line_num, symbol,
+                str(error)))
+            continue
+        yield row
+
+# Loads one position file and returns a LoadResult. A missing or
+# unreadable file is reported as an error instead of raised.
+def read_positions(filename):
+    errors = []
+    try:
+        with open(filename, newline = '') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return LoadResult(filename, None, [], errors)
+            kind, columns = detect_schema(header)
+            rows = list(iter_position_rows(reader, kind, columns, filename,
+                errors))
+    except FileNotFoundError:
+        return LoadResult(filename, None, [],
+            [RowError(filename, 0, '', "file was not found")])
+    except (OSError, ValueError) as error:
+        return LoadResult(filename, None, [],
+            [RowError(filename, 0, '', str(error))])
+    return LoadResult(filename, kind, rows, errors)
+
+# Loads several position files and returns their LoadResults in the
+# order given. More than one file is parsed in parallel processes.
+def load_files(filenames, max_workers = None):
+    filenames = list(filenames)
+    if len(filenames) < 2:
+        return [read_positions(filename) for filename in filenames]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers = max_workers) as pool:
+        return list(pool.map(read_positions, filenames))
@@ -0,0 +1,129 @@
+##########################################################################
+# Author: David Beltran
+# File: position_tracker.py
+# Date: August 19, 2022
+# This module holds the PositionTracker class. Used to keep portfolio
+# totals and the best and worst yearly yields up to date while a stream
+# of price ticks is applied. Totals are adjusted by the change of each
+# updated position and yields are kept in two heaps, so a tick costs
+# O(log n) per position of its symbol instead of a rescan of the book.
+##########################################################################
+
+# Standard libary imports
+import heapq
+import itertools
+import math
+from datetime import date
+
+# Heaps are rebuilt when stale entries outnumber live ones by this factor
+COMPACT_RATIO = 4
+
+class PositionTracker:
+
+    # Class constructor. Yields are computed against valuation_date,
+    # which defaults to today.
+    def __init__(self, positions = (), valuation_date = None):
+        self.valuation_date = valuation_date or date.today()
+        self.positions = {}
+        self.by_symbol = {}
+        self.totals = {'earn_loss': 0.0, 'cost': 0.0, 'value': 0.0}
+        self.__versions = {}
+        self.__counter = itertools.count(1)
+        self.__best, self.__worst = [], []
+        for stock in positions:
+            self.add(stock)
+
+    def __len__(self):
+        return len(self.positions)
+
+    # Private method that adds or removes the contribution of a position
+    # to the totals
+    def __account(self, stock, sign):
+        quantity = stock.get_quantity()
+        self.totals['earn_loss'] += sign * stock.get_earn_loss()
+        self.totals['cost'] += sign * quantity * stock.get_purchase_price()
+        self.totals['value'] += sign * quantity * stock.get_current_price()
+
+    # Private method that pushes the current yield of a position on both
+    # heaps. Older entries of the position become stale. Versions come
+    # from one counter that never goes back, so the entries of a removed
+    # position stay stale if its purchase ID is added again.
+    def __push(self, key):
+        version = next(self.__counter)
+        self.__versions[key] = version
+        value = self.positions[key].get_yearly_value()
+        if not math.isnan(value):
+            heapq.heappush(self.__best, (-value, key, version))
+            heapq.heappush(self.__worst, (value, key, version))
+        if len(self.__best) > COMPACT_RATIO * (len(self.positions) + 1):
+            self.__compact()
+
+    # Private method that rebuilds both heaps from live entries only
+    def __compact(self):
+        for heap in (self.__best, self.__worst):
+            heap[:] = [entry for entry in heap
+                if self.__versions.get(entry[1]) == entry[2]]
+            heapq.heapify(heap)
+
+    # Adds a Stock or Bond object. Positions are keyed by purchase ID.
+    def add(self, stock):
+        key = stock.get_purchaseID()
+        if key in self.positions:
+            self.remove(key)
+        stock.set_valuation_date(self.valuation_date)
+        self.positions[key] = stock
+        self.by_symbol.setdefault(stock.get_symbol(), []).append(key)
+        self.__account(stock, 1)
+        self.__push(key)
+
+    # Removes the position with a purchase ID and returns it
+    def remove(self, key):
+        stock = self.positions.pop(key)
+        del self.__versions[key]
+        self.by_symbol[stock.get_symbol()].remove(key)
+        self.__account(stock, -1)
+        return stock
+
+    # Sets the current price of every position holding a symbol and
+    # returns the number of positions updated
+    def apply_tick(self, symbol, current_price):
+        keys = self.by_symbol.get(symbol.upper(), ())
+        for key in keys:
+            stock = self.positions[key]
+            self.__account(stock, -1)
+            stock.set_current_price(current_price)
+            self.__account(stock, 1)
+            self.__push(key)
+        return len(keys)
+
+    # Applies an iterable of (symbol, price) ticks in order and returns
+    # the number of positions updated
+    def apply_ticks(self, ticks):
+        return sum(self.apply_tick(symbol, price) for symbol, price in ticks)
+
+    # Moves every yield to a new valuation date. Every yield changes, so
+    # the heaps are rebuilt.
+    def set_valuation_date(self, valuation_date):
+        self.valuation_date = valuation_date
+        self.__best, self.__worst = [], []
+        for key, stock in self.positions.items():
+            stock.set_valuation_date(valuation_date)
+            self.__push(key)
+
+    # Private method that drops stale entries from the top of a heap and
+    # returns the live position at the top, or None
+    def __top(self, heap):
+        while heap and self.__versions.get(heap[0][1]) != heap[0][2]:
+            heapq.heappop(heap)
+        return self.positions[heap[0][1]] if heap else None
+
+    # Returns the position with the highest yearly yield
+    def best(self):
+        return self.__top(self.__best)
+
+    # Returns the position with the lowest yearly yield
+    def worst(self):
+        return self.__top(self.__worst)
+
+    def get_total(self, name = 'earn_loss'):
+        return self.totals[name]
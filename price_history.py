@@ -0,0 +1,166 @@
+##########################################################################
+# Author: David Beltran
+# File: price_history.py
+# Date: August 19, 2022
+# This module holds the price history providers. Used to fetch historical
+# stock prices concurrently from Yahoo Finance, from local JSON files for
+# offline runs, and through an on-disk cache with a time to live.
+##########################################################################
+
+# Standard libary imports
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+# Global variable with the default number of concurrent requests
+MAX_WORKERS = 8
+
+# Global variable with the default cache directory
+CACHE_DIR = '.price_cache'
+
+# Global variable with the number of seconds cached prices stay fresh
+CACHE_TTL = 24 * 60 * 60
+
+# Base class of the price history providers. A provider returns the
+# prices of a symbol between two ISO dates as a list of dictionaries
+# using the yahoofinancials keys, at least 'formatted_date' and 'close',
+# sorted by date.
+class PriceHistoryProvider:
+
+    def get_history(self, symbol, start, end, interval = 'monthly'):
+        raise NotImplementedError
+
+# Provider that downloads prices with yahoofinancials
+class YahooPriceProvider(PriceHistoryProvider):
+
+    def get_history(self, symbol, start, end, interval = 'monthly'):
+        from yahoofinancials import YahooFinancials
+        data = YahooFinancials(symbol).get_historical_price_data(
+            str(start), str(end), interval)
+        prices = (data.get(symbol) or {}).get('prices') or []
+        return sorted(prices, key = lambda price: price['formatted_date'])
+
+# Provider that reads prices from <directory>/<SYMBOL>.json files. Used
+# for offline runs and tests. Each file holds a list of price
+# dictionaries like the ones returned by YahooPriceProvider.
+class FilePriceProvider(PriceHistoryProvider):
+
+    # Class constructor
+    def __init__(self, directory):
+        self.directory = directory
+
+    # Private method that returns the file of a symbol
+    def __path(self, symbol):
+        return os.path.join(self.directory, symbol.upper() + '.json')
+
+    def get_history(self, symbol, start, end, interval = 'monthly'):
+        try:
+            with open(self.__path(symbol)) as f:
+                prices = json.load(f)
+        except FileNotFoundError:
+            return []
+        return sorted((price for price in prices
+            if str(start) <= price['formatted_date'] <= str(end)),
+            key = lambda price: price['formatted_date'])
+
+    # Writes the prices of a symbol so they can be replayed later
+    def save_history(self, symbol, prices):
+        os.makedirs(self.directory, exist_ok = True)
+        with open(self.__path(symbol), 'w') as f:
+            json.dump(prices, f)
+
+# Provider that keeps the prices of another provider in a local cache.
+# Fresh entries covering the requested range are answered from disk.
+# Otherwise only the missing or stale part of the range is fetched and
+# merged into the entry.
+class CachedPriceProvider(PriceHistoryProvider):
+
+    # Class constructor
+    def __init__(self, provider, directory = CACHE_DIR, ttl = CACHE_TTL):
+        self.provider = provider
+        self.directory = directory
+        self.ttl = ttl
+        self.__locks = {}
+        self.__locks_lock = threading.Lock()
+
+    # Private method that returns the cache file of a symbol
+    def __path(self, symbol, interval):
+        name = symbol.upper().replace(':', '_') + f".{interval}.json"
+        return os.path.join(self.directory, name)
+
+    # Private method that returns the lock of a symbol so concurrent
+    # requests for one symbol share a single fetch
+    def __lock(self, symbol):
+        with self.__locks_lock:
+            return self.__locks.setdefault(symbol.upper(), threading.Lock())
+
+    # Private method that reads a cache entry
+    def __read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Private method that writes a cache entry through a temporary file
+    def __write(self, path, entry):
+        os.makedirs(self.directory, exist_ok = True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(entry, f)
+        os.replace(path + '.tmp', path)
+
+    def get_history(self, symbol, start, end, interval = 'monthly'):
+        start, end = str(start), str(end)
+        path = self.__path(symbol, interval)
+        with self.__lock(symbol):
+            entry = self.__read(path)
+            if entry is None:
+                entry = {'start': start, 'end': start, 'fetched_at': 0,
+                    'prices': []}
+            fresh = time.time() - entry['fetched_at'] < self.ttl
+            ranges = []
+            if start < entry['start']:
+                ranges.append((start, entry['start']))
+            if end > entry['end'] or not fresh:
+                # The last cached point is fetched again because it may
+                # have been a partial period
+                last = (entry['prices'][-1]['formatted_date']
+                    if entry['prices'] else entry['end'])
+                ranges.append((min(last, end), end))
+            if ranges:
+                prices = {price['formatted_date']: price
+                    for price in entry['prices']}
+                for low, high in ranges:
+                    for price in self.provider.get_history(symbol, low, high,
+                            interval):
+                        prices[price['formatted_date']] = price
+                entry = {'start': min(start, entry['start']),
+                    'end': max(end, entry['end']), 'fetched_at': time.time(),
+                    'prices': [prices[key] for key in sorted(prices)]}
+                self.__write(path, entry)
+        return [price for price in entry['prices']
+            if start <= price['formatted_date'] <= end]
+
+# Fetches the history of many symbols concurrently with at most
+# max_workers requests in flight. Returns a dictionary of symbol to
+# prices and a dictionary of symbol to the error of failed fetches.
+def fetch_histories(provider, symbols, start, end = None,
+        interval = 'monthly', max_workers = MAX_WORKERS):
+    end = end or date.today()
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    histories, errors = {}, {}
+    if not symbols:
+        return histories, errors
+    with ThreadPoolExecutor(max_workers = min(max_workers,
+            len(symbols))) as pool:
+        futures = {symbol: pool.submit(provider.get_history, symbol, start,
+            end, interval) for symbol in symbols}
+        for symbol, future in futures.items():
+            try:
+                histories[symbol] = future.result()
+            except Exception as error:
+                errors[symbol] = error
+    return histories, errors
@@ -0,0 +1,178 @@
+##########################################################################
+# Author: David Beltran
+# File: query_cache.py
+# Date: August 19, 2022
+# This module holds the QueryCache class. Used to keep the results of
+# repeated Portfolio reads in an in-process LRU, optionally backed by the
+# query_cache side table. Every result is stored with the versions of the
+# tables it was read from. Writes bump those versions in table_versions,
+# so a result is served until its tables change and never after.
+##########################################################################
+
+# Standard libary imports
+import itertools
+import json
+import pickle
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+# Application author designed module imports
+from schema import bump_table_versions
+
+# Global variables with the default limits of the in-process LRU
+MAX_ENTRIES = 1024
+MAX_BYTES = 64 << 20
+
+# Marker for a key that is not cached
+MISSING = object()
+
+# Items of a container measured when estimating its size
+SAMPLE_ITEMS = 16
+
+# Returns an estimate of the memory held by a result without serializing
+# it. Arrays count their buffers and containers are measured from a
+# sample of their items.
+def estimate_size(value):
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+    else:
+        return size
+    sample = list(itertools.islice(items, SAMPLE_ITEMS))
+    if sample:
+        size += (sum(estimate_size(item) for item in sample) * len(value)
+            // len(sample))
+    return size
+
+class QueryCache:
+
+    # Class constructor. db is a Database migrated to the latest schema
+    # version. Results over max_bytes are not kept. Results are measured
+    # with estimate_size, or by their pickled size when persistent also
+    # keeps them in the query_cache table, so other processes and later
+    # runs can reuse them.
+    def __init__(self, db, max_entries = MAX_ENTRIES, max_bytes = MAX_BYTES,
+            persistent = False):
+        self.db = db
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persistent = persistent
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits, self.misses, self.loads = 0, 0, 0
+        self.__versions = None
+        self.__local = threading.local()
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Private method that returns the current version of every table.
+    # They are only read again when another connection has committed,
+    # which SQLite reports through the data_version pragma, when a
+    # transaction was committed through the Database, such as a write by
+    # another Portfolio sharing its connection, or after a write made
+    # through this cache.
+    def __current_versions(self):
+        seen = (self.db.execute("PRAGMA data_version").fetchone()[0],
+            self.db.commits)
+        versions = self.__versions
+        if versions is None or getattr(self.__local, 'seen', None) != seen:
+            versions = dict(self.db.execute(
+                "SELECT table_name, version FROM table_versions"))
+            self.__versions = versions
+            self.__local.seen = seen
+        return versions
+
+    # Returns the result of the query name with params, which reads
+    # tables. compute is called without arguments on a miss. Results are
+    # shared between callers and must not be changed.
+    def get(self, name, params, tables, compute):
+        key = (name,) + tuple(params)
+        versions = self.__current_versions()
+        wanted = tuple(versions.get(table, 0) for table in tables)
+        with self.__lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == wanted:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        value = self.__load(key, wanted) if self.persistent else MISSING
+        data = None
+        if value is MISSING:
+            self.misses += 1
+            value = compute()
+            if self.persistent:
+                data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                self.__store(key, wanted, data)
+        self.__put(key, tables, wanted, value, data)
+        return value
+
+    # Private method that adds a result to the LRU and evicts the least
+    # recently used results past the limits
+    def __put(self, key, tables, wanted, value, data):
+        size = len(data) if data is not None else estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self.__lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[3]
+            self.entries[key] = (wanted, value, tuple(tables), size)
+            self.size += size
+            while len(self.entries) > self.max_entries or \
+                    self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last = False)[1][3]
+
+    # Private method that reads a result of the side table if it was
+    # stored at the wanted versions
+    def __load(self, key, wanted):
+        row = self.db.execute("""SELECT versions, value FROM query_cache
+            WHERE cache_key = ?""", (json.dumps(key),)).fetchone()
+        if row is None or tuple(json.loads(row[0])) != wanted:
+            return MISSING
+        self.loads += 1
+        return pickle.loads(row[1])
+
+    # Private method that writes a result to the side table. A busy
+    # database skips the write, as the result can always be read again.
+    def __store(self, key, wanted, data):
+        try:
+            with self.db.transaction() as c:
+                c.execute("""INSERT OR REPLACE INTO query_cache
+                    VALUES (?, ?, ?)""", (json.dumps(key),
+                    json.dumps(wanted), data))
+        except sqlite3.OperationalError:
+            pass
+
+    # Bumps the versions of tables inside the write transaction of cursor
+    # c and drops the results read from them. Called by every method that
+    # changes the rows of a cached table.
+    def invalidate(self, c, tables):
+        bump_table_versions(c, tables)
+        tables = set(tables)
+        with self.__lock:
+            self.__versions = None
+            for key in [key for key, entry in self.entries.items()
+                    if tables.intersection(entry[2])]:
+                self.size -= self.entries.pop(key)[3]
+
+    # Drops every result, including the side table ones
+    def clear(self):
+        with self.__lock:
+            self.entries.clear()
+            self.size = 0
+        if self.persistent:
+            with self.db.transaction() as c:
+                c.execute("DELETE FROM query_cache")
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.size,
+            'hits': self.hits, 'misses': self.misses, 'loads': self.loads}
@@ -0,0 +1,198 @@
+##########################################################################
+# Author: David Beltran
+# File: report_writer.py
+# Date: August 19, 2022
+# This module holds the report writers. Used to stream Stock and Bond rows
+# to a buffered text, CSV or JSON Lines file in one pass while the best
+# and worst yearly yields are tracked for the summary lines.
+##########################################################################
+
+# Standard libary imports
+import csv
+import json
+import sys
+
+# Application author designed module imports
+from bond import Bond
+
+# Global variable with the size of the output file buffer in bytes
+BUFFER_SIZE = 1 << 20
+
+# Width of the text report
+WIDTH = 110
+
+# Column layout of the text report
+ROW_FORMAT = "{:<15}{:<15}{:<20}{:<30}{:<20}{:<20}"
+
+# Fields of the CSV and JSON Lines reports
+FIELDS = ['symbol', 'quantity', 'earn_loss', 'yearly_value', 'coupon',
+    'yield_perc']
+
+# Tracks the positions with the highest and lowest yearly yield while rows
+# are written, so the summary needs no second pass
+class ReportSummary:
+
+    # Class constructor
+    def __init__(self):
+        self.count = 0
+        self.best_symbol, self.best_yield = None, None
+        self.worst_symbol, self.worst_yield = None, None
+
+    def add(self, stock):
+        value = stock.get_yearly_value()
+        self.count += 1
+        if self.best_yield is None or value > self.best_yield:
+            self.best_symbol, self.best_yield = stock.get_symbol(), value
+        if self.worst_yield is None or value < self.worst_yield:
+            self.worst_symbol, self.worst_yield = stock.get_symbol(), value
+
+    # Returns the summary lines of the report
+    def lines(self):
+        if self.count == 0:
+            return ["No stocks were found for the report."]
+        if self.best_yield >= 0:
+            best = ("The stock with the highest average yearly yield "
+                + f"is: {self.best_symbol}")
+        else:
+            best = ("The stock with the lowest average yearly loss "
+                + f"is: {self.best_symbol}")
+        worst = ("The stock with the lowest average yearly yield "
+            + f"is: {self.worst_symbol}")
+        return [best, worst]
+
+    def to_dict(self):
+        return {'count': self.count,
+            'best_symbol': self.best_symbol, 'best_yield': self.best_yield,
+            'worst_symbol': self.worst_symbol,
+            'worst_yield': self.worst_yield}
+
+# Formats the earnings or losses of a position like the text report
+def format_earn_loss(stock):
+    if stock.get_earn_loss() < 0:
+        return "-${:.2f}".format(round(abs(stock.get_earn_loss()), 2))
+    return "${:.2f}".format(round(stock.get_earn_loss()))
+
+# Base class of the report writers. Subclasses write to the open file f.
+# Unless quiet is set, the text form of every row is also printed.
+class ReportWriter:
+
+    # Class constructor
+    def __init__(self, f, investor_name, quiet = False):
+        self.f = f
+        self.investor_name = investor_name
+        self.quiet = quiet
+        self.summary = ReportSummary()
+
+    # Prints text unless the writer is quiet
+    def echo(self, text):
+        if not self.quiet:
+            sys.stdout.write(text + "\n")
+
+    def text_header(self):
+        return (f"Stock ownership for {self.investor_name}\n"
+            + ("=" * WIDTH) + "\n"
+            + ROW_FORMAT.format('Stock', 'Share #', 'Earnings/Losses',
+                'Yearly Earnings/Losses', 'Coupon', 'Yield') + "\n"
+            + ("=" * WIDTH) + "\n")
+
+    def text_row(self, stock):
+        if isinstance(stock, Bond):
+            coupon = str(stock.get_coupon())
+            yield_perc = f"{stock.get_yield_perc()}%"
+        else:
+            coupon, yield_perc = '-', '-'
+        return (ROW_FORMAT.format(stock.get_symbol(), stock.get_quantity(),
+            format_earn_loss(stock),
+            f"{round(stock.get_yearly_value(), 2)}%", coupon, yield_perc)
+            + "\n" + ("-" * WIDTH) + "\n")
+
+    def write_header(self):
+        self.echo(self.text_header())
+
+    def write_row(self, stock):
+        self.summary.add(stock)
+        self.echo(self.text_row(stock))
+
+    def write_summary(self):
+        self.echo("=" * WIDTH)
+        for line in self.summary.lines():
+            self.echo(line + "\n")
+
+    # Writes every position of an iterable and returns the summary
+    def write_all(self, positions):
+        self.write_header()
+        for stock in positions:
+            self.write_row(stock)
+        self.write_summary()
+        return self.summary
+
+# Writer for the fixed width text report
+class TextReportWriter(ReportWriter):
+
+    def write_header(self):
+        super().write_header()
+        self.f.write(self.text_header())
+
+    def write_row(self, stock):
+        super().write_row(stock)
+        self.f.write(self.text_row(stock))
+
+    def write_summary(self):
+        super().write_summary()
+        for line in self.summary.lines():
+            self.f.write(line + "\n")
+
+# Writer for CSV reports with raw numeric values. Summary values are
+# returned by write_all rather than written to the file.
+class CsvReportWriter(ReportWriter):
+
+    # Class constructor
+    def __init__(self, f, investor_name, quiet = False):
+        super().__init__(f, investor_name, quiet)
+        self.writer = csv.writer(f)
+
+    def write_header(self):
+        super().write_header()
+        self.writer.writerow(FIELDS)
+
+    def write_row(self, stock):
+        super().write_row(stock)
+        is_bond = isinstance(stock, Bond)
+        self.writer.writerow([stock.get_symbol(), stock.get_quantity(),
+            round(stock.get_earn_loss(), 2),
+            round(stock.get_yearly_value(), 2),
+            stock.get_coupon() if is_bond else '',
+            stock.get_yield_perc() if is_bond else ''])
+
+# Writer for JSON Lines reports. The last line holds the summary.
+class JsonLinesReportWriter(ReportWriter):
+
+    def write_row(self, stock):
+        super().write_row(stock)
+        is_bond = isinstance(stock, Bond)
+        self.f.write(json.dumps(dict(zip(FIELDS, [stock.get_symbol(),
+            stock.get_quantity(), round(stock.get_earn_loss(), 2),
+            round(stock.get_yearly_value(), 2),
+            stock.get_coupon() if is_bond else None,
+            stock.get_yield_perc() if is_bond else None]))) + "\n")
+
+    def write_summary(self):
+        super().write_summary()
+        self.f.write(json.dumps({'summary': self.summary.to_dict()}) + "\n")
+
+# Report writer classes by format name
+WRITERS = {
+    'text': TextReportWriter,
+    'csv': CsvReportWriter,
+    'jsonl': JsonLinesReportWriter,
+}
+
+# Streams positions to filename in the given format and returns the
+# ReportSummary. Rows go straight to a buffered file handle, so memory
+# use does not grow with the number of positions.
+def write_report(filename, investor_name, positions, fmt = 'text',
+        quiet = False, buffer_size = BUFFER_SIZE):
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown report format, {fmt}")
+    with open(filename, 'w', newline = '', buffering = buffer_size) as f:
+        return WRITERS[fmt](f, investor_name, quiet).write_all(positions)
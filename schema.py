@@ -0,0 +1,292 @@
+##########################################################################
+# Author: David Beltran
+# File: schema.py
+# Date: August 19, 2022
+# This module holds the versioned schema of the stocks database. Each
+# migration upgrades the database by one version, which is tracked with
+# SQLite's user_version pragma.
+##########################################################################
+
+# Standard libary imports
+from datetime import datetime
+
+# Date format used in the JSON trend files
+TREND_DATE_FORMAT = '%d-%b-%y'
+
+# Converts a trend date such as '4-Aug-17' to ISO format. Dates already
+# in ISO format are returned unchanged.
+def iso_trend_date(value):
+    try:
+        return datetime.strptime(value, TREND_DATE_FORMAT).date().isoformat()
+    except ValueError:
+        return value
+
+# Converts a trend price to a float. Missing prices, written as '-' in
+# the JSON trend files, are returned as None.
+def trend_price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Migration 1 creates the original tables along with the unique trend key
+# and the per-symbol high-water mark table used by incremental loads
+def _create_base_tables(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS stocks (
+        stock_id text,
+        investor_id text,
+        symbol text,
+        quantity real,
+        purchase_price real,
+        current_price real,
+        purchase_date text
+    )
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS bonds (
+        stock_id text,
+        investor_id text,
+        symbol text,
+        quantity real,
+        purchase_price real,
+        current_price real,
+        purchase_date text,
+        coupon real,
+        yield_perc real
+    )
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS stocks_trends (
+        symbol text,
+        price_date text,
+        open_price text,
+        high_price text,
+        low_price text,
+        close_price real,
+        volume real
+    )
+    """)
+    c.execute("""DELETE FROM stocks_trends WHERE rowid NOT IN (
+        SELECT MIN(rowid) FROM stocks_trends
+        GROUP BY symbol, price_date
+    )
+    """)
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS
+        stocks_trends_symbol_date ON stocks_trends (symbol, price_date)
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS stocks_trends_marks (
+        symbol text PRIMARY KEY,
+        last_date text
+    )
+    """)
+
+# Migration 2 rebuilds stocks_trends with REAL prices, ISO dates and a
+# (symbol, price_date) primary key, and indexes stocks and bonds by
+# investor and symbol
+def _type_and_index_tables(c):
+    c.connection.create_function('iso_trend_date', 1, iso_trend_date,
+        deterministic = True)
+    c.connection.create_function('trend_price', 1, trend_price,
+        deterministic = True)
+    c.execute("""CREATE TABLE stocks_trends_typed (
+        symbol text NOT NULL,
+        price_date text NOT NULL,
+        open_price real,
+        high_price real,
+        low_price real,
+        close_price real,
+        volume real,
+        PRIMARY KEY (symbol, price_date)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""INSERT OR REPLACE INTO stocks_trends_typed
+        SELECT symbol, iso_trend_date(price_date), trend_price(open_price),
+        trend_price(high_price), trend_price(low_price), close_price, volume
+        FROM stocks_trends
+    """)
+    c.execute("DROP TABLE stocks_trends")
+    c.execute("ALTER TABLE stocks_trends_typed RENAME TO stocks_trends")
+    for table in ('stocks', 'bonds'):
+        c.execute(f"""CREATE INDEX IF NOT EXISTS {table}_investor_symbol
+            ON {table} (investor_id, symbol)""")
+        c.execute(f"""CREATE INDEX IF NOT EXISTS {table}_symbol
+            ON {table} (symbol)""")
+
+# Migration 3 creates the aggregate tables kept up to date by
+# analytics.TrendAnalytics and the per-symbol marks of its last refresh
+def _create_analytics_tables(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS trend_daily_stats (
+        symbol text NOT NULL,
+        price_date text NOT NULL,
+        close_price real,
+        daily_return real,
+        sma_short real,
+        sma_long real,
+        volatility real,
+        drawdown real,
+        PRIMARY KEY (symbol, price_date)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS trend_monthly_returns (
+        symbol text NOT NULL,
+        month text NOT NULL,
+        close_price real,
+        monthly_return real,
+        PRIMARY KEY (symbol, month)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS trend_correlations (
+        symbol_a text NOT NULL,
+        symbol_b text NOT NULL,
+        observations integer,
+        correlation real,
+        PRIMARY KEY (symbol_a, symbol_b)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS trend_stats_marks (
+        symbol text PRIMARY KEY,
+        last_date text,
+        peak_close real
+    )
+    """)
+
+# Migration 4 creates the investors table and the per-investor purchase
+# ID sequences, so IDs stay unique when several processes load positions
+def _create_investor_tables(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS investors (
+        investor_id text PRIMARY KEY,
+        name text,
+        address text,
+        phone_number text
+    )
+    """)
+    c.execute("""INSERT OR IGNORE INTO investors (investor_id)
+        SELECT investor_id FROM stocks UNION SELECT investor_id FROM bonds
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS purchase_ids (
+        investor_id text PRIMARY KEY,
+        last_id integer NOT NULL
+    )
+    """)
+
+# Migration 5 adds the maturity date and coupon frequency of bonds
+def _add_bond_terms(c):
+    c.execute("ALTER TABLE bonds ADD COLUMN maturity_date text")
+    c.execute("ALTER TABLE bonds ADD COLUMN frequency integer DEFAULT 2")
+
+# Migration 6 creates the per-table version counters bumped by every
+# write, which tell query caches when a result is out of date, and the
+# side table query caches can keep results in
+def _create_cache_tables(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS table_versions (
+        table_name text PRIMARY KEY,
+        version integer NOT NULL
+    ) WITHOUT ROWID
+    """)
+    c.execute("""CREATE TABLE IF NOT EXISTS query_cache (
+        cache_key text PRIMARY KEY,
+        versions text NOT NULL,
+        value blob NOT NULL
+    )
+    """)
+
+# Migration 7 creates the ledger of files loaded by the ingest daemon,
+# keyed by content hash so each file content is loaded exactly once.
+# Position files record the purchase ID numbers they were given, so the
+# rows of a replaced file can be removed.
+def _create_ingest_tables(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS ingested_files (
+        content_hash text PRIMARY KEY,
+        path text NOT NULL,
+        kind text NOT NULL,
+        investor_id text,
+        first_id integer,
+        last_id integer,
+        row_count integer NOT NULL,
+        ingested_at text NOT NULL
+    )
+    """)
+    c.execute("""CREATE INDEX IF NOT EXISTS ingested_files_path
+        ON ingested_files (path)""")
+
+# Ordered list of migrations. The database version equals the number of
+# migrations applied, so new migrations are only ever appended.
+MIGRATIONS = [
+    _create_base_tables,
+    _type_and_index_tables,
+    _create_analytics_tables,
+    _create_investor_tables,
+    _add_bond_terms,
+    _create_cache_tables,
+    _create_ingest_tables,
+]
+
+# Returns the schema version of the database
+def get_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+# Applies every migration newer than the database version. Each one runs
+# in its own immediate transaction together with the version bump, and
+# the version is read again under the write lock so processes migrating
+# the same database at once apply each migration only once.
+def migrate(db):
+    version = get_version(db)
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        with db.transaction(immediate = True) as c:
+            if c.execute("PRAGMA user_version").fetchone()[0] >= number:
+                continue
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+    return get_version(db)
+
+# Reserves count purchase IDs for an investor and returns the first one.
+# IDs are numbered from 1 per investor.
+def reserve_purchase_ids(db, investor_id, count):
+    with db.transaction(immediate = True) as c:
+        c.execute("""INSERT INTO purchase_ids VALUES (?, ?)
+            ON CONFLICT (investor_id) DO UPDATE
+            SET last_id = last_id + excluded.last_id
+            """, (str(investor_id), count))
+        last = c.execute("SELECT last_id FROM purchase_ids "
+            + "WHERE investor_id = ?", (str(investor_id),)).fetchone()[0]
+    return last - count + 1
+
+# Bumps the version of each of tables inside the write transaction of
+# cursor c. Called whenever rows of a cached table change.
+def bump_table_versions(c, tables):
+    c.executemany("""INSERT INTO table_versions VALUES (?, 1)
+        ON CONFLICT (table_name) DO UPDATE SET version = version + 1
+        """, [(table,) for table in tables])
+
+# Upserts trend rows, ordered like the stocks_trends columns and keyed on
+# (symbol, price_date), and returns the number of rows
+def upsert_trend_rows(c, rows):
+    c.executemany("""INSERT INTO stocks_trends VALUES
+        (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (symbol, price_date) DO UPDATE SET
+        open_price = excluded.open_price,
+        high_price = excluded.high_price,
+        low_price = excluded.low_price,
+        close_price = excluded.close_price,
+        volume = excluded.volume
+        """, rows)
+    return len(rows)
+
+# Moves the high-water marks in stocks_trends_marks forward to the ISO
+# dates of a dictionary of symbol to last date. Marks never move back.
+def advance_trend_marks(c, marks):
+    c.executemany("""INSERT INTO stocks_trends_marks VALUES (?, ?)
+        ON CONFLICT (symbol) DO UPDATE
+        SET last_date = max(last_date, excluded.last_date)
+        """, list(marks.items()))
+
+# Records a loaded file in the ingested_files ledger inside the write
+# transaction of cursor c, unless its content was recorded before. First
+# and last are the purchase ID numbers of the positions it wrote, so a
+# later content of the same path can replace them. Returns True if the
+# file was recorded.
+def record_ingested_file(c, content_hash, path, kind, investor_id = None,
+        first_id = None, last_id = None, row_count = 0):
+    return c.execute("""INSERT INTO ingested_files
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (content_hash) DO NOTHING""", (content_hash, path, kind,
+        investor_id, first_id, last_id, row_count,
+        datetime.now().isoformat(timespec = 'seconds'))).rowcount > 0
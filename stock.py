@@ -3,7 +3,9 @@
 # File: stock.py
 # Date: August 19, 2022
 # This module holds the Stock class. Used to instantiate stock objects
-# that store stock information.
+# that store stock information. Derived values are computed with the
+# object and again, when read, only after an attribute they depend on
+# changes or, without a valuation date, after the current date changes.
 ##########################################################################
 
 # Standard libary imports
@@ -12,19 +14,20 @@ from datetime import date
 # Global variable with number of days in tropical year calendar
 YEAR = 365.2422
 
-# Class constructor
+# Class constructor. Yearly values are computed against valuation_date,
+# which defaults to the current date when they are computed.
 class Stock:
     def __init__(self, purchaseID, symbol, quantity, purchase_price,
-            current_price, purchase_date):
+            current_price, purchase_date, valuation_date = None):
         self.purchaseID = purchaseID
         self.symbol = symbol.upper()
         self.quantity = quantity
         self.purchase_price = purchase_price
         self.current_price = current_price
         self.purchase_date = purchase_date
-        self.earn_loss = self.__create_earn_loss()
-        self.price_change = self.__create_price_change()
-        self.yearly_value = self.__create_yearly_value()
+        self.valuation_date = valuation_date
+        self.__dirty, self.__today = True, None
+        self.__refresh()
 
 # Getters and setters
     def get_purchaseID(self):
@@ -44,45 +47,67 @@ class Stock:
 
     def set_quantity(self, quantity):
         self.quantity = quantity
+        self.__dirty = True
 
     def get_purchase_price(self):
         return self.purchase_price
 
     def set_purchase_price(self, purchase_price):
         self.purchase_price = purchase_price
+        self.__dirty = True
 
     def get_current_price(self):
         return self.current_price
 
     def set_current_price(self, current_price):
         self.current_price = current_price
+        self.__dirty = True
 
     def get_purchase_date(self):
         return self.purchase_date
 
     def set_purchase_date(self, purchase_date):
         self.purchase_date = purchase_date
+        self.__dirty = True
+
+    def get_valuation_date(self):
+        return self.valuation_date
+
+    def set_valuation_date(self, valuation_date):
+        self.valuation_date = valuation_date
+        self.__dirty = True
 
 # Default to_string() method
     def to_string(self):
-        if self.earn_loss < 0:
-            earn_loss = f"-${str(abs(round(self.earn_loss, 2)))}"
+        earn_loss = self.get_earn_loss()
+        if earn_loss < 0:
+            earn_loss = f"-${str(abs(round(earn_loss, 2)))}"
         else:
-            earn_loss = f"${str(round(self.earn_loss, 2))}"
+            earn_loss = f"${str(round(earn_loss, 2))}"
         return (f"Purchase ID: {self.purchaseID}, "
         + f"Symbol: {self.symbol}, Quantity: {self.quantity}, "
         + f"Purchase Price: ${str(round(self.purchase_price, 2))}, "
         + f"Current Price: ${str(round(self.current_price, 2))}, "
         + f"Purchase Date: {self.purchase_date.strftime('%B %d, %Y')}, "
         + f"Earnings/Losses: {earn_loss}, "
-        + f"Price Change: {round(self.price_change, 2)}%, "
-        + f"Yearly Yield: {round(self.yearly_value, 2)}%]")
+        + f"Price Change: {round(self.get_price_change(), 2)}%, "
+        + f"Yearly Yield: {round(self.get_yearly_value(), 2)}%]")
 
 # Private methods used to calculate values for object attributes
+    def __refresh(self):
+        today = None if self.valuation_date else date.today()
+        if self.__dirty or today != self.__today:
+            self.earn_loss = self.__create_earn_loss()
+            self.price_change = self.__create_price_change()
+            self.yearly_value = self.__create_yearly_value(
+                self.valuation_date or today)
+            self.__dirty, self.__today = False, today
+
     def __create_earn_loss(self):
         return (self.current_price - self.purchase_price) * self.quantity
 
     def get_earn_loss(self):
+        self.__refresh()
         return self.earn_loss
 
     def __create_price_change(self):
@@ -90,12 +115,14 @@ class Stock:
         self.purchase_price) * 100)
 
     def get_price_change(self):
+        self.__refresh()
         return self.price_change
 
-    def __create_yearly_value(self):
+    def __create_yearly_value(self, valuation_date):
         return (((self.current_price - self.purchase_price) /
         self.purchase_price) /
-        (((date.today() - self.purchase_date).days) / YEAR)) * 100
+        (((valuation_date - self.purchase_date).days) / YEAR)) * 100
 
     def get_yearly_value(self):
+        self.__refresh()
         return self.yearly_value
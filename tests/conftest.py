@@ -0,0 +1,25 @@
+##########################################################################
+# Author: David Beltran
+# File: conftest.py
+# Date: August 19, 2022
+# This module holds the shared pytest setup. The application modules
+# live at the top of the repository, so it is put on the import path.
+##########################################################################
+
+# Standard libary imports
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+# Application author designed module imports
+from database import Database
+
+# Empty database in a temporary directory, closed after the test
+@pytest.fixture
+def db(tmp_path):
+    database = Database(tmp_path / 'stocks.db')
+    yield database
+    database.close()
@@ -0,0 +1,108 @@
+##########################################################################
+# Author: David Beltran
+# File: test_backtest.py
+# Date: August 19, 2022
+# This module holds the tests of the tick replay and the Backtest class.
+##########################################################################
+
+# Standard libary imports
+import os
+import numpy as np
+import pytest
+
+# Application author designed module imports
+from backtest import Backtest, trend_ticks, _day_chunks
+from investor import Investor
+from portfolio import Portfolio
+from schema import migrate
+
+# Files shipped with the repository
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'data')
+POSITION_FILES = [os.path.join(DATA, 'Lesson6_Data_Stocks.csv'),
+    os.path.join(DATA, 'Lesson6_Data_Bonds.csv')]
+
+# Chunk sizes replayed against the default one
+CHUNK_SIZES = [1, 2, 3, 7, 50, 333]
+
+# Returns the tick of an ISO date, symbol and close
+def _tick(when, symbol, close):
+    return (int(np.datetime64(when, 'D').astype(np.int64)), symbol, close)
+
+# Returns a Portfolio of investor 3 over db with the data/ positions and
+# trends loaded
+@pytest.fixture
+def portfolio(db):
+    migrate(db)
+    portfolio = Portfolio(Investor(3, 'Bob Smith'), db)
+    portfolio.fill_reports(POSITION_FILES, max_workers = 1)
+    portfolio.fill_stock_trends_table(os.path.join(DATA, 'AllStocks.json'))
+    return portfolio
+
+# Returns a backtest of the portfolio's stocks with trends, with a few
+# what-if scenarios, and its ticks
+def _backtest(portfolio):
+    backtest = Backtest.from_book(portfolio.book,
+        symbols = portfolio.trends)
+    backtest.add_scenario('double', scale = 2.0)
+    backtest.add_scenario('late', shift_days = 30)
+    backtest.add_scenario('early', purchase_dates = '2015-01-02')
+    return backtest, list(trend_ticks(portfolio.trends, backtest.symbols))
+
+# Chunks hold whole days and give back every tick in order
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_day_chunks_keep_days_whole(portfolio, size):
+    ticks = _backtest(portfolio)[1]
+    chunks = list(_day_chunks(ticks, size))
+    assert [tick for chunk in chunks for tick in chunk] == ticks
+    for before, after in zip(chunks, chunks[1:]):
+        assert before[-1][0] != after[0][0]
+
+# Frames and summaries do not depend on the chunk size
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_chunk_size_does_not_change_results(portfolio, size):
+    backtest, ticks = _backtest(portfolio)
+    expected = list(backtest.replay(ticks))
+    frames = list(backtest.replay(ticks, size))
+    for name in ('days', 'value', 'cost', 'pnl', 'yearly_yield',
+            'drawdown'):
+        np.testing.assert_allclose(
+            np.concatenate([frame[name] for frame in frames]),
+            np.concatenate([frame[name] for frame in expected]),
+            rtol = 1e-12)
+    for summary, other in zip(backtest.run(ticks, size),
+            backtest.run(ticks)):
+        assert summary.pop('name') == other.pop('name')
+        assert summary == pytest.approx(other, rel = 1e-12, nan_ok = True)
+
+# The drawdown peak is carried from one chunk to the next
+def test_drawdown_peak_carries_between_chunks():
+    backtest = Backtest(['AIG'], [10], [10.0], ['2017-08-01'])
+    ticks = [_tick('2017-08-01', 'AIG', 10.0),
+        _tick('2017-08-02', 'AIG', 20.0), _tick('2017-08-03', 'AIG', 15.0)]
+    for size in (1, None):
+        assert backtest.run(ticks, size)[0]['max_drawdown'] == \
+            pytest.approx(-0.25)
+
+# Lots of a scenario whose purchase date moved are bought at the first
+# close of their symbol on or after the new date
+def test_moved_lots_buy_at_next_close():
+    backtest = Backtest(['AIG', 'F'], [10, 1], [10.0, 5.0],
+        ['2017-08-01', '2017-08-01'])
+    backtest.add_scenario('late', shift_days = 2)
+    ticks = [_tick('2017-08-01', 'AIG', 10.0), _tick('2017-08-01', 'F', 5.0),
+        _tick('2017-08-02', 'AIG', 11.0), _tick('2017-08-03', 'F', 6.0),
+        _tick('2017-08-04', 'AIG', 12.0), _tick('2017-08-05', 'AIG', 13.0)]
+    late = backtest.run(ticks, 1)[1]
+    assert late['cost'] == pytest.approx(10 * 12.0 + 6.0)
+    assert late['value'] == pytest.approx(10 * 13.0 + 6.0)
+
+# The base scenario ends at the value PortfolioValuation gives for the
+# last date
+def test_base_matches_valuation(portfolio):
+    backtest, ticks = _backtest(portfolio)
+    base = backtest.run(ticks)[0]
+    valuation = portfolio.valuation()
+    last = valuation.as_of(valuation.dates[-1])
+    assert base['value'] == pytest.approx(last['value'], rel = 1e-12)
+    assert base['cost'] == pytest.approx(last['cost'], rel = 1e-12)
@@ -0,0 +1,62 @@
+##########################################################################
+# Author: David Beltran
+# File: test_bond_analytics.py
+# Date: August 19, 2022
+# This module holds the tests of the vectorized bond analytics.
+##########################################################################
+
+# Standard libary imports
+import numpy as np
+import pytest
+
+# Application author designed module imports
+from bond_analytics import bond_analytics, coupon_periods
+
+# Settlement date of every test bond
+SETTLEMENT = np.datetime64('2024-01-01')
+
+# A bond priced at par on a coupon date yields its coupon, and its
+# durations match the closed forms for par bonds
+def test_par_bond():
+    results = bond_analytics(SETTLEMENT, np.datetime64('2034-01-01'), 5.0,
+        2, clean_price = 100.0)
+    modified = (1 - 1.025 ** -20) / 0.05
+    assert results['ytm'][0] == pytest.approx(5.0)
+    assert results['accrued'][0] == pytest.approx(0.0)
+    assert results['modified_duration'][0] == pytest.approx(modified)
+    assert results['macaulay_duration'][0] == pytest.approx(
+        modified * 1.025)
+
+# Pricing at a yield and solving the yield back gives the same yield
+def test_yield_round_trip():
+    maturity = np.array(['2024-03-15', '2029-06-30', '2054-01-01'],
+        dtype = 'datetime64[D]')
+    priced = bond_analytics(SETTLEMENT, maturity, [1.0, 4.5, 6.0],
+        [12, 2, 1], ytm = [3.0, 7.25, 5.5])
+    solved = bond_analytics(SETTLEMENT, maturity, [1.0, 4.5, 6.0],
+        [12, 2, 1], clean_price = priced['clean_price'])
+    assert solved['ytm'] == pytest.approx([3.0, 7.25, 5.5])
+
+# Coupons left and the fraction of a period until the next coupon
+def test_coupon_periods():
+    remaining, until_next = coupon_periods(SETTLEMENT,
+        np.array(['2034-01-01', '2024-04-01', '2023-06-01'],
+        dtype = 'datetime64[D]'), [2, 2, 2])
+    assert remaining.tolist() == [20, 1, 0]
+    assert until_next[0] == 1.0
+    assert until_next[1] == pytest.approx(91 / 183)
+    assert np.isnan(until_next[2])
+
+# Bonds whose yield cannot be solved are NaN, without warnings and
+# without changing the bonds valued with them
+@pytest.mark.filterwarnings('error')
+def test_unsolvable_bonds_are_nan():
+    maturity = np.array(['2024-02-01', '2054-01-01', '2054-01-01',
+        '2024-03-01', '2054-01-01'], dtype = 'datetime64[D]')
+    results = bond_analytics(SETTLEMENT, maturity, [5.0, 5.0, 5.0, 1.0,
+        5.0], 12, clean_price = [20000.0, 1e6, -5.0, 1000.0, 100.0])
+    assert np.isnan(results['ytm'][:3]).all()
+    assert np.isnan(results['modified_duration'][:3]).all()
+    assert results['ytm'][3] == pytest.approx(bond_analytics(SETTLEMENT,
+        maturity[3], 1.0, 12, clean_price = 1000.0)['ytm'][0])
+    assert results['ytm'][4] == pytest.approx(5.0, abs = 1e-3)
@@ -0,0 +1,142 @@
+##########################################################################
+# Author: David Beltran
+# File: test_ingest_daemon.py
+# Date: August 19, 2022
+# This module holds the tests of the IngestDaemon class. Each test loads
+# a copy of the data/ position files from a temporary directory.
+##########################################################################
+
+# Standard libary imports
+import json
+import os
+import shutil
+import threading
+
+# Application author designed module imports
+import ingest_daemon
+from ingest_daemon import IngestDaemon, parse_file, read_spool
+from investor import Investor
+from portfolio import Portfolio
+from trend_cache import TrendCache, file_digest
+
+# Position files shipped with the repository
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'data')
+POSITION_FILES = ['Lesson6_Data_Stocks.csv', 'Lesson6_Data_Bonds.csv']
+
+# Investor the positions are loaded for
+INVESTOR = Investor(3, 'Bob Smith', '123 main', '1230432')
+
+# Returns a directory in tmp_path holding copies of the position files
+def _directory(tmp_path):
+    directory = tmp_path / 'incoming'
+    directory.mkdir()
+    for name in POSITION_FILES:
+        shutil.copy(os.path.join(DATA, name), directory)
+    return directory
+
+# Writes a trend JSON file of count daily AIG trends to path
+def _write_trends(path, count):
+    path.write_text(json.dumps([{'Symbol': 'AIG',
+        'Date': f"{day}-Aug-17", 'Open': '66.1', 'High': '66.2',
+        'Low': '64.7', 'Close': 65.0, 'Volume': 1000}
+        for day in range(1, count + 1)]))
+
+# Runs a daemon over directory once and returns its stats. Fails instead
+# of hanging if the daemon does not finish.
+def _run(db, directory):
+    daemon = IngestDaemon(db, str(directory), INVESTOR, max_workers = 1)
+    thread = threading.Thread(target = daemon.run, args = (True,),
+        daemon = True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive()
+    return daemon.stats
+
+# Returns the number of rows of a table
+def _count(db, table):
+    return db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+# A second run finds every file loaded and writes nothing
+def test_second_run_loads_nothing(db, tmp_path):
+    directory = _directory(tmp_path)
+    assert _run(db, directory)['ingested'] == 2
+    assert _run(db, directory)['queued'] == 0
+    assert (_count(db, 'stocks'), _count(db, 'bonds')) == (8, 1)
+
+# Files loaded like the ingest command does, positions through
+# Portfolio.fill_stock_bonds_tables and trends through load_trends, are
+# not loaded again by the daemon, from a cold or a warm trend cache
+def test_portfolio_loads_are_recorded(db, tmp_path):
+    directory = _directory(tmp_path)
+    trends = directory / 'AllStocks.json'
+    shutil.copy(os.path.join(DATA, 'AllStocks.json'), trends)
+    cache = TrendCache(str(tmp_path / 'cache'))
+    for _ in range(2):
+        portfolio = Portfolio(INVESTOR, db)
+        portfolio.fill_reports([str(directory / name)
+            for name in POSITION_FILES], max_workers = 1)
+        portfolio.create_tables()
+        portfolio.load_trends(str(trends), cache)
+        portfolio.fill_stock_bonds_tables()
+        assert _run(db, directory)['queued'] == 0
+        with db.transaction() as c:
+            c.execute("DELETE FROM ingested_files WHERE kind = 'trend'")
+    assert (_count(db, 'stocks'), _count(db, 'bonds')) == (8, 1)
+
+# A changed file replaces the rows of its earlier content, also when
+# those were written by Portfolio.fill_stock_bonds_tables
+def test_changed_file_replaces_rows(db, tmp_path):
+    directory = _directory(tmp_path)
+    portfolio = Portfolio(INVESTOR, db)
+    portfolio.fill_reports([str(directory / name)
+        for name in POSITION_FILES], max_workers = 1)
+    portfolio.fill_stock_bonds_tables()
+    path = directory / POSITION_FILES[0]
+    lines = path.read_text().splitlines()
+    path.write_text("\n".join(lines[:3]) + "\n")
+    stats = _run(db, directory)
+    assert (stats['ingested'], stats['rows']) == (1, 2)
+    assert [row[0] for row in db.execute(
+        "SELECT stock_id FROM stocks ORDER BY rowid")] == ['3-10', '3-11']
+    assert _count(db, 'bonds') == 1
+
+# A file that fails to write is counted as failed, the other files are
+# still loaded and the daemon finishes
+def test_failed_file_keeps_writer_running(db, tmp_path, monkeypatch):
+    directory = _directory(tmp_path)
+    _write_trends(directory / 'trends.json', 3)
+    (directory / 'broken.json').write_text('[{"Symbol": ')
+    def fail(c, rows):
+        raise RuntimeError("no trends today")
+    monkeypatch.setattr(ingest_daemon, 'upsert_trend_rows', fail)
+    stats = _run(db, directory)
+    assert (stats['ingested'], stats['failed']) == (2, 2)
+    assert (_count(db, 'stocks'), _count(db, 'stocks_trends')) == (8, 0)
+
+# An error refreshing the trend analytics leaves the loaded rows in place
+def test_refresh_error_is_reported(db, tmp_path, monkeypatch, capsys):
+    import analytics
+    directory = _directory(tmp_path)
+    _write_trends(directory / 'trends.json', 3)
+    def fail(self):
+        raise RuntimeError("no analytics today")
+    monkeypatch.setattr(analytics.TrendAnalytics, 'refresh', fail)
+    assert _run(db, directory)['ingested'] == 3
+    assert _count(db, 'stocks_trends') == 3
+    assert "no analytics today" in capsys.readouterr().out
+
+# Trend rows are spooled and written in batches of BATCH_ROWS
+def test_trend_rows_are_spooled_in_batches(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_daemon, 'BATCH_ROWS', 2)
+    path = tmp_path / 'trends.json'
+    _write_trends(path, 5)
+    parsed = parse_file((str(path), file_digest(path), str(tmp_path)))
+    assert (parsed.kind, parsed.row_count) == ('trend', 5)
+    assert [len(batch) for batch in read_spool(parsed.spool)] == [2, 2, 1]
+    os.remove(parsed.spool)
+    directory = tmp_path / 'incoming'
+    directory.mkdir()
+    shutil.move(str(path), directory)
+    assert _run(db, directory)['rows'] == 5
+    assert _count(db, 'stocks_trends') == 5
@@ -0,0 +1,55 @@
+##########################################################################
+# Author: David Beltran
+# File: test_json_stream.py
+# Date: August 19, 2022
+# This module holds the tests of the streaming JSON array reader.
+##########################################################################
+
+# Standard libary imports
+import io
+import json
+import pytest
+
+# Application author designed module imports
+from json_stream import iter_json_array
+
+# File like object that counts the characters read from it
+class CountingReader(io.StringIO):
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.characters = 0
+
+    def read(self, size = -1):
+        chunk = super().read(size)
+        self.characters += len(chunk)
+        return chunk
+
+# Numbers cut at a chunk boundary are read whole
+def test_numbers_split_across_chunks():
+    assert list(iter_json_array(io.StringIO('[1, 23, 456]'), 1)) == \
+        [1, 23, 456]
+    assert list(iter_json_array(io.StringIO('[7]'), 2)) == [7]
+
+# Every chunk size gives the records of json.loads
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64])
+def test_records_match_json_loads(chunk_size):
+    records = [{'Symbol': 'AIG', 'Date': '4-Aug-17', 'Close': 65.55,
+        'Volume': 4270500, 'Note': 'café "x"'}, -1.5e3, True, None,
+        'long ' * 40, [1, [2, 3]]]
+    text = json.dumps(records, indent = 1)
+    assert list(iter_json_array(io.StringIO(text), chunk_size)) == records
+
+# A malformed record raises without reading the rest of the file
+def test_malformed_record_raises_early():
+    text = '[{"a": 1 2}, ' + ', '.join(['{"b": 1}'] * 10000) + ']'
+    reader = CountingReader(text)
+    with pytest.raises(ValueError):
+        list(iter_json_array(reader, 64))
+    assert reader.characters <= 128
+
+# Files that are not arrays or are cut short raise ValueError
+@pytest.mark.parametrize('text', ['{"a": 1}', '[1, 2', '[{"a": 1}, {"b'])
+def test_bad_files_raise(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 4))
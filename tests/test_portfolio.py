@@ -0,0 +1,117 @@
+##########################################################################
+# Author: David Beltran
+# File: test_portfolio.py
+# Date: August 19, 2022
+# This module holds the tests of the Portfolio class against the
+# position and trend files in data/.
+##########################################################################
+
+# Standard libary imports
+import json
+import os
+
+# Application author designed module imports
+from investor import Investor
+from portfolio import Portfolio
+from schema import migrate
+from trend_cache import TrendCache
+
+# Position files shipped with the repository
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'data')
+POSITION_FILES = [os.path.join(DATA, 'Lesson6_Data_Stocks.csv'),
+    os.path.join(DATA, 'Lesson6_Data_Bonds.csv')]
+
+# Writes a trend JSON file of AIG closes by day of August 2017 to path
+def _write_trends(path, closes, symbol = 'AIG'):
+    path.write_text(json.dumps([{'Symbol': symbol,
+        'Date': f"{day}-Aug-17", 'Open': '1', 'High': '1', 'Low': '1',
+        'Close': close, 'Volume': 100} for day, close in closes.items()]))
+
+# Returns a Portfolio of investor 3 over db with the data/ positions
+def _portfolio(db):
+    portfolio = Portfolio(Investor(3, 'Bob Smith', '123 main', '1230432'),
+        db)
+    portfolio.fill_reports(POSITION_FILES, max_workers = 1)
+    return portfolio
+
+# Reading position files reserves no purchase IDs
+def test_fill_reports_writes_nothing(db):
+    migrate(db)
+    _portfolio(db)
+    _portfolio(db)
+    assert db.execute("SELECT count(*) FROM purchase_ids").fetchone() == (0,)
+
+# Positions take the IDs of their stored rows, which are only reserved
+# the first time they are written
+def test_positions_take_stored_ids(db):
+    first = _portfolio(db)
+    first.fill_stock_bonds_tables()
+    second = _portfolio(db)
+    second.fill_stock_bonds_tables()
+    stored = [row[0] for table in ('stocks', 'bonds') for row in db.execute(
+        f"SELECT stock_id FROM {table} ORDER BY rowid")]
+    assert len(stored) == len(first.stocks) == 9
+    assert sorted(stored) == sorted(stock.get_purchaseID()
+        for stock in second.stocks)
+    assert list(second.book.column('purchase_ids')) == \
+        [stock.get_purchaseID() for stock in second.stocks]
+    assert db.execute("SELECT last_id FROM purchase_ids").fetchone() == (9,)
+
+# A JSON load after a load from a warm trend cache merges its rows into
+# the cached read-only series by date
+def test_json_load_after_cached_load(db, tmp_path):
+    migrate(db)
+    cache = TrendCache(str(tmp_path / 'cache'))
+    first, second = tmp_path / 'first.json', tmp_path / 'second.json'
+    _write_trends(first, {1: 10.0, 2: 11.0, 3: 12.0})
+    _write_trends(second, {3: 13.0, 4: 14.0})
+    Portfolio(Investor(3), db).load_trends(str(first), cache)
+    portfolio = Portfolio(Investor(3), db)
+    portfolio.load_trends(str(first), cache)
+    portfolio.fill_stock_trends_table(str(second))
+    series = portfolio.trends['AIG']
+    assert series['Dates'].astype(str).tolist() == ['2017-08-01',
+        '2017-08-02', '2017-08-03', '2017-08-04']
+    assert series['Closes'].tolist() == [10.0, 11.0, 13.0, 14.0]
+
+# Series read from the database are merged with a JSON load, and the
+# cache entry of a file only holds the series of that file
+def test_cache_holds_only_its_file(db, tmp_path):
+    migrate(db)
+    cache = TrendCache(str(tmp_path / 'cache'))
+    paths = [tmp_path / name for name in ('f.json', 'aig.json', 'new.json')]
+    _write_trends(paths[0], {1: 10.0, 2: 11.0}, 'F')
+    _write_trends(paths[1], {1: 20.0})
+    _write_trends(paths[2], {2: 12.0, 3: 13.0}, 'F')
+    portfolio = Portfolio(Investor(3), db)
+    portfolio.fill_stock_trends_table(str(paths[0]))
+    portfolio.fill_stock_trends_table(str(paths[1]))
+    portfolio.load_trends_from_db(['F'])
+    portfolio.load_trends(str(paths[2]), cache)
+    cached = cache.load(str(paths[2]))
+    assert list(cached) == ['F'] and len(cached['F']['Dates']) == 2
+    assert sorted(portfolio.trends) == ['AIG', 'F']
+    assert portfolio.trends['F']['Closes'].tolist() == [10.0, 12.0, 13.0]
+
+# Rows added to a file after it was written take new IDs and are
+# written, and no provisional ID matches a stored one
+def test_grown_file_writes_new_rows(db, tmp_path):
+    path = tmp_path / 'stocks.csv'
+    lines = open(POSITION_FILES[0]).read().splitlines()
+    path.write_text("\n".join(lines) + "\n")
+    files = [str(path), POSITION_FILES[1]]
+    first = Portfolio(Investor(3, 'Bob Smith'), db)
+    first.fill_reports(files, max_workers = 1)
+    first.fill_stock_bonds_tables()
+    path.write_text("\n".join(lines + [lines[1]]) + "\n")
+    second = Portfolio(Investor(3, 'Bob Smith'), db)
+    second.fill_reports(files, max_workers = 1)
+    assert not {stock.get_purchaseID() for stock in second.stocks} & \
+        {stock.get_purchaseID() for stock in first.stocks}
+    second.fill_stock_bonds_tables()
+    ids = [stock.get_purchaseID() for stock in second.stocks]
+    assert len(set(ids)) == len(ids) == 10
+    assert ids[8] == '3-10'
+    assert db.execute("SELECT count(*) FROM stocks").fetchone() == (9,)
+    assert len(second.track_positions()) == 10
@@ -0,0 +1,54 @@
+##########################################################################
+# Author: David Beltran
+# File: test_position_book.py
+# Date: August 19, 2022
+# This module holds the tests of the PositionBook class and its row
+# views.
+##########################################################################
+
+# Standard libary imports
+from datetime import date
+import numpy as np
+
+# Application author designed module imports
+from bond import Bond
+from position_book import PositionBook, StockView, BondView
+from stock import Stock
+
+# Returns a book with two stocks and a bond valued on January 1, 2021
+def _book():
+    return PositionBook.from_positions([
+        Stock(1, 'aig', 10, 50.0, 60.0, date(2020, 1, 1)),
+        Stock(2, 'f', 100, 10.0, 9.0, date(2020, 1, 1)),
+        Bond(3, 'gt2:gov', 5, 100.0, 101.0, date(2020, 1, 1), 3.0, 2.9,
+            date(2030, 1, 1), 2)], date(2021, 1, 1))
+
+# Views read the book's rows and metrics
+def test_view_reads_row():
+    book = _book()
+    stock, bond = book.view(0), book.view(2)
+    assert isinstance(stock, StockView) and isinstance(bond, BondView)
+    assert stock.get_symbol() == 'AIG'
+    assert stock.get_purchase_date() == date(2020, 1, 1)
+    assert stock.get_earn_loss() == 100.0
+    assert bond.get_maturity_date() == date(2030, 1, 1)
+    assert bond.get_frequency() == 2
+    assert 'Earnings/Losses: $100.0' in stock.to_string()
+
+# Setters on a view change the book and its metrics
+def test_view_writes_row():
+    book = _book()
+    book.metric('earn_loss')
+    book.view(0).set_current_price(70.0)
+    assert book.column('current_price')[0] == 70.0
+    assert book.metric('earn_loss')[0] == 200.0
+    book.set_symbol_price('aig', 40.0)
+    assert book.view(0).get_earn_loss() == -100.0
+
+# top_n ranks rows without NaN values and stops when they run out
+def test_top_n_skips_nan():
+    book = _book()
+    book.set_current_price(1, np.nan)
+    assert book.top_n(5).tolist() == [0, 2]
+    assert book.top_n(5, largest = False).tolist() == [2, 0]
+    assert book.top_n(1).tolist() == [0]
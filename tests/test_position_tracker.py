@@ -0,0 +1,71 @@
+##########################################################################
+# Author: David Beltran
+# File: test_position_tracker.py
+# Date: August 19, 2022
+# This module holds the tests of the PositionTracker class and of price
+# ticks applied through a Portfolio.
+##########################################################################
+
+# Standard libary imports
+from datetime import date
+import pytest
+
+# Application author designed module imports
+from investor import Investor
+from portfolio import Portfolio
+from position_book import PositionBook
+from position_tracker import PositionTracker
+from stock import Stock
+
+# Valuation date one year after the purchase date of every test position
+VALUATION_DATE = date(2021, 1, 1)
+
+# Returns a Stock bought on January 1, 2020 that gained gain per share
+def _stock(key, symbol, gain, purchase_price = 100.0):
+    return Stock(key, symbol, 10, purchase_price, purchase_price + gain,
+        date(2020, 1, 1))
+
+# A removed position that is added again does not revive its old entries
+def test_readded_key_replaces_old_yield():
+    tracker = PositionTracker([_stock('a', 'AAA', 100.0),
+        _stock('b', 'BBB', 50.0)], VALUATION_DATE)
+    assert tracker.best().get_purchaseID() == 'a'
+    tracker.remove('a')
+    tracker.add(_stock('a', 'AAA', 10.0))
+    assert tracker.best().get_purchaseID() == 'b'
+    assert tracker.worst().get_purchaseID() == 'a'
+    assert tracker.get_total() == pytest.approx(600.0)
+
+# Adding a position under an existing purchase ID replaces it
+def test_add_existing_key_replaces_position():
+    tracker = PositionTracker([_stock('a', 'AAA', 100.0),
+        _stock('b', 'BBB', 50.0)], VALUATION_DATE)
+    tracker.add(_stock('a', 'AAA', 10.0))
+    assert len(tracker) == 2
+    assert tracker.best().get_purchaseID() == 'b'
+    assert tracker.get_total() == pytest.approx(600.0)
+
+# Ticks reorder the best and worst positions and keep totals current
+def test_ticks_reorder_best_and_worst():
+    tracker = PositionTracker([_stock('a', 'AAA', 10.0),
+        _stock('b', 'BBB', 20.0), _stock('c', 'CCC', 30.0)],
+        VALUATION_DATE)
+    assert tracker.apply_ticks([('aaa', 150.0), ('ccc', 90.0)]) == 2
+    assert tracker.best().get_purchaseID() == 'a'
+    assert tracker.worst().get_purchaseID() == 'c'
+    tracker.apply_tick('AAA', 100.0)
+    assert tracker.best().get_purchaseID() == 'b'
+    assert tracker.get_total() == pytest.approx(100.0)
+
+# Ticks applied through a Portfolio reach its PositionBook as well
+def test_portfolio_ticks_update_book():
+    portfolio = Portfolio(Investor(1, 'Test'))
+    portfolio.stocks = [_stock('a', 'AAA', 10.0), _stock('b', 'BBB', 20.0)]
+    portfolio.book = PositionBook.from_positions(portfolio.stocks,
+        VALUATION_DATE)
+    portfolio.track_positions(VALUATION_DATE)
+    portfolio.apply_price_ticks([('AAA', 140.0), ('aaa', 130.0)])
+    book = portfolio.book
+    assert book.column('current_price').tolist() == [130.0, 120.0]
+    assert book.column('purchase_ids')[book.argmax()] == \
+        portfolio.tracker.best().get_purchaseID() == 'a'
@@ -0,0 +1,122 @@
+##########################################################################
+# Author: David Beltran
+# File: test_query_cache.py
+# Date: August 19, 2022
+# This module holds the tests of the QueryCache class and of the cached
+# Portfolio reads.
+##########################################################################
+
+# Standard libary imports
+import numpy as np
+
+# Application author designed module imports
+from database import Database
+from investor import Investor
+from portfolio import Portfolio
+from query_cache import QueryCache, estimate_size
+from schema import migrate
+
+# Stock row of investor 1, as stored in the stocks table
+ROW = ('1-1', '1', 'AIG', 10.0, 50.0, 60.0, '2020-01-01')
+
+# Function that counts its calls and returns the count
+class Counter:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+# Returns a migrated db holding ROW
+def _with_row(db):
+    migrate(db)
+    with db.transaction() as c:
+        c.execute("INSERT INTO stocks VALUES (?, ?, ?, ?, ?, ?, ?)", ROW)
+    return db
+
+# Repeated reads are served from the cache until their tables change
+def test_hit_until_invalidated(db):
+    migrate(db)
+    cache, compute = QueryCache(db), Counter()
+    assert cache.get('q', (1,), ['stocks'], compute) == 1
+    assert cache.get('q', (1,), ['stocks'], compute) == 1
+    with db.transaction() as c:
+        cache.invalidate(c, ['bonds'])
+    assert cache.get('q', (1,), ['stocks'], compute) == 1
+    with db.transaction() as c:
+        cache.invalidate(c, ['stocks'])
+    assert cache.get('q', (1,), ['stocks'], compute) == 2
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 2
+
+# Writes made through another connection invalidate as well
+def test_other_connection_invalidates(db, tmp_path):
+    migrate(db)
+    cache, compute = QueryCache(db), Counter()
+    cache.get('q', (), ['stocks'], compute)
+    other = Database(tmp_path / 'stocks.db')
+    portfolio = Portfolio(Investor(1, 'Test'), other)
+    with other.transaction() as c:
+        c.execute("INSERT INTO stocks VALUES (?, ?, ?, ?, ?, ?, ?)", ROW)
+    portfolio.delete_stocks()
+    other.close()
+    assert cache.get('q', (), ['stocks'], compute) == 2
+
+# Cached Portfolio reads see the Portfolio's own writes
+def test_portfolio_reads_follow_writes(db):
+    portfolio = Portfolio(Investor(1, 'Test'), _with_row(db))
+    portfolio.create_db_stocks()
+    assert [stock.get_symbol() for stock in portfolio.db_stocks] == ['AIG']
+    assert portfolio.position_summary()['count'] == 1
+    portfolio.delete_stocks()
+    portfolio.db_stocks = []
+    portfolio.create_db_stocks()
+    assert portfolio.db_stocks == []
+    assert portfolio.position_summary()['count'] == 0
+
+# Portfolios sharing a Database, each with its own cache, see each
+# other's writes made on the same connection
+def test_portfolios_sharing_a_database(db):
+    first = Portfolio(Investor(1, 'Test'), _with_row(db))
+    second = Portfolio(Investor(1, 'Test'), db)
+    assert first.position_summary()['count'] == 1
+    assert second.position_summary()['count'] == 1
+    second.delete_stocks()
+    assert first.position_summary()['count'] == 0
+
+# The least recently used results are evicted past max_entries
+def test_lru_eviction(db):
+    migrate(db)
+    cache = QueryCache(db, max_entries = 2)
+    for key in (1, 2, 1, 3):
+        cache.get('q', (key,), ['stocks'], lambda: key)
+    assert len(cache) == 2
+    compute = Counter()
+    cache.get('q', (1,), ['stocks'], compute)
+    cache.get('q', (3,), ['stocks'], compute)
+    assert compute.calls == 0
+    cache.get('q', (2,), ['stocks'], compute)
+    assert compute.calls == 1
+
+# Results bigger than max_bytes are returned but not kept
+def test_large_results_not_kept(db):
+    migrate(db)
+    cache = QueryCache(db, max_bytes = 1000)
+    assert len(cache.get('q', (), ['stocks'], lambda: np.zeros(1000))) == \
+        1000
+    assert len(cache) == 0
+    assert estimate_size(np.zeros(1000)) == 8000
+    assert estimate_size([(1.0, 'a')] * 100) > 100 * 24
+
+# Persistent results are reused by a new cache until their tables change
+def test_persistent_results(db):
+    migrate(db)
+    QueryCache(db, persistent = True).get('q', (), ['stocks'], lambda: 'x')
+    cache = QueryCache(db, persistent = True)
+    assert cache.get('q', (), ['stocks'], lambda: 'y') == 'x'
+    assert cache.stats()['loads'] == 1
+    with db.transaction() as c:
+        cache.invalidate(c, ['stocks'])
+    assert QueryCache(db, persistent = True).get('q', (), ['stocks'],
+        lambda: 'y') == 'y'
@@ -0,0 +1,63 @@
+##########################################################################
+# Author: David Beltran
+# File: test_schema.py
+# Date: August 19, 2022
+# This module holds the tests of the schema migrations and the trend
+# upsert helpers.
+##########################################################################
+
+# Application author designed module imports
+from schema import MIGRATIONS, migrate, get_version, upsert_trend_rows
+from schema import advance_trend_marks
+
+# Creates the tables of the original script, with text prices and
+# trend dates as written in the JSON files, including a duplicate row
+def _create_legacy_tables(db):
+    with db.transaction() as c:
+        c.execute("""CREATE TABLE stocks_trends (symbol text,
+            price_date text, open_price text, high_price text,
+            low_price text, close_price real, volume real)""")
+        c.executemany("INSERT INTO stocks_trends VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [('AIG', '4-Aug-17', '65.3', '65.95', '-', 65.55, 4270500),
+            ('AIG', '4-Aug-17', '65.3', '65.95', '-', 65.55, 4270500),
+            ('F', '3-Aug-17', '11.2', '11.3', '11.1', 11.25, 100)])
+
+# A fresh database is migrated to the latest version and migrating it
+# again changes nothing
+def test_migrate_fresh_database(db):
+    assert get_version(db) == 0
+    assert migrate(db) == len(MIGRATIONS)
+    assert migrate(db) == len(MIGRATIONS)
+    tables = {row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'stocks', 'bonds', 'stocks_trends', 'stocks_trends_marks',
+        'purchase_ids', 'table_versions', 'ingested_files'} <= tables
+
+# Legacy trend rows are deduplicated and typed with ISO dates
+def test_migrate_legacy_trends(db):
+    _create_legacy_tables(db)
+    migrate(db)
+    rows = db.execute("""SELECT symbol, price_date, open_price, low_price,
+        typeof(high_price) FROM stocks_trends ORDER BY symbol""").fetchall()
+    assert rows == [('AIG', '2017-08-04', 65.3, None, 'real'),
+        ('F', '2017-08-03', 11.2, 11.1, 'real')]
+
+# Upserting a trend row again replaces it instead of adding a row
+def test_upsert_trend_rows(db):
+    migrate(db)
+    with db.transaction() as c:
+        upsert_trend_rows(c, [('AIG', '2017-08-04', 1.0, 2.0, 0.5, 1.5, 10),
+            ('AIG', '2017-08-03', 1.0, 2.0, 0.5, 1.4, 10)])
+        upsert_trend_rows(c, [('AIG', '2017-08-04', 1.0, 2.0, 0.5, 1.6, 20)])
+    assert db.execute("""SELECT price_date, close_price, volume
+        FROM stocks_trends ORDER BY price_date""").fetchall() == \
+        [('2017-08-03', 1.4, 10), ('2017-08-04', 1.6, 20)]
+
+# High-water marks only move forward
+def test_advance_trend_marks(db):
+    migrate(db)
+    with db.transaction() as c:
+        advance_trend_marks(c, {'AIG': '2017-08-04', 'F': '2017-08-01'})
+        advance_trend_marks(c, {'AIG': '2017-08-01', 'F': '2017-08-03'})
+    assert dict(db.execute("SELECT * FROM stocks_trends_marks")) == \
+        {'AIG': '2017-08-04', 'F': '2017-08-03'}
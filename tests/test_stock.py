@@ -0,0 +1,42 @@
+##########################################################################
+# Author: David Beltran
+# File: test_stock.py
+# Date: August 19, 2022
+# This module holds the tests of the derived values of the Stock class.
+##########################################################################
+
+# Standard libary imports
+from datetime import date
+import pytest
+
+# Application author designed module imports
+import stock
+from stock import Stock, YEAR
+
+# Stand-in for datetime.date whose today() can be moved
+class FakeDate(date):
+    current = date(2021, 1, 1)
+
+    @classmethod
+    def today(cls):
+        return cls.current
+
+# Derived values can be read as attributes right after construction
+def test_derived_attributes_exist():
+    position = Stock('1', 'aig', 10, 100.0, 110.0, date(2020, 1, 1),
+        date(2021, 1, 1))
+    assert position.earn_loss == pytest.approx(100.0)
+    assert position.price_change == pytest.approx(10.0)
+    assert position.yearly_value == pytest.approx(10.0 / (366 / YEAR))
+
+# Without a valuation date, yearly values follow the current date
+def test_yearly_value_follows_today(monkeypatch):
+    monkeypatch.setattr(stock, 'date', FakeDate)
+    monkeypatch.setattr(FakeDate, 'current', date(2021, 1, 1))
+    position = Stock('1', 'aig', 10, 100.0, 110.0, date(2020, 1, 1))
+    first = position.get_yearly_value()
+    assert first == pytest.approx(10.0 / (366 / YEAR))
+    monkeypatch.setattr(FakeDate, 'current', date(2022, 1, 1))
+    assert position.get_yearly_value() == pytest.approx(10.0 / (731 / YEAR))
+    position.set_valuation_date(date(2021, 1, 1))
+    assert position.get_yearly_value() == pytest.approx(first)
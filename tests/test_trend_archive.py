@@ -0,0 +1,93 @@
+##########################################################################
+# Author: David Beltran
+# File: test_trend_archive.py
+# Date: August 19, 2022
+# This module holds the tests of the compressed trend archive format.
+##########################################################################
+
+# Standard libary imports
+import json
+import numpy as np
+import pytest
+
+# Application author designed module imports
+from investor import Investor
+from portfolio import Portfolio
+from trend_archive import TrendArchive, json_to_archive, archive_to_json
+from trend_archive import merge_trend_columns
+
+# Trend records laid out like data/AllStocks.json, newest first, with a
+# missing open and a missing close
+RECORDS = [
+    {'Symbol': 'AIG', 'Date': '4-Aug-17', 'Open': '66.17', 'High': '66.23',
+        'Low': '64.79', 'Close': 65.08, 'Volume': 5074352},
+    {'Symbol': 'AIG', 'Date': '3-Aug-17', 'Open': '-', 'High': '67.3',
+        'Low': '65.1', 'Close': 66.06, 'Volume': 8492625},
+    {'Symbol': 'AIG', 'Date': '2-Aug-17', 'Open': '65.29', 'High': '65.94',
+        'Low': '65.1', 'Close': None, 'Volume': 0},
+    {'Symbol': 'F', 'Date': '4-Aug-17', 'Open': '11.21', 'High': '11.3',
+        'Low': '11.15', 'Close': 11.25, 'Volume': 21000000},
+    {'Symbol': 'F', 'Date': '31-Jul-17', 'Open': '11.1', 'High': '11.2',
+        'Low': '11.05', 'Close': 11.2, 'Volume': 18000000},
+]
+
+# Rejects the NaN and Infinity constants json accepts by default
+def _strict_constant(name):
+    raise ValueError(f"{name} is not valid JSON")
+
+# Writes RECORDS to a JSON file and packs it with two rows per block
+@pytest.fixture
+def archive_path(tmp_path):
+    source = tmp_path / 'trends.json'
+    source.write_text(json.dumps(RECORDS))
+    path = tmp_path / 'trends.stka'
+    assert json_to_archive(source, path, block_rows = 2) == len(RECORDS)
+    return path
+
+# Unpacking an archive gives back the records of the JSON file, with
+# missing closes written as null
+def test_round_trip(archive_path, tmp_path):
+    target = tmp_path / 'unpacked.json'
+    assert archive_to_json(archive_path, target) == len(RECORDS)
+    records = json.loads(target.read_text(),
+        parse_constant = _strict_constant)
+    assert records == RECORDS
+
+# Date ranges only return the rows inside them
+def test_read_date_range(archive_path):
+    with TrendArchive(archive_path) as archive:
+        assert archive.symbols() == ['AIG', 'F']
+        columns = archive.read('AIG', '2017-08-03', '2017-08-04')
+        assert columns['Dates'].astype(str).tolist() == ['2017-08-03',
+            '2017-08-04']
+        assert np.isnan(columns['Opens'][0])
+        assert archive.describe('F') == {'rows': 2, 'first': '2017-07-31',
+            'last': '2017-08-04'}
+
+# Merging replaces rows of the same date and fills missing columns
+def test_merge_trend_columns():
+    old = {'Dates': np.array(['2017-08-04', '2017-08-01'],
+        dtype = 'datetime64[D]'), 'Closes': np.array([1.0, 2.0])}
+    new = {name: np.array([3.0, 4.0]) for name in ('Opens', 'Highs',
+        'Lows', 'Closes', 'Volumes')}
+    new['Dates'] = np.array(['2017-08-02', '2017-08-04'],
+        dtype = 'datetime64[D]')
+    merged = merge_trend_columns(old, new)
+    assert merged['Dates'].astype(str).tolist() == ['2017-08-01',
+        '2017-08-02', '2017-08-04']
+    assert merged['Closes'].tolist() == [2.0, 3.0, 4.0]
+    assert np.isnan(merged['Opens'][0])
+
+# An archive loaded after trends read from the database is merged into
+# them without duplicate dates
+def test_archive_after_database_trends(db, archive_path):
+    portfolio = Portfolio(Investor(1, 'Test'), db)
+    portfolio.create_tables()
+    portfolio.fill_stock_trends_table(str(archive_path))
+    portfolio.trends = {}
+    portfolio.load_trends_from_db(['AIG', 'F'])
+    assert portfolio.fill_stock_trends_table(str(archive_path)) == 0
+    dates = portfolio.trends['AIG']['Dates']
+    assert len(dates) == len(set(dates.tolist())) == 3
+    assert db.execute("SELECT count(*) FROM stocks_trends").fetchone() == \
+        (len(RECORDS),)
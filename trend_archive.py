@@ -0,0 +1,311 @@
+##########################################################################
+# Author: David Beltran
+# File: trend_archive.py
+# Date: August 19, 2022
+# This module holds the compact archive format for trend history. Each
+# symbol is stored in blocks of rows sorted by date. Dates are delta
+# encoded days, prices are delta encoded integers scaled by the archive's
+# price scale, and each block is byte shuffled and compressed with a
+# standard library codec. A block index at the end of the file allows
+# reading one symbol or date range without decompressing the rest.
+#
+# Layout: header (magic, version, codec, price scale), blocks, index
+# (compressed JSON), footer (index offset and length, magic).
+##########################################################################
+
+# Standard libary imports
+import bz2
+import json
+import lzma
+import struct
+import zlib
+from datetime import datetime
+import numpy as np
+
+# Application author designed module imports
+from json_stream import iter_json_array
+from schema import TREND_DATE_FORMAT, trend_price
+from trend_cache import COLUMNS
+
+# File signature, format version and the structs of the header and footer
+MAGIC = b'STKA'
+VERSION = 1
+HEADER = struct.Struct('<4sHHI')
+FOOTER = struct.Struct('<QI4s')
+
+# Suffix used for archive files
+SUFFIX = '.stka'
+
+# Codecs by name and by the number stored in the header
+CODECS = {'zlib': (1, lambda data: zlib.compress(data, 9), zlib.decompress),
+    'bz2': (2, bz2.compress, bz2.decompress),
+    'lzma': (3, lzma.compress, lzma.decompress)}
+CODEC_NAMES = {number: name for name, (number, _, _) in CODECS.items()}
+
+# Default price scale, keeping four decimal places, and rows per block
+PRICE_SCALE = 10000
+BLOCK_ROWS = 4096
+
+# Price columns that may hold missing values
+PRICE_COLUMNS = ('Opens', 'Highs', 'Lows', 'Closes')
+
+# Returns True if the file at path starts with the archive signature
+def is_archive(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+# Private helper that delta encodes an integer array. The first value is
+# kept as is.
+def _delta(values):
+    return np.diff(values, prepend = values[:0].dtype.type(0))
+
+# Private helper that groups the bytes of an array by significance, so
+# the mostly zero high bytes of small deltas compress together
+def _shuffle(values):
+    return np.ascontiguousarray(
+        values.view(np.uint8).reshape(-1, values.itemsize).T).tobytes()
+
+# Private helper that reverses _shuffle
+def _unshuffle(data, dtype, count):
+    itemsize = np.dtype(dtype).itemsize
+    raw = np.frombuffer(data, dtype = np.uint8, count = count * itemsize)
+    return np.ascontiguousarray(raw.reshape(itemsize, count).T).view(
+        dtype).ravel()
+
+# Private function that encodes one block of sorted rows as bytes
+def _encode_block(dates, columns, scale):
+    parts = [_shuffle(_delta(dates.astype(np.int64)).astype(np.int32))]
+    for name in PRICE_COLUMNS:
+        values = columns[name]
+        missing = np.isnan(values)
+        if missing.any():
+            # Missing prices repeat the last price so their delta is zero
+            last = np.where(missing, 0, np.arange(len(values)))
+            np.maximum.accumulate(last, out = last)
+            values = np.nan_to_num(values[last])
+        parts.append(np.packbits(missing).tobytes())
+        parts.append(_shuffle(_delta(np.rint(values * scale).astype(
+            np.int64))))
+    parts.append(_shuffle(_delta(np.rint(np.nan_to_num(
+        columns['Volumes'])).astype(np.int64))))
+    return b''.join(parts)
+
+# Private function that decodes a block into a dictionary of columns
+def _decode_block(data, rows, scale):
+    position = 0
+
+    def take(dtype):
+        nonlocal position
+        size = np.dtype(dtype).itemsize * rows
+        values = np.cumsum(_unshuffle(data[position:position + size], dtype,
+            rows), dtype = np.int64)
+        position += size
+        return values
+
+    columns = {'Dates': take(np.int32).astype('datetime64[D]')}
+    mask_size = (rows + 7) // 8
+    for name in PRICE_COLUMNS:
+        missing = np.unpackbits(np.frombuffer(data, dtype = np.uint8,
+            count = mask_size, offset = position), count = rows).astype(bool)
+        position += mask_size
+        values = take(np.int64) / scale
+        values[missing] = np.nan
+        columns[name] = values
+    columns['Volumes'] = take(np.int64).astype(np.float64)
+    return columns
+
+# Writes trend series to an archive at path. Trends is a dictionary of
+# symbol to columns named like trend_cache.COLUMNS, in any date order.
+# Symbols keep the order of the dictionary. Returns the number of rows.
+def write_archive(path, trends, codec = 'zlib', scale = PRICE_SCALE,
+        block_rows = BLOCK_ROWS):
+    number, compress, _ = CODECS[codec]
+    index, total = [], 0
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, number, scale))
+        for symbol, series in trends.items():
+            dates = np.asarray(series['Dates']).astype('datetime64[D]')
+            order = np.argsort(dates, kind = 'stable')
+            dates = dates[order]
+            columns = {name: np.asarray(series[name],
+                dtype = np.float64)[order] for name in COLUMNS[1:]}
+            blocks = []
+            for start in range(0, len(dates), block_rows):
+                stop = start + block_rows
+                data = compress(_encode_block(dates[start:stop],
+                    {name: values[start:stop]
+                    for name, values in columns.items()}, scale))
+                blocks.append([str(dates[start]), str(dates[:stop][-1]),
+                    len(dates[start:stop]), f.tell(), len(data)])
+                f.write(data)
+            index.append([symbol, blocks])
+            total += len(dates)
+        data = zlib.compress(json.dumps({'rows': total,
+            'symbols': index}).encode())
+        offset = f.tell()
+        f.write(data)
+        f.write(FOOTER.pack(offset, len(data), MAGIC))
+    return total
+
+# Returns the columns of a symbol, given as sequences such as lists of
+# dates and prices, as arrays sorted by date. Missing prices are NaN.
+def trend_columns(series):
+    dates = np.array(series['Dates'], dtype = 'datetime64[D]')
+    order = np.argsort(dates, kind = 'stable')
+    columns = {'Dates': dates[order]}
+    for name in COLUMNS[1:]:
+        columns[name] = np.array(series[name], dtype = np.float64)[order]
+    return columns
+
+# Merges the columns new of a symbol into its columns old by date. Rows
+# of new replace rows of old with the same date, and columns old lacks
+# are NaN for its rows. Returns the columns sorted by date.
+def merge_trend_columns(old, new):
+    old_dates = np.asarray(old['Dates']).astype('datetime64[D]')
+    keep = ~np.isin(old_dates, new['Dates'])
+    dates = np.concatenate((old_dates[keep], new['Dates']))
+    order = np.argsort(dates, kind = 'stable')
+    merged = {'Dates': dates[order]}
+    for name in COLUMNS[1:]:
+        previous = (np.asarray(old[name], dtype = np.float64)[keep]
+            if name in old else np.full(int(keep.sum()), np.nan))
+        merged[name] = np.concatenate((previous, new[name]))[order]
+    return merged
+
+class TrendArchive:
+
+    # Class constructor. Reads the header and block index of the archive.
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'rb')
+        magic, version, number, self.scale = HEADER.unpack(
+            self.f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            self.f.close()
+            raise ValueError(f"{path} is not a version {VERSION} "
+                + "trend archive")
+        self.codec = CODEC_NAMES[number]
+        self.f.seek(-FOOTER.size, 2)
+        offset, length, magic = FOOTER.unpack(self.f.read(FOOTER.size))
+        self.f.seek(offset)
+        index = json.loads(zlib.decompress(self.f.read(length)))
+        self.rows = index['rows']
+        self.index = {symbol: blocks for symbol, blocks in index['symbols']}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.f.close()
+
+    # Returns the symbols in the order they were written
+    def symbols(self):
+        return list(self.index)
+
+    # Returns the number of rows and the first and last date of a symbol
+    def describe(self, symbol):
+        blocks = self.index[symbol]
+        return {'rows': sum(block[2] for block in blocks),
+            'first': blocks[0][0] if blocks else None,
+            'last': blocks[-1][1] if blocks else None}
+
+    # Returns the columns of one symbol, sorted by date and limited to the
+    # ISO dates start and end, both inclusive. Only the blocks that
+    # overlap the range are read.
+    def read(self, symbol, start = None, end = None):
+        decompress = CODECS[self.codec][2]
+        start = str(start) if start else None
+        end = str(end) if end else None
+        parts = []
+        for first, last, rows, offset, length in self.index[symbol]:
+            if (start and last < start) or (end and first > end):
+                continue
+            self.f.seek(offset)
+            parts.append(_decode_block(decompress(self.f.read(length)),
+                rows, self.scale))
+        if not parts:
+            return {name: np.array([], dtype = 'datetime64[D]'
+                if name == 'Dates' else np.float64) for name in COLUMNS}
+        columns = {name: np.concatenate([part[name] for part in parts])
+            for name in COLUMNS}
+        dates = columns['Dates']
+        keep = slice(
+            np.searchsorted(dates, np.datetime64(start, 'D')) if start else 0,
+            np.searchsorted(dates, np.datetime64(end, 'D'), side = 'right')
+            if end else len(dates))
+        return {name: values[keep] for name, values in columns.items()}
+
+    # Yields (symbol, columns) for every symbol, or for the given symbols,
+    # limited to a date range
+    def items(self, symbols = None, start = None, end = None):
+        for symbol in symbols if symbols is not None else self.index:
+            yield symbol, self.read(symbol, start, end)
+
+# Converts a JSON trend file to an archive. Records are streamed and
+# collected per symbol. Returns the number of rows written.
+def json_to_archive(json_path, archive_path, codec = 'zlib',
+        scale = PRICE_SCALE, block_rows = BLOCK_ROWS):
+    trends = {}
+    with open(json_path, encoding = 'utf-8') as f:
+        for trend in iter_json_array(f):
+            series = trends.get(trend['Symbol'])
+            if series is None:
+                series = trends[trend['Symbol']] = {name: []
+                    for name in COLUMNS}
+            series['Dates'].append(datetime.strptime(trend['Date'],
+                TREND_DATE_FORMAT).date())
+            series['Opens'].append(trend_price(trend['Open']))
+            series['Highs'].append(trend_price(trend['High']))
+            series['Lows'].append(trend_price(trend['Low']))
+            series['Closes'].append(trend_price(trend['Close']))
+            series['Volumes'].append(trend['Volume'])
+    for series in trends.values():
+        for name in COLUMNS[1:]:
+            series[name] = np.array(series[name], dtype = np.float64)
+    return write_archive(archive_path, trends, codec, scale, block_rows)
+
+# Private helper that formats a price like the JSON trend files: text
+# without trailing zeros, or '-' if missing
+def _price_text(value, decimals):
+    if value != value:
+        return '-'
+    return f"{value:.{decimals}f}".rstrip('0').rstrip('.')
+
+# Private helper that returns a JSON number, as an int when it is whole,
+# or None, written as null, if missing
+def _number(value, decimals):
+    if value != value:
+        return None
+    value = round(float(value), decimals)
+    return int(value) if value.is_integer() else value
+
+# Converts an archive back to a JSON trend file laid out like
+# data/AllStocks.json, newest record first for each symbol. Missing
+# open, high and low prices are written as '-' and missing closes as
+# null. Returns the number of records written.
+def archive_to_json(archive_path, json_path):
+    written = 0
+    with TrendArchive(archive_path) as archive, \
+            open(json_path, 'w', encoding = 'utf-8') as f:
+        decimals = len(str(archive.scale)) - 1
+        f.write("[\n")
+        for symbol, columns in archive.items():
+            for i in range(len(columns['Dates']) - 1, -1, -1):
+                when = columns['Dates'][i].astype(object)
+                record = {'Symbol': symbol,
+                    'Date': f"{when.day}-{when.strftime('%b-%y')}",
+                    'Open': _price_text(columns['Opens'][i], decimals),
+                    'High': _price_text(columns['Highs'][i], decimals),
+                    'Low': _price_text(columns['Lows'][i], decimals),
+                    'Close': _number(columns['Closes'][i], decimals),
+                    'Volume': int(columns['Volumes'][i])}
+                f.write((",\n " if written else " ") + json.dumps(record))
+                written += 1
+        f.write("\n]\n")
+    return written
@@ -0,0 +1,125 @@
+##########################################################################
+# Author: David Beltran
+# File: trend_cache.py
+# Date: August 19, 2022
+# This module holds the TrendCache class. Used to keep the trend data of
+# a JSON file as columnar NumPy arrays on disk so later runs can memory
+# map them instead of parsing the JSON file again.
+##########################################################################
+
+# Standard libary imports
+import hashlib
+import json
+import os
+import numpy as np
+
+# Global variable with the default cache directory
+CACHE_DIR = '.trend_cache'
+
+# Columns stored in the cache. Dates are datetime64 days, the rest float64.
+COLUMNS = ('Dates', 'Opens', 'Highs', 'Lows', 'Closes', 'Volumes')
+
+# Returns the SHA-256 digest of a file, read in 1 MB chunks
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class TrendCache:
+
+    # Class constructor
+    def __init__(self, directory = CACHE_DIR):
+        self.directory = directory
+
+    # Private method that returns the cache folder of a source file
+    def __entry_dir(self, source):
+        key = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()
+        return os.path.join(self.directory, key[:16])
+
+    # Private method that reads the manifest of a source file's entry
+    def __read_manifest(self, entry):
+        try:
+            with open(os.path.join(entry, 'manifest.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Private method that writes a manifest through a temporary file so
+    # readers never see a partial one
+    def __write_manifest(self, entry, manifest):
+        path = os.path.join(entry, 'manifest.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+    # Returns the manifest if the cache entry matches the source file.
+    # A matching mtime and size is trusted without hashing. Otherwise the
+    # file is hashed, and a touched but unchanged file keeps its entry.
+    def validate(self, source):
+        entry = self.__entry_dir(source)
+        manifest = self.__read_manifest(entry)
+        if manifest is None:
+            return None
+        stat = os.stat(source)
+        if (manifest['mtime_ns'] == stat.st_mtime_ns
+                and manifest['size'] == stat.st_size):
+            return manifest
+        if manifest['sha256'] != file_digest(source):
+            return None
+        manifest['mtime_ns'], manifest['size'] = stat.st_mtime_ns, stat.st_size
+        self.__write_manifest(entry, manifest)
+        return manifest
+
+    # Returns a dictionary of symbol to column arrays sliced from memory
+    # mapped files, or None if the cache is missing or stale
+    def load(self, source):
+        manifest = self.validate(source)
+        if manifest is None:
+            return None
+        entry = self.__entry_dir(source)
+        columns = {name: np.load(os.path.join(entry, name + '.npy'),
+            mmap_mode = 'r') for name in COLUMNS}
+        trends = {}
+        for symbol, (start, stop) in manifest['symbols'].items():
+            trends[symbol] = {name: columns[name][start:stop]
+                for name in COLUMNS}
+        return trends
+
+    # Writes the trend series of a source file to the cache. Series are
+    # given as a dictionary of symbol to column sequences and are stored
+    # sorted by date.
+    def write(self, source, trends):
+        entry = self.__entry_dir(source)
+        os.makedirs(entry, exist_ok = True)
+        stat = os.stat(source)
+        manifest = {'source': os.path.abspath(source),
+            'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+            'sha256': file_digest(source), 'symbols': {}}
+        parts = {name: [] for name in COLUMNS}
+        position = 0
+        for symbol in sorted(trends):
+            series = trends[symbol]
+            dates = np.array(series['Dates'], dtype = 'datetime64[D]')
+            order = np.argsort(dates, kind = 'stable')
+            parts['Dates'].append(dates[order])
+            for name in COLUMNS[1:]:
+                parts[name].append(np.array(series[name],
+                    dtype = np.float64)[order])
+            manifest['symbols'][symbol] = [position, position + len(dates)]
+            position += len(dates)
+        for name in COLUMNS:
+            dtype = 'datetime64[D]' if name == 'Dates' else np.float64
+            values = (np.concatenate(parts[name]) if parts[name]
+                else np.array([], dtype = dtype))
+            np.save(os.path.join(entry, name + '.npy'), values)
+        self.__write_manifest(entry, manifest)
+
+    # Removes the cache entry of a source file
+    def invalidate(self, source):
+        entry = self.__entry_dir(source)
+        try:
+            os.remove(os.path.join(entry, 'manifest.json'))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,120 @@
+##########################################################################
+# Author: David Beltran
+# File: valuation.py
+# Date: August 19, 2022
+# This module holds the PortfolioValuation class. Used to value a book of
+# lots over the history of their symbols' closes. Every symbol is aligned
+# on one shared date index with gaps filled by the last close, and each
+# lot only counts from its purchase date, so the value, cost and profit
+# and loss of the whole book are computed in one vectorized pass.
+##########################################################################
+
+# Standard libary imports
+import numpy as np
+
+# Returns the union of the trend dates of symbols as a sorted
+# datetime64[D] array, and a dates by symbols matrix of closes with each
+# gap filled by the last close before it. Dates before a symbol's first
+# close are NaN.
+def align_closes(trends, symbols):
+    series = []
+    for symbol in symbols:
+        dates = np.asarray(trends[symbol]['Dates']).astype('datetime64[D]')
+        closes = np.asarray(trends[symbol]['Closes'], dtype = np.float64)
+        order = np.argsort(dates, kind = 'stable')
+        series.append((dates[order], closes[order]))
+    dates = (np.unique(np.concatenate([s[0] for s in series])) if series
+        else np.array([], dtype = 'datetime64[D]'))
+    matrix = np.full((len(dates), len(series)), np.nan)
+    for j, (symbol_dates, closes) in enumerate(series):
+        matrix[np.searchsorted(dates, symbol_dates), j] = closes
+    return dates, forward_fill(matrix)
+
+# Returns a copy of matrix with each NaN replaced by the last value
+# above it in the same column
+def forward_fill(matrix):
+    rows = np.arange(len(matrix))[:, None]
+    last = np.where(np.isnan(matrix), 0, rows)
+    np.maximum.accumulate(last, axis = 0, out = last)
+    return matrix[last, np.arange(matrix.shape[1])]
+
+class PortfolioValuation:
+
+    # Class constructor. Lots are given as parallel sequences of symbol,
+    # quantity, purchase price and purchase date. Lots of symbols without
+    # trend data are left out and their symbols kept in self.skipped.
+    def __init__(self, trends, symbols, quantities, purchase_prices,
+            purchase_dates):
+        lot_symbols = np.asarray(symbols, dtype = object)
+        priced = np.array([symbol in trends for symbol in lot_symbols],
+            dtype = bool)
+        self.skipped = sorted(set(lot_symbols[~priced]))
+        self.symbols, lot_index = np.unique(lot_symbols[priced].astype(str),
+            return_inverse = True)
+        self.dates, self.closes = align_closes(trends, self.symbols)
+
+        # Quantities and costs are added on each lot's purchase date and
+        # summed down the date index to give the holdings on every date.
+        # Lots bought after the last date fall in the extra row.
+        quantities = np.asarray(quantities, dtype = np.float64)[priced]
+        costs = quantities * np.asarray(purchase_prices,
+            dtype = np.float64)[priced]
+        starts = np.searchsorted(self.dates, np.asarray(purchase_dates,
+            dtype = 'datetime64[D]')[priced])
+        shape = (len(self.dates) + 1, len(self.symbols))
+        self.holdings, self.costs = np.zeros(shape), np.zeros(shape)
+        np.add.at(self.holdings, (starts, lot_index), quantities)
+        np.add.at(self.costs, (starts, lot_index), costs)
+        self.holdings = np.cumsum(self.holdings, axis = 0)[:-1]
+        self.costs = np.cumsum(self.costs, axis = 0)[:-1]
+
+        # Holdings without a close yet are valued at cost
+        self.values = np.where(np.isnan(self.closes), self.costs,
+            self.holdings * np.nan_to_num(self.closes))
+        self.value = self.values.sum(axis = 1)
+        self.cost = self.costs.sum(axis = 1)
+        self.pnl = self.value - self.cost
+
+    # Builds a valuation from the rows of a PositionBook. Bonds are left
+    # out unless include_bonds is True.
+    @classmethod
+    def from_book(cls, book, trends, include_bonds = False):
+        rows = (np.ones(len(book), dtype = bool) if include_bonds
+            else ~book.column('is_bond'))
+        return cls(trends, book.column('symbols')[rows],
+            book.column('quantity')[rows],
+            book.column('purchase_price')[rows],
+            book.column('purchase_date')[rows])
+
+    # Returns the row of the last date on or before when, or -1 if when
+    # is before the first date
+    def index_as_of(self, when):
+        return int(np.searchsorted(self.dates, np.datetime64(when, 'D'),
+            side = 'right')) - 1
+
+    # Returns the value, cost and profit and loss of the book at the
+    # close of the last date on or before when
+    def as_of(self, when):
+        i = self.index_as_of(when)
+        if i < 0:
+            return {'date': None, 'value': 0.0, 'cost': 0.0, 'pnl': 0.0}
+        return {'date': self.dates[i].item(), 'value': float(self.value[i]),
+            'cost': float(self.cost[i]), 'pnl': float(self.pnl[i])}
+
+    # Returns the value of each symbol's holdings as of when, largest
+    # first
+    def holdings_as_of(self, when):
+        i = self.index_as_of(when)
+        if i < 0:
+            return []
+        order = np.argsort(-self.values[i], kind = 'stable')
+        return [(str(self.symbols[j]), float(self.holdings[i, j]),
+            float(self.values[i, j])) for j in order
+            if self.holdings[i, j]]
+
+    # Returns the value series of one symbol's holdings
+    def symbol_values(self, symbol):
+        j = int(np.searchsorted(self.symbols, symbol))
+        if j == len(self.symbols) or self.symbols[j] != symbol:
+            raise KeyError(symbol)
+        return self.values[:, j]